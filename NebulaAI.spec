@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['httpx', 'google.genai', 'google.genai.errors'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
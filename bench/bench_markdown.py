@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do render_markdown com mensagens sintéticas grandes.
+
+    python bench/bench_markdown.py
+    python bench/bench_markdown.py --sizes 10 100 1000 --repeat 7 --max-ms 250
+
+Mede o render "frio" (sem cache) e o "quente" (acerto no cache por hash)
+para cada tamanho, em KB. Com --max-ms, sai com código 1 se o render frio
+de qualquer tamanho passar do limite por 100 KB — útil para pegar
+regressões.
+"""
+import argparse, os, random, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nebula_gemini as ng  # noqa: E402
+
+BLOCKS = [
+    "## Seção {n}\n",
+    "Parágrafo com **negrito**, *itálico*, `código` e um [link](https://example.com/{n}).\n",
+    "Texto corrido sem marcação nenhuma, só para encher a linha com conteúdo {n}.\n",
+    "- item {n}\n- outro item com `x < y`\n- último **item**\n",
+    "1. primeiro\n2. segundo\n3. terceiro\n",
+    "```python\nfor i in range({n}):\n    print(i * 2)  # <comentário>\n```\n",
+    "\n",
+]
+
+def synthetic(kb: int, seed: int = 0) -> str:
+    rnd, parts, size, n = random.Random(seed), [], 0, 0
+    while size < kb * 1024:
+        block = rnd.choice(BLOCKS).format(n=n)
+        parts.append(block)
+        size += len(block)
+        n += 1
+    return "".join(parts)
+
+def timed(fn, text: str, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        runs.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(runs)
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000], help="tamanhos em KB")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--max-ms", type=float, default=None, help="limite do render frio por 100 KB")
+    args = ap.parse_args()
+
+    print(f"{'KB':>6} {'frio ms':>10} {'MB/s':>8} {'cache ms':>10}")
+    failed = False
+    for kb in args.sizes:
+        text = synthetic(kb)
+        cold = timed(ng._render_markdown, text, args.repeat)
+        ng.render_markdown(text)
+        warm = timed(ng.render_markdown, text, args.repeat)
+        mbps = (len(text) / 1e6) / (cold / 1000) if cold else float("inf")
+        print(f"{kb:>6} {cold:>10.2f} {mbps:>8.1f} {warm:>10.3f}")
+        if args.max_ms is not None and cold / max(kb / 100, 1e-9) > args.max_ms:
+            failed = True
+    if failed:
+        print(f"FALHOU: render frio acima de {args.max_ms} ms por 100 KB")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
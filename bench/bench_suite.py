@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Suíte de benchmarks offline: provedor simulado, persistência, render e startup.
+
+    python bench/bench_suite.py
+    python bench/bench_suite.py --only ttft stalls --requests 20
+    python bench/bench_suite.py --only startup --chats 10 1000 10000 100000
+    python bench/bench_suite.py --json resultados.json
+
+Roda sem rede e sem tela (QT_QPA_PLATFORM=offscreen), num HOME temporário,
+então não toca nos chats nem na config reais. Seções:
+
+  ttft      tempo até o primeiro token pelo GeminiWorker contra o mock,
+            com e sem stream, e N requisições concorrentes
+  fanout    TTFT de um modelo só contra o fan-out "first-wins" em 2..N
+            modelos, com latência de cauda longa no mock
+  stalls    travadas do event loop do Qt enquanto uma resposta chega em
+            stream e ao abrir um chat grande
+  store     append, load e listagem do ChatStore, e a memória de um chat
+            aberto em `Message` contra os dicts do formato de disco
+  archive   camada fria: bytes economizados ao arquivar chats antigos e
+            custo de abrir um chat arquivado contra o mesmo em JSONL
+  search    busca global: indexação, append com índice e latência das
+            consultas (pior caso: todo termo em quase toda mensagem)
+  markdown  render_markdown frio e com cache
+  startup   até a primeira pintura da janela com N chats no disco, com e
+            sem o índice (um processo novo por medição)
+"""
+import argparse, json, os, random, statistics, subprocess, sys, tempfile, time, tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Antes de importar o app: CHATS_DIR e CONFIG_PATH saem do HOME
+_HOME = os.environ.get("NEBULA_BENCH_HOME") or tempfile.mkdtemp(prefix="nebula-bench-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = _HOME
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path[:0] = [ROOT, HERE]
+
+_T_IMPORT = time.perf_counter()
+import nebula_gemini as ng  # noqa: E402
+_T_IMPORT = time.perf_counter() - _T_IMPORT
+
+from PyQt6.QtCore import QEvent, QEventLoop, QObject, QTimer  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+from bench_markdown import synthetic, timed  # noqa: E402
+from mock_openrouter import MockOpenRouter  # noqa: E402
+
+SECTIONS = ("ttft", "fanout", "stalls", "store", "archive", "search", "markdown", "startup")
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
+
+def spin(ms: int):
+    """Roda o event loop por `ms` sem fechar janelas (app.quit fecharia)."""
+    loop = QEventLoop()
+    QTimer.singleShot(ms, loop.quit)
+    loop.exec()
+
+def wait_until(cond, timeout: float = 30.0):
+    end = time.perf_counter() + timeout
+    while not cond() and time.perf_counter() < end:
+        spin(5)
+
+def bench_config(mock: MockOpenRouter, **extra) -> dict:
+    return {
+        "provider": "OpenRouter", "api_key": "bench", "model": "mock/model",
+        "openrouter_base": mock.url, "fallback_models": [],
+        "response_cache": False, "auto_title": "local", **extra,
+    }
+
+# â”€â”€ ttft â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def run_workers(cfg: dict, clients, n: int, stream: bool) -> list[dict]:
+    records, workers = [], []
+    history = [ng.Message("user", "benchmark")]
+    for _ in range(n):
+        w = ng.GeminiWorker(cfg, history, stream=stream, clients=clients)
+        w.measured.connect(records.append)
+        workers.append(w)
+        w.start()
+    wait_until(lambda: len(records) == n)
+    return records
+
+def bench_ttft(args) -> dict:
+    out = {}
+    with MockOpenRouter(latency=args.latency, rate=args.rate, tokens=args.tokens) as mock:
+        cfg, clients = bench_config(mock), ng.ProviderClients()
+        run_workers(cfg, clients, 1, True)    # aquece conexão e cliente HTTP
+        print(f"{'modo':<16} {'n':>4} {'TTFT p50':>10} {'TTFT p95':>10} {'total p50':>10} {'tok/s':>8}")
+        for label, stream, n, concurrent in (
+            ("stream", True, args.requests, False),
+            ("sem stream", False, args.requests, False),
+            (f"stream x{args.concurrency}", True, args.concurrency, True),
+        ):
+            if concurrent:
+                t0 = time.perf_counter()
+                recs = run_workers(cfg, clients, n, stream)
+                wall = (time.perf_counter() - t0) * 1000
+            else:
+                recs = [r for _ in range(n) for r in run_workers(cfg, clients, 1, stream)]
+                wall = None
+            ttft  = [r["ttft_ms"] for r in recs if r["ttft_ms"] is not None]
+            total = [r["total_ms"] for r in recs]
+            rate  = [r["tokens_per_s"] for r in recs if r["tokens_per_s"]]
+            row = {
+                "n": n, "ttft_p50_ms": pct(ttft, 50), "ttft_p95_ms": pct(ttft, 95),
+                "total_p50_ms": pct(total, 50),
+                "tokens_per_s": statistics.median(rate) if rate else None,
+                "errors": sum(r["status"] != "ok" for r in recs),
+            }
+            if wall is not None:
+                row["wall_ms"] = wall
+            out[label] = row
+            print(f"{label:<16} {n:>4} {row['ttft_p50_ms']:>10.1f} {row['ttft_p95_ms']:>10.1f}"
+                  f" {row['total_p50_ms']:>10.1f} {row['tokens_per_s'] or 0:>8.1f}"
+                  + (f"   parede {wall:.0f} ms" if wall is not None else ""))
+        clients.close()
+    return out
+
+# â”€â”€ fanout â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def bench_fanout(args) -> dict:
+    """Cada rodada espera o primeiro texto da sessão, como a janela faria."""
+    out = {}
+    history = [ng.Message("user", "benchmark")]
+    with MockOpenRouter(latency=args.latency, rate=args.rate, tokens=args.tokens,
+                        jitter=args.jitter) as mock:
+        clients = ng.ProviderClients()
+        run_workers(bench_config(mock), clients, 1, True)
+        print(f"{'modelos':<10} {'n':>4} {'TTFT p50':>10} {'TTFT p95':>10} {'TTFT max':>10} {'cancelados':>11}")
+        for k in args.fanout:
+            cfg = bench_config(mock, fanout="first-wins",
+                               fanout_models=[f"mock/model-{i}" for i in range(1, k)])
+            targets, ttft, cancelled = ng.fanout_targets(cfg), [], 0
+            for _ in range(args.requests):
+                session = ng.FanOutSession("bench", targets, "first-wins")
+                done, t0 = [], time.perf_counter()
+
+                def first(*_):
+                    if not done:
+                        done.append((time.perf_counter() - t0) * 1000)
+
+                session.chunk.connect(first)
+                session.finished.connect(first)
+                session.errored.connect(first)
+                session.start(cfg, history, clients, lambda _: None)
+                wait_until(lambda: done)
+                ttft.append(done[0])
+                cancelled += sum(c["status"] == "cancelled" for c in session.columns)
+                session.abort()
+                spin(20)
+            row = {
+                "n": len(ttft), "ttft_p50_ms": pct(ttft, 50), "ttft_p95_ms": pct(ttft, 95),
+                "ttft_max_ms": max(ttft), "cancelled": cancelled,
+            }
+            out[str(k)] = row
+            print(f"{k:<10} {row['n']:>4} {row['ttft_p50_ms']:>10.1f} {row['ttft_p95_ms']:>10.1f}"
+                  f" {row['ttft_max_ms']:>10.1f} {row['cancelled']:>11}")
+        clients.close()
+    return out
+
+# â”€â”€ stalls â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class FrameProbe(QObject):
+    """Timer de 1 frame; mede o atraso real entre disparos do event loop."""
+
+    def __init__(self, interval_ms: int = 16):
+        super().__init__()
+        self._interval = interval_ms
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._tick)
+        self.gaps: list[float] = []
+        self._last = 0.0
+
+    def start(self):
+        self.gaps.clear()
+        self._last = time.perf_counter()
+        self._timer.start()
+
+    def stop(self) -> list[float]:
+        self._timer.stop()
+        return list(self.gaps)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.gaps.append((now - self._last) * 1000)
+        self._last = now
+
+def summarize_gaps(gaps: list[float], stall_ms: float) -> dict:
+    return {
+        "frames": len(gaps), "p50_ms": pct(gaps, 50), "p99_ms": pct(gaps, 99),
+        "max_ms": max(gaps, default=0.0), "stalls": sum(g > stall_ms for g in gaps),
+    }
+
+def bench_stalls(args) -> dict:
+    out = {}
+    with MockOpenRouter(latency=args.latency, rate=args.stream_rate, tokens=args.stream_tokens) as mock:
+        win = ng.GeminiWindow(bench_config(mock))
+        win.show()
+        spin(200)
+        probe = FrameProbe()
+        print(f"{'cenário':<22} {'frames':>7} {'p50 ms':>8} {'p99 ms':>8} {'máx ms':>8} {'> ' + str(args.stall_ms) + ' ms':>8}")
+
+        def report(label: str, gaps: list[float]):
+            row = out[label] = summarize_gaps(gaps, args.stall_ms)
+            print(f"{label:<22} {row['frames']:>7} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+                  f" {row['max_ms']:>8.1f} {row['stalls']:>8}")
+
+        win.new_chat()
+        probe.start()
+        win.input_f.setText("Escreva um texto longo com markdown.")
+        win.send_msg()
+        wait_until(lambda: win.btn_send.isEnabled(), timeout=120)
+        report(f"stream {args.stream_tokens} tok", probe.stop())
+
+        # Chat grande já no disco: mede abrir e rolar até o topo
+        big = "Chat grande"
+        msgs = []
+        for i in range(args.big_chat // 2):
+            msgs.append({"role": "user", "parts": [{"text": f"pergunta {i}"}]})
+            msgs.append({"role": "model", "parts": [{"text": synthetic(2, seed=i)}]})
+        win._store.write(big, msgs)
+        probe.start()
+        t0 = time.perf_counter()
+        win.switch_chat(big)
+        switch_ms = (time.perf_counter() - t0) * 1000
+        spin(300)
+        bar = win.chat_area.verticalScrollBar()
+        for _ in range(20):
+            bar.setValue(bar.minimum())
+            spin(30)
+        report(f"abrir {args.big_chat} msgs", probe.stop())
+        out["switch_chat_ms"] = switch_ms
+        print(f"switch_chat: {switch_ms:.1f} ms")
+        win.close()
+    return out
+
+# â”€â”€ store â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def bench_store(args) -> dict:
+    root  = tempfile.mkdtemp(prefix="store-", dir=_HOME)
+    store = ng.ChatStore(root=root)
+    store.create("bench")
+    msg = {"role": "model", "parts": [{"text": synthetic(1)}]}
+
+    t0 = time.perf_counter()
+    for _ in range(args.appends):
+        store.append("bench", msg)
+    append_ms = (time.perf_counter() - t0) * 1000
+    store.close()
+
+    fresh = ng.ChatStore(root=root)
+    t0 = time.perf_counter()
+    history = fresh.load("bench")
+    load_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    fresh.entries()
+    entries_ms = (time.perf_counter() - t0) * 1000
+
+    # Memória por mensagem fora o texto: mensagens curtas deixam o overhead à vista
+    fresh.create("short")
+    for i in range(args.appends):
+        fresh.append("short", ng.Message("user" if i % 2 == 0 else "model", f"msg {i}").record())
+    text = sum(len(f"msg {i}") for i in range(args.appends))
+    per_msg = {}
+    for name, load in (("dict", fresh.load), ("message", lambda cid: ng.Conversation.load(fresh, cid))):
+        tracemalloc.start()
+        kept = load("short")
+        per_msg[name] = (tracemalloc.get_traced_memory()[0] - text) / len(kept)
+        tracemalloc.stop()
+        del kept
+    fresh.close()
+
+    out = {
+        "appends": args.appends, "append_us": append_ms * 1000 / args.appends,
+        "load_ms": load_ms, "loaded": len(history), "entries_ms": entries_ms,
+        "dict_bytes_per_msg": per_msg["dict"], "message_bytes_per_msg": per_msg["message"],
+    }
+    print(f"append: {out['append_us']:.1f} µs/msg ({args.appends} msgs de 1 KB)")
+    print(f"load:   {load_ms:.1f} ms para {len(history)} msgs")
+    print(f"entries: {entries_ms:.2f} ms")
+    print(f"memória: {per_msg['dict']:.0f} B/msg em dicts → {per_msg['message']:.0f} B/msg em Message"
+          f" (além do texto)")
+    return out
+
+# â”€â”€ archive â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def bench_archive(args) -> dict:
+    root  = tempfile.mkdtemp(prefix="archive-", dir=_HOME)
+    store = ng.ChatStore(root=root)
+    rng   = random.Random(7)
+    words = ("o a de que para com uma não em python função erro lista servidor docker porta "
+             "configurar sessão memória thread janela consulta índice arquivo teste código").split()
+    old   = time.time() - 2 * ng.ARCHIVE_DAYS * 86400
+    for c in range(args.archive_chats):
+        history = [
+            {"role": "user" if i % 2 == 0 else "model",
+             "parts": [{"text": synthetic(1) if i % 4 == 3 else " ".join(rng.choices(words, k=150))}]}
+            for i in range(40)
+        ]
+        store.write(f"chat {c}", history, old)
+    store.sync()
+    jsonl = sum(os.path.getsize(store.path(f"chat {c}")) for c in range(args.archive_chats))
+
+    def open_all(s) -> list[float]:
+        times = []
+        for c in rng.sample(range(args.archive_chats), min(50, args.archive_chats)):
+            t = time.perf_counter()
+            s.load(f"chat {c}")
+            times.append((time.perf_counter() - t) * 1000)
+        return times
+
+    hot = open_all(store)
+    t0 = time.perf_counter()
+    packed = store.archive_old(ng.ARCHIVE_DAYS)
+    pack_s = time.perf_counter() - t0
+    stats = store.archive_stats()
+    store.close()
+
+    fresh = ng.ChatStore(root=root)
+    cold  = open_all(fresh)
+    fresh.close()
+
+    out = {
+        "chats": packed, "codec": "zstd" if ng.zstd_module() else "zlib",
+        "jsonl_bytes": jsonl, "archive_bytes": stats["disk_bytes"],
+        "saved": 1 - stats["disk_bytes"] / jsonl, "pack_s": pack_s,
+        "open_jsonl_p50_ms": pct(hot, 50), "open_archived_p50_ms": pct(cold, 50),
+        "open_archived_max_ms": max(cold),
+    }
+    print(f"{packed} chats ({out['codec']}): {jsonl / 2**20:.1f} MB em JSONL → "
+          f"{stats['disk_bytes'] / 2**20:.1f} MB arquivados (−{out['saved']:.0%}) em {pack_s:.1f} s")
+    print(f"abrir: JSONL p50 {pct(hot, 50):.2f} ms · arquivado p50 {pct(cold, 50):.2f} ms"
+          f" (máx {max(cold):.2f} ms)")
+    return out
+
+# â”€â”€ search â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+QUERIES = ("redis", "configurar sessão", "cenoura bolo", "primeiro", "xyzzy", "port")
+
+def bench_search(args) -> dict:
+    root  = tempfile.mkdtemp(prefix="search-", dir=_HOME)
+    store = ng.ChatStore(root=root)
+    words = ("redis sessão configurar bolo cenoura memória porta docker índice "
+             "consulta python janela thread servidor primeiro lista").split()
+    per_chat = 200
+    t0 = time.perf_counter()
+    for c in range(args.search_msgs // per_chat):
+        history = [
+            {"role": "user" if i % 2 == 0 else "model",
+             "parts": [{"text": " ".join(words[(c * 7 + i * k) % len(words)] for k in range(1, 25))}]}
+            for i in range(per_chat)
+        ]
+        store.write(f"chat {c}", history)
+    store.sync()
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(1000):
+        store.append("chat 0", {"role": "user", "parts": [{"text": f"nova mensagem {i} sobre redis"}]})
+    append_us = (time.perf_counter() - t0) * 1e6 / 1000
+
+    out = {"messages": args.search_msgs, "fts5": store.search.fts, "build_s": build_s,
+           "append_us": append_us, "queries": {}}
+    print(f"{args.search_msgs} msgs indexadas em {build_s:.1f} s (FTS5: {store.search.fts});"
+          f" append + índice {append_us:.0f} µs")
+    print(f"{'consulta':<20} {'hits':>5} {'p50 ms':>8} {'máx ms':>8}")
+    for q in QUERIES:
+        times = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            hits = store.find(q)
+            times.append((time.perf_counter() - t) * 1000)
+        out["queries"][q] = {"hits": len(hits), "p50_ms": pct(times, 50), "max_ms": max(times)}
+        print(f"{q:<20} {len(hits):>5} {pct(times, 50):>8.2f} {max(times):>8.2f}")
+    store.close()
+    return out
+
+# â”€â”€ markdown â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def bench_markdown(args) -> dict:
+    out = {}
+    print(f"{'KB':>6} {'frio ms':>10} {'cache ms':>10}")
+    for kb in (1, 10, 100):
+        text = synthetic(kb)
+        cold = timed(ng._render_markdown, text, 5)
+        ng.render_markdown(text)
+        warm = timed(ng.render_markdown, text, 5)
+        out[f"{kb}KB"] = {"cold_ms": cold, "cached_ms": warm}
+        print(f"{kb:>6} {cold:>10.2f} {warm:>10.3f}")
+    return out
+
+# â”€â”€ startup â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def make_chats(home: str, n: int):
+    chats = os.path.join(home, ".gemini_chats")
+    os.makedirs(chats, exist_ok=True)
+    for i in range(n):
+        with open(os.path.join(chats, f"Sessão {i:06d}{ng.CHAT_EXT}"), "w", encoding="utf-8") as fh:
+            fh.write(json.dumps({"role": "user", "parts": [{"text": f"pergunta {i}"}]}) + "\n")
+            fh.write(json.dumps({"role": "model", "parts": [{"text": f"resposta {i}"}]}) + "\n")
+
+def startup_child() -> int:
+    """Processo filho: constrói a janela e mede até a primeira pintura."""
+    t0  = time.perf_counter()
+    app = QApplication([])
+    painted = {}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, ev):
+            if ev.type() == QEvent.Type.Paint and "ms" not in painted:
+                painted["ms"] = (time.perf_counter() - t0) * 1000
+                QTimer.singleShot(0, loop.quit)
+            return False
+
+    win = ng.GeminiWindow({"provider": "OpenRouter", "api_key": "bench", "model": "mock/model"})
+    built = (time.perf_counter() - t0) * 1000
+    probe = FirstPaint()
+    win.installEventFilter(probe)
+    loop = QEventLoop()
+    win.show()
+    QTimer.singleShot(30000, loop.quit)
+    loop.exec()
+    win.close()   # grava o índice para a medição "com índice"
+    print(json.dumps({
+        "import_ms": _T_IMPORT * 1000, "window_ms": built,
+        "first_paint_ms": painted.get("ms"), "rows": win._chat_model.rowCount(),
+        "startup": ng.STARTUP.summary(),
+    }))
+    app.quit()
+    return 0
+
+def bench_startup(args) -> dict:
+    out = {}
+    print(f"{'chats':>7} {'índice':>7} {'import ms':>10} {'janela ms':>10} {'pintura ms':>11} {'processo ms':>12}")
+    for n in args.chats:
+        home = tempfile.mkdtemp(prefix=f"startup-{n}-", dir=_HOME)
+        make_chats(home, n)
+        for label in ("não", "sim"):
+            env = {**os.environ, "NEBULA_BENCH_HOME": home}
+            t0  = time.perf_counter()
+            res = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--startup-child"],
+                env=env, capture_output=True, text=True, timeout=1800,
+            )
+            wall = (time.perf_counter() - t0) * 1000
+            try:
+                row = json.loads(res.stdout.strip().splitlines()[-1])
+            except (ValueError, IndexError):
+                print(f"{n:>7} {label:>7}  falhou:\n{res.stderr[-800:]}")
+                continue
+            row["process_ms"] = wall
+            out[f"{n}/{'index' if label == 'sim' else 'cold'}"] = row
+            print(f"{n:>7} {label:>7} {row['import_ms']:>10.0f} {row['window_ms']:>10.0f}"
+                  f" {row['first_paint_ms'] or 0:>11.0f} {wall:>12.0f}")
+    return out
+
+def main() -> int:
+    if "--startup-child" in sys.argv:
+        return startup_child()
+
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    ap.add_argument("--json", help="grava os resultados neste arquivo")
+    ap.add_argument("--latency", type=float, default=0.05, help="latência do mock (s)")
+    ap.add_argument("--rate", type=float, default=200.0, help="tokens/s do mock")
+    ap.add_argument("--tokens", type=int, default=100, help="tokens por resposta")
+    ap.add_argument("--requests", type=int, default=10)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--jitter", type=float, default=0.15, help="cauda exponencial do mock no fan-out (s)")
+    ap.add_argument("--fanout", type=int, nargs="+", default=[1, 2, 3, 4], help="modelos por envio")
+    ap.add_argument("--stream-rate", type=float, default=2000.0, help="tokens/s no teste de travadas")
+    ap.add_argument("--stream-tokens", type=int, default=4000)
+    ap.add_argument("--big-chat", type=int, default=4000, help="mensagens do chat grande")
+    ap.add_argument("--stall-ms", type=float, default=50.0, help="atraso que conta como travada")
+    ap.add_argument("--appends", type=int, default=5000)
+    ap.add_argument("--archive-chats", type=int, default=500, help="chats antigos no teste do arquivo")
+    ap.add_argument("--search-msgs", type=int, default=200000, help="mensagens no índice de busca")
+    ap.add_argument("--repeat", type=int, default=20, help="repetições de cada consulta")
+    ap.add_argument("--chats", type=int, nargs="+", default=[10, 1000, 10000])
+    args = ap.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    results = {"import_ms": _T_IMPORT * 1000}
+    benches = {
+        "ttft": bench_ttft, "fanout": bench_fanout, "stalls": bench_stalls, "store": bench_store,
+        "archive": bench_archive, "search": bench_search, "markdown": bench_markdown, "startup": bench_startup,
+    }
+    for name in SECTIONS:
+        if name in args.only:
+            print(f"\n== {name} ==")
+            results[name] = benches[name](args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, ensure_ascii=False, indent=2)
+        print(f"\nResultados em {args.json}")
+    del app
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita o chat-completions do OpenRouter, para benchmarks.
+
+    python bench/mock_openrouter.py --port 8765 --latency 0.3 --rate 40
+    NEBULA_OPENROUTER_BASE=http://127.0.0.1:8765/api/v1/chat/completions python nebula_gemini.py
+
+Responde com e sem stream (SSE com keep-alive, deltas e [DONE]), com
+`latency` segundos até os cabeçalhos (mais um atraso exponencial de
+média `jitter`, para simular cauda) e `rate` tokens por segundo depois
+disso. Também atende GET .../auth/key, usado pelo "Testar Conexão".
+"""
+import argparse, json, random, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = (
+    "O **teste** de carga gera `código` e texto comum em português, "
+    "com listas, links e blocos para exercitar o renderizador. "
+).split(" ")
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, code: int, obj: dict):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.endswith("/auth/key"):
+            self._json(200, {"data": {"credits": 100, "label": "mock"}})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        mock = self.server.mock
+        size = int(self.headers.get("Content-Length", 0))
+        req  = json.loads(self.rfile.read(size) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        mock.requests += 1
+
+        time.sleep(mock.latency + (random.expovariate(1 / mock.jitter) if mock.jitter else 0.0))
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(mock.tokens)]
+        usage  = {"completion_tokens": len(tokens)}
+        if not req.get("stream"):
+            time.sleep(len(tokens) / mock.rate if mock.rate else 0)
+            self._json(200, {
+                "model":   req.get("model"),
+                "choices": [{"message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage":   usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._chunk(b": OPENROUTER PROCESSING\n\n")
+            start = time.perf_counter()
+            for i, tok in enumerate(tokens):
+                if mock.rate:
+                    # Agenda pelo relógio para não acumular atraso dos writes
+                    wait = start + i / mock.rate - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                event = {"choices": [{"delta": {"content": tok}}]}
+                self._chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self._chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            mock.cancelled += 1
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+class MockOpenRouter:
+    """Servidor em thread própria; use como context manager ou start()/stop()."""
+
+    def __init__(self, latency: float = 0.05, rate: float = 200.0, tokens: int = 200,
+                 host: str = "127.0.0.1", port: int = 0, jitter: float = 0.0):
+        self.latency   = latency
+        self.jitter    = jitter
+        self.rate      = rate
+        self.tokens    = tokens
+        self.requests  = 0
+        self.cancelled = 0
+        self._server   = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread   = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def start(self) -> "MockOpenRouter":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.3, help="segundos até a resposta")
+    ap.add_argument("--rate", type=float, default=40.0, help="tokens por segundo (0 = sem limite)")
+    ap.add_argument("--tokens", type=int, default=300, help="tokens por resposta")
+    ap.add_argument("--jitter", type=float, default=0.0, help="média do atraso extra exponencial (s)")
+    args = ap.parse_args()
+
+    mock = MockOpenRouter(args.latency, args.rate, args.tokens, port=args.port, jitter=args.jitter).start()
+    print(f"Mock OpenRouter em {mock.url}  (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == "__main__":
+    main()
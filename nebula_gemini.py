@@ -3,271 +3,3281 @@
 NebulaAI Desktop â€” v3.0
 Catppuccin Mocha â€¢ PyQt6 â€¢ Google Gemini + OpenRouter
 """
-import sys, os, json, re, requests
+import sys, os, time
+_T_BOOT = time.perf_counter()
+import csv, json, re, html, math, random, hashlib, hmac, secrets, sqlite3, zlib, logging, threading, asyncio, concurrent.futures, contextlib, traceback, importlib
+import email.utils
+from collections import OrderedDict, Counter, deque, namedtuple
 from datetime import datetime
-from google import genai
+_T_STDLIB = time.perf_counter()
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit,
-    QLineEdit, QListWidget, QListWidgetItem, QPushButton,
-    QFrame, QLabel, QComboBox, QGraphicsOpacityEffect
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
+    QLineEdit, QListView, QPushButton, QStyledItemDelegate, QStyle,
+    QFrame, QLabel, QComboBox, QCheckBox, QMenu, QGraphicsOpacityEffect, QFileDialog,
+    QTextBrowser, QToolButton
 )
 from PyQt6.QtCore import (
-    Qt, QThread, pyqtSignal, QTimer, QSize,
+    Qt, QObject, pyqtSignal, QTimer, QCoreApplication, QSize, QRect, QRectF, QPointF, QEvent, QUrl,
+    QAbstractListModel, QModelIndex,
     QPropertyAnimation, QEasingCurve
 )
-from PyQt6.QtGui import QFont, QTextCursor
+from PyQt6.QtGui import (
+    QFont, QFontMetrics, QTextCursor, QTextDocument, QAbstractTextDocumentLayout,
+    QPainter, QPalette, QColor, QCursor, QKeySequence, QDesktopServices, QActionGroup
+)
+_T_QT = time.perf_counter()
+
+# Avisos de diagnóstico: na GUI vão para LOG_DIR/nebula.log (setup_logging),
+# nos modos de linha de comando para o stderr
+logger = logging.getLogger("nebula")
+
+# â”€â”€ Catppuccin Mocha â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+C_ACCENT   = "#cba6f7"
+C_ACCENT2  = "#89b4fa"
+C_BG_SIDE  = "#11111b"
+C_BG_MAIN  = "#1e1e2e"
+C_BG_SURF  = "#181825"
+C_BG_INPUT = "#313244"
+C_BUBBLE_U = "#45475a"
+C_TEXT     = "#cdd6f4"
+C_SUBTEXT  = "#6c7086"
+C_RED      = "#f38ba8"
+C_GREEN    = "#a6e3a1"
+C_YELLOW   = "#f9e2af"
+C_TEAL     = "#94e2d5"
+
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".gemini_nebula_config.json")
+CHATS_DIR   = os.path.expanduser("~/.gemini_chats")
+os.makedirs(CHATS_DIR, exist_ok=True)
+
+PROVIDERS = ["OpenRouter", "Google Gemini"]
+
+GEMINI_MODELS = [
+    "gemini-2.0-flash",
+    "gemini-2.0-flash-lite",
+    "gemini-1.5-pro",
+    "gemini-1.5-flash",
+]
+
+OPENROUTER_MODELS = [
+    "openrouter/qwen/qwen3.6-plus:free",
+    "google/gemini-2.0-flash-exp:free",
+    "google/gemini-flash-1.5",
+    "meta-llama/llama-3.3-70b-instruct:free",
+    "meta-llama/llama-3.1-8b-instruct:free",
+    "mistralai/mistral-7b-instruct:free",
+    "deepseek/deepseek-chat",
+    "anthropic/claude-3.5-haiku",
+    "openai/gpt-4o-mini",
+    "openai/gpt-4o",
+]
+
+# NEBULA_OPENROUTER_BASE no ambiente (ou "openrouter_base" na config) aponta
+# para outro servidor compatível, como o mock de bench/
+OPENROUTER_BASE = os.environ.get(
+    "NEBULA_OPENROUTER_BASE", "https://openrouter.ai/api/v1/chat/completions"
+)
+
+def openrouter_url(config: dict, path: str = "chat/completions") -> str:
+    base = config.get("openrouter_base") or OPENROUTER_BASE
+    return base.rsplit("/chat/completions", 1)[0] + "/" + path
+
+# â”€â”€ Config â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+def save_config(data: dict):
+    with open(CONFIG_PATH, "w") as f:
+        json.dump(data, f)
+
+def load_config() -> dict | None:
+    if os.path.exists(CONFIG_PATH):
+        try:
+            with open(CONFIG_PATH, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
+    return None
+
+# â”€â”€ Startup â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+# Tempos contados do topo do módulo: não incluem subir o interpretador
+# (nem descompactar o executável do PyInstaller).
+STARTUP_BUDGET_MS = 400   # até a primeira pintura
+
+class StartupBudget:
+    """Marcos do startup e custo de cada import, para o painel de métricas."""
+
+    def __init__(self, t0: float):
+        self._t0 = t0
+        self.marks:   dict[str, float] = {}
+        self.imports: dict[str, tuple[float, bool]] = {}   # nome -> (ms, na GUI?)
+
+    def mark(self, name: str):
+        self.marks.setdefault(name, (time.perf_counter() - self._t0) * 1000)
+
+    def imported(self, name: str, ms: float, on_gui: bool = True):
+        self.imports[name] = (ms, on_gui)
+
+    def summary(self) -> str:
+        paint = self.marks.get("first_paint")
+        head  = (f"primeira pintura {paint:.0f} ms (orçamento {STARTUP_BUDGET_MS})"
+                 if paint is not None else "primeira pintura pendente")
+        mods  = ", ".join(f"{name} {ms:.0f}" + ("" if on_gui else " (fundo)")
+                          for name, (ms, on_gui) in self.imports.items())
+        return f"{head} · imports ms: {mods}"
+
+STARTUP = StartupBudget(_T_BOOT)
+STARTUP.imported("stdlib", (_T_STDLIB - _T_BOOT) * 1000)
+STARTUP.imported("PyQt6", (_T_QT - _T_STDLIB) * 1000)
+
+class LazyModule:
+    """
+    Módulo importado no primeiro acesso a um atributo. Os SDKs dos
+    provedores custam mais que a própria GUI para importar (google.genai
+    passa de meio segundo) e quem usa só o OpenRouter nunca precisa dele;
+    `warm_up` os carrega numa thread depois que a janela aparece.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._mod  = None
+
+    def load(self):
+        if self._mod is None:
+            fresh = self._name not in sys.modules
+            t0    = time.perf_counter()
+            mod   = importlib.import_module(self._name)
+            if fresh:
+                STARTUP.imported(self._name, (time.perf_counter() - t0) * 1000,
+                                 threading.current_thread() is threading.main_thread())
+            self._mod = mod
+        return self._mod
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+httpx        = LazyModule("httpx")
+genai        = LazyModule("google.genai")
+genai_errors = LazyModule("google.genai.errors")
+
+def warm_up(provider: str):
+    """Importa em segundo plano o que a primeira requisição vai precisar."""
+    mods = [httpx] + ([genai, genai_errors] if provider != "OpenRouter" else [])
+    threading.Thread(
+        target=lambda: [m.load() for m in mods], name="sdk-warmup", daemon=True
+    ).start()
+
+# â”€â”€ Storage â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+CHAT_EXT    = ".jsonl"
+PREVIEW_LEN = 80
+
+class ChatIndex:
+    """Resumo de cada chat em `.index.json`: título, mtime, tamanho,
+    número de mensagens e prévia da primeira pergunta.
+
+    A sidebar lê só isto; um histórico é aberto apenas quando o chat é
+    selecionado. Na abertura o índice é conferido contra um `scandir`
+    (sem ler conteúdo) e só os arquivos com mtime/tamanho diferentes são
+    relidos. Chats arquivados (`ChatArchive`) continuam aqui, marcados com
+    "archived". Não é thread-safe por si só: o `ChatStore` serializa o acesso.
+    """
+    FILE = ".index.json"
+
+    def __init__(self, root: str):
+        self._path    = os.path.join(root, self.FILE)
+        self._root    = root
+        self._dirty   = False
+        self._entries: dict[str, dict] = {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if isinstance(data, dict):
+                self._entries = data
+        except (OSError, ValueError):
+            self._dirty = True
+
+    def get(self, cid: str) -> dict | None:
+        return self._entries.get(cid)
+
+    def set(self, cid: str, history: list, st: os.stat_result):
+        preview = next(
+            (m["parts"][0]["text"] for m in history if m.get("role") == "user" and m.get("parts")),
+            "",
+        )
+        self._entries[cid] = {
+            "title":   cid,
+            "mtime":   st.st_mtime,
+            "size":    st.st_size,
+            "count":   len(history),
+            "preview": preview[:PREVIEW_LEN],
+        }
+        self._dirty = True
+
+    def appended(self, cid: str, msg: dict, st: os.stat_result):
+        entry = self._entries.setdefault(cid, {"title": cid, "count": 0, "preview": ""})
+        entry["count"] += 1
+        if not entry["preview"] and msg.get("role") == "user" and msg.get("parts"):
+            entry["preview"] = msg["parts"][0]["text"][:PREVIEW_LEN]
+        entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+        self._dirty = True
+
+    def renamed(self, old: str, new: str):
+        entry = self._entries.pop(old, None)
+        if entry is not None:
+            entry["title"] = new
+            self._entries[new] = entry
+            self._dirty = True
+
+    def removed(self, cid: str):
+        if self._entries.pop(cid, None) is not None:
+            self._dirty = True
+
+    def archived(self, cid: str):
+        entry = self._entries.get(cid)
+        if entry is not None:
+            entry["archived"] = True
+            self._dirty = True
+
+    def older_than(self, cutoff: float) -> list[str]:
+        """Chats ainda em JSONL sem alteração desde `cutoff`, do mais antigo ao mais novo."""
+        old = [(e["mtime"], cid) for cid, e in self._entries.items()
+               if not e.get("archived") and e.get("mtime", cutoff) < cutoff]
+        return [cid for _, cid in sorted(old)]
+
+    def entries(self, load, archive: "ChatArchive | None" = None) -> list[tuple[str, dict]]:
+        """Entradas do mais recente para o mais antigo, reconciliadas com o disco.
+
+        `load(cid)` só é chamado para arquivos novos ou alterados fora do app
+        (ou arquivados que o índice não conhece).
+        """
+        seen = set()
+        try:
+            scan = list(os.scandir(self._root))
+        except OSError:
+            scan = []
+        for e in scan:
+            if not e.name.endswith(CHAT_EXT) or e.name.startswith(".") or not e.is_file():
+                continue
+            cid = e.name[:-len(CHAT_EXT)]
+            seen.add(cid)
+            st = e.stat()
+            entry = self._entries.get(cid)
+            if entry is None or entry.get("mtime") != st.st_mtime or entry.get("size") != st.st_size:
+                self.set(cid, load(cid), st)
+        for cid in archive.cids() if archive is not None else ():
+            if cid in seen:
+                continue
+            seen.add(cid)
+            entry = self._entries.get(cid)
+            if entry is None or not entry.get("archived"):
+                meta = archive.get(cid)
+                self.set(cid, load(cid), _Stat(meta["mtime"], meta["raw"]))
+                self.archived(cid)
+        for cid in [c for c in self._entries if c not in seen]:
+            self.removed(cid)
+        return sorted(self._entries.items(), key=lambda kv: kv[1]["mtime"], reverse=True)
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp = self._path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self._entries, fh, ensure_ascii=False)
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+ARCHIVE_DAYS    = 30         # padrão de "archive_days" na config; 0 desliga
+ARCHIVE_SEGMENT = 8 << 20    # bytes por segmento antes de começar outro
+ARCHIVE_BATCH   = 64         # chats arquivados por vez com o lock do store
+
+# stat dos chats arquivados, que não têm arquivo próprio
+_Stat = namedtuple("_Stat", "st_mtime st_size")
+
+_zstd = None
+
+def zstd_module():
+    """`zstandard` é opcional: sem ele os segmentos novos usam zlib."""
+    global _zstd
+    if _zstd is None:
+        try:
+            _zstd = importlib.import_module("zstandard")
+        except ImportError:
+            _zstd = False
+    return _zstd or None
+
+class ArchiveError(OSError):
+    """Chat arquivado que não dá para ler (segmento ausente ou corrompido)."""
+
+class ChatArchive:
+    """Camada fria do `ChatStore`: chats parados há muito tempo, comprimidos.
+
+    Cada chat vira um bloco comprimido independente (zstd se o pacote
+    `zstandard` estiver instalado, senão zlib) com as mensagens como
+    `[papel, texto, ts]` em vez de `{'role', 'parts': [{'text'}]}`. Os blocos
+    são acrescentados a segmentos `seg-NNNNN.bin` em `.archive/`, e
+    `index.json` guarda segmento, offset e tamanho de cada um: abrir um
+    chat arquivado é um seek e uma descompressão, sem ler os vizinhos.
+    Remover só tira do índice; `vacuum()` recopia, sem recomprimir, os
+    blocos vivos de segmentos que ficaram majoritariamente mortos. Um
+    segmento sem nenhum chat só é apagado por `save()`, depois de o índice
+    novo estar em disco. Não é thread-safe por si só: o `ChatStore`
+    serializa o acesso.
+    """
+    DIR   = ".archive"
+    INDEX = "index.json"
+    ROLES = ("user", "model")
+
+    def __init__(self, root: str):
+        self._dir   = os.path.join(root, self.DIR)
+        self._path  = os.path.join(self._dir, self.INDEX)
+        self._chats: dict[str, dict] = {}
+        self._unsynced: set[str] = set()
+        self._dropped:  set[str] = set()    # segmentos que podem ter ficado sem chats
+        self.open_ms: deque[float] = deque(maxlen=50)
+        try:
+            with open(self._path, "r", encoding="utf-8") as fh:
+                self._chats = json.load(fh).get("chats", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self._chats
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def get(self, cid: str) -> dict | None:
+        return self._chats.get(cid)
+
+    def cids(self) -> list[str]:
+        return list(self._chats)
+
+    def load(self, cid: str) -> list:
+        t0    = time.perf_counter()
+        entry = self._chats[cid]
+        try:
+            with open(os.path.join(self._dir, entry["seg"]), "rb") as fh:
+                fh.seek(entry["offset"])
+                blob = fh.read(entry["length"])
+            rows = json.loads(self._decompress(entry["codec"], blob))
+            history = [self._record(row) if isinstance(row, list) else row for row in rows]
+        except (OSError, ValueError, IndexError, TypeError, zlib.error) as e:
+            raise ArchiveError(f"{entry['seg']}@{entry['offset']}: {e}") from e
+        self.open_ms.append((time.perf_counter() - t0) * 1000)
+        return history
+
+    def pack(self, cid: str, history: list, st: os.stat_result):
+        """Acrescenta o chat ao segmento atual; só vale depois de `save()`."""
+        rows = [
+            [self.ROLES.index(m["role"]), m["parts"][0]["text"], *([m["ts"]] if "ts" in m else [])]
+            if self._plain(m) else m
+            for m in history
+        ]
+        data  = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        codec = "zstd" if zstd_module() else "zlib"
+        blob  = self._compress(codec, data)
+        seg   = self._segment(len(blob))
+        with open(os.path.join(self._dir, seg), "ab") as fh:
+            offset = fh.seek(0, os.SEEK_END)
+            fh.write(blob)
+        self._unsynced.add(seg)
+        self._chats[cid] = {
+            "seg": seg, "offset": offset, "length": len(blob), "codec": codec,
+            "raw": st.st_size, "mtime": st.st_mtime,
+        }
+
+    def remove(self, cid: str):
+        """Tira o chat do índice; só vale depois de `save()`."""
+        entry = self._chats.pop(cid, None)
+        if entry is not None:
+            self._dropped.add(entry["seg"])
+
+    def rename(self, old: str, new: str):
+        if old in self._chats:
+            self._chats[new] = self._chats.pop(old)
+
+    def save(self):
+        """Grava os segmentos novos em disco, depois o índice (tmp + os.replace)
+        e por fim apaga os segmentos que ficaram sem chats."""
+        for seg in self._unsynced:
+            with contextlib.suppress(OSError), open(os.path.join(self._dir, seg), "rb+") as fh:
+                os.fsync(fh.fileno())
+        self._unsynced.clear()
+        os.makedirs(self._dir, exist_ok=True)
+        tmp = self._path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"version": 1, "chats": self._chats}, fh, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self._path)
+        # Só depois do índice novo: se o processo cair antes, o antigo ainda aponta para eles
+        live = {entry["seg"] for entry in self._chats.values()}
+        for seg in self._dropped - live:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self._dir, seg))
+        self._dropped.clear()
+
+    def vacuum(self):
+        """Recopia os blocos vivos de segmentos com mais da metade morta."""
+        segments = self._segments()
+        live = Counter()
+        for entry in self._chats.values():
+            live[entry["seg"]] += entry["length"]
+        moved = set()
+        for seg in segments[:-1]:
+            path = os.path.join(self._dir, seg)
+            if live[seg] * 2 >= os.path.getsize(path):
+                continue
+            with open(path, "rb") as fh:
+                for cid, entry in [(c, e) for c, e in self._chats.items() if e["seg"] == seg]:
+                    fh.seek(entry["offset"])
+                    blob = fh.read(entry["length"])
+                    dest = self._segment(len(blob))
+                    with open(os.path.join(self._dir, dest), "ab") as out:
+                        entry["offset"] = out.seek(0, os.SEEK_END)
+                        out.write(blob)
+                    entry["seg"] = dest
+                    self._unsynced.add(dest)
+            moved.add(seg)
+        if moved:
+            self._dropped |= moved
+            self.save()
+
+    def stats(self) -> dict:
+        disk = 0
+        for seg in self._segments():
+            with contextlib.suppress(OSError):
+                disk += os.path.getsize(os.path.join(self._dir, seg))
+        opens = sorted(self.open_ms)
+        return {
+            "chats":      len(self._chats),
+            "raw_bytes":  sum(e["raw"] for e in self._chats.values()),
+            "disk_bytes": disk,
+            "open_ms":    opens[len(opens) // 2] if opens else None,
+        }
+
+    def _segments(self) -> list[str]:
+        try:
+            return sorted(n for n in os.listdir(self._dir) if n.startswith("seg-") and n.endswith(".bin"))
+        except OSError:
+            return []
+
+    def _segment(self, size: int) -> str:
+        """Segmento atual, ou o próximo se este passaria de ARCHIVE_SEGMENT."""
+        os.makedirs(self._dir, exist_ok=True)
+        segments = self._segments()
+        if not segments:
+            return "seg-00001.bin"
+        last = segments[-1]
+        if os.path.getsize(os.path.join(self._dir, last)) + size <= ARCHIVE_SEGMENT:
+            return last
+        return f"seg-{int(last[4:9]) + 1:05d}.bin"
+
+    @classmethod
+    def _plain(cls, msg: dict) -> bool:
+        parts = msg.get("parts")
+        return (msg.keys() - {"ts"} == {"role", "parts"} and msg["role"] in cls.ROLES
+                and isinstance(parts, list) and len(parts) == 1 and parts[0].keys() == {"text"})
+
+    @classmethod
+    def _record(cls, row: list) -> dict:
+        rec = {"role": cls.ROLES[row[0]], "parts": [{"text": row[1]}]}
+        if len(row) > 2:
+            rec["ts"] = row[2]
+        return rec
+
+    @staticmethod
+    def _compress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            return zstd_module().ZstdCompressor(level=19).compress(data)
+        return zlib.compress(data, 9)
+
+    @staticmethod
+    def _decompress(codec: str, blob: bytes) -> bytes:
+        if codec == "zstd":
+            zstd = zstd_module()
+            if zstd is None:
+                raise OSError("chat arquivado com zstd, mas o pacote zstandard não está instalado")
+            return zstd.ZstdDecompressor().decompress(blob)
+        return zlib.decompress(blob)
+
+
+# Acentos comuns -> letra base, um caractere por um (mantém as posições)
+_FOLD = str.maketrans(
+    "áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ",
+    "aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN",
+)
+
+class SearchIndex:
+    """Busca em todas as conversas: índice invertido em `.search.db`.
+
+    Uma linha por mensagem em `docs` (chat, posição no histórico, papel,
+    texto) e uma tabela FTS5 de conteúdo externo sobre ela, mantida por
+    triggers. Cada turno acrescentado entra na hora e o commit acompanha
+    o fsync em lote do `ChatStore`; chats alterados fora do app são
+    reindexados por `ChatStore.index_async()`. Sem FTS5 no SQLite do
+    sistema, cai para LIKE com ranking por número de ocorrências.
+    Como o `ChatIndex`, depende do lock do `ChatStore`.
+    """
+    FILE        = ".search.db"
+    LIMIT       = 50
+    RANK_WINDOW = 2000
+    SNIPPET     = 70
+
+    def __init__(self, root: str):
+        self._path = os.path.join(root, self.FILE)
+        try:
+            self._db = self._open()
+        except sqlite3.DatabaseError:
+            # Arquivo corrompido: o índice é derivado dos chats, recria
+            for suffix in ("", "-wal", "-shm"):
+                with contextlib.suppress(OSError):
+                    os.remove(self._path + suffix)
+            self._db = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self._path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs(
+                id INTEGER PRIMARY KEY, cid TEXT NOT NULL, seq INTEGER NOT NULL,
+                role TEXT, text TEXT);
+            CREATE INDEX IF NOT EXISTS docs_cid ON docs(cid, seq);
+            CREATE TABLE IF NOT EXISTS chats(cid TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+        """)
+        try:
+            db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+                    text, content='docs', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3');
+                CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+                    INSERT INTO fts(rowid, text) VALUES (new.id, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+                    INSERT INTO fts(fts, rowid, text) VALUES ('delete', old.id, old.text);
+                END;
+            """)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        db.commit()
+        return db
+
+    @staticmethod
+    def _text(msg: dict) -> str:
+        return msg["parts"][0].get("text", "") if msg.get("parts") else ""
+
+    def add(self, cid: str, seq: int, msg: dict, st: os.stat_result):
+        text = self._text(msg)
+        if text:
+            self._db.execute(
+                "INSERT INTO docs(cid, seq, role, text) VALUES (?, ?, ?, ?)",
+                (cid, seq, msg.get("role"), text),
+            )
+        self._seen(cid, st)
+
+    def replace(self, cid: str, history: list, st: os.stat_result):
+        self._db.execute("DELETE FROM docs WHERE cid = ?", (cid,))
+        self._db.executemany(
+            "INSERT INTO docs(cid, seq, role, text) VALUES (?, ?, ?, ?)",
+            ((cid, i, m.get("role"), t) for i, m in enumerate(history) if (t := self._text(m))),
+        )
+        self._seen(cid, st)
+
+    def _seen(self, cid: str, st: os.stat_result):
+        self._db.execute(
+            "INSERT OR REPLACE INTO chats(cid, mtime, size) VALUES (?, ?, ?)",
+            (cid, st.st_mtime, st.st_size),
+        )
+
+    def renamed(self, old: str, new: str):
+        self._db.execute("UPDATE docs SET cid = ? WHERE cid = ?", (new, old))
+        self._db.execute("UPDATE chats SET cid = ? WHERE cid = ?", (new, old))
+
+    def removed(self, cid: str):
+        self._db.execute("DELETE FROM docs WHERE cid = ?", (cid,))
+        self._db.execute("DELETE FROM chats WHERE cid = ?", (cid,))
+
+    def stale(self, entries: list[tuple[str, dict]]) -> tuple[list[str], list[str]]:
+        """(desatualizados, órfãos) comparando com o `ChatIndex`."""
+        known = {cid: (m, s) for cid, m, s in self._db.execute("SELECT cid, mtime, size FROM chats")}
+        current = {cid for cid, _ in entries}
+        stale = [cid for cid, e in entries if known.get(cid) != (e.get("mtime"), e.get("size"))]
+        return stale, [cid for cid in known if cid not in current]
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def search(self, query: str, limit: int = LIMIT) -> list[dict]:
+        """Melhores mensagens para `query`: {cid, seq, role, snippet (HTML)}."""
+        terms = re.findall(r"\w+", query.translate(_FOLD).lower())
+        if not terms:
+            return []
+        ids = self._match(terms, limit) if self.fts else self._like(terms, limit)
+        if not ids:
+            return []
+        rows = {
+            r[0]: r[1:] for r in self._db.execute(
+                f"SELECT id, cid, seq, role, text FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+            )
+        }
+        return [
+            {"cid": cid, "seq": seq, "role": role, "snippet": self._snippet(text, terms)}
+            for cid, seq, role, text in (rows[i] for i in ids if i in rows)
+        ]
+
+    def _match(self, terms: list[str], limit: int) -> list[int]:
+        # Palavras inteiras primeiro (consulta por prefixo custa mais); o
+        # último termo como prefixo, de quem ainda está digitando, só
+        # completa a lista quando faltam resultados
+        words = " ".join(f'"{t}"' for t in terms)
+        ids   = self._ranked(words, limit)
+        if len(ids) < limit:
+            seen = set(ids)
+            ids += [i for i in self._ranked(words + "*", limit) if i not in seen][:limit - len(ids)]
+        return ids
+
+    def _ranked(self, match: str, limit: int) -> list[int]:
+        where, args = "fts MATCH ?", [match]
+        # O bm25 custa por ocorrência: termos que aparecem em quase toda
+        # mensagem ranqueiam só as RANK_WINDOW mais recentes
+        edge = self._db.execute(
+            "SELECT rowid FROM fts WHERE fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, self.RANK_WINDOW - 1),
+        ).fetchone()
+        if edge:
+            where += " AND rowid >= ?"
+            args.append(edge[0])
+        return [r[0] for r in self._db.execute(
+            f"SELECT rowid FROM fts WHERE {where} ORDER BY rank LIMIT ?", (*args, limit)
+        )]
+
+    def _like(self, terms: list[str], limit: int) -> list[int]:
+        where = " AND ".join("text LIKE ?" for _ in terms)
+        found = self._db.execute(
+            f"SELECT id, text FROM docs WHERE {where} ORDER BY id DESC LIMIT ?",
+            [f"%{t}%" for t in terms] + [self.RANK_WINDOW],
+        ).fetchall()
+        # Mais ocorrências primeiro; o sort estável desempata pela mais recente
+        found.sort(key=lambda r: -sum(r[1].lower().count(t) for t in terms))
+        return [i for i, _ in found[:limit]]
+
+    @classmethod
+    def _snippet(cls, text: str, terms: list[str]) -> str:
+        """Trecho em volta do primeiro termo encontrado, com os termos em <b>."""
+        folded = text.translate(_FOLD).lower()
+        if len(folded) != len(text):
+            folded = text.lower() if len(text.lower()) == len(text) else text
+        hit   = re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, terms)) + r")\w*")
+        first = hit.search(folded)
+        start = max(0, (first.start() if first else 0) - cls.SNIPPET // 2)
+        if start:
+            # Começa numa palavra inteira
+            space = text.find(" ", start, start + 15)
+            start = space + 1 if space >= 0 else start
+        end = min(len(text), start + cls.SNIPPET * 2)
+
+        out, pos = ["…" if start else ""], start
+        for m in hit.finditer(folded, start, end):
+            out.append(html.escape(text[pos:m.start()]))
+            out.append(f"<b>{html.escape(text[m.start():m.end()])}</b>")
+            pos = m.end()
+        out.append(html.escape(text[pos:end]))
+        out.append("…" if end < len(text) else "")
+        return " ".join("".join(out).split())
+
+
+class ChatStore:
+    """Histórico em disco: um arquivo JSONL por chat em `root`.
+
+    Cada turno é uma linha acrescentada ao fim do arquivo, então o custo
+    de salvar não cresce com o tamanho da conversa e um crash no meio da
+    escrita só pode cortar a última linha. O fsync (e a gravação do
+    `ChatIndex`) é feito em lote por uma thread de fundo a cada
+    `sync_interval` segundos; arquivos com linhas corrompidas são
+    compactados em background. Chats antigos em `.json` são migrados na
+    primeira abertura. Chats parados há mais de N dias podem ir para o
+    `ChatArchive` (`archive_async`); eles continuam abrindo por `load` e
+    voltam para JSONL na primeira escrita.
+    """
+
+    def __init__(self, root: str = CHATS_DIR, sync_interval: float = 1.0):
+        self._root    = root
+        self._lock    = threading.RLock()
+        self._handles: dict[str, object] = {}
+        self._dirty:   set[str] = set()
+        self._stop    = threading.Event()
+        os.makedirs(root, exist_ok=True)
+        self.index    = ChatIndex(root)
+        self.search   = SearchIndex(root)
+        self.archive  = ChatArchive(root)
+        self._unreadable: dict[str, str] = {}   # cid -> erro ao ler do arquivo
+        self._migrate()
+        # Arquivamento interrompido antes de apagar o JSONL: vale o arquivo
+        stale = [cid for cid in self.archive.cids() if os.path.exists(self.path(cid))]
+        for cid in stale:
+            self.archive.remove(cid)
+        if stale:
+            self.archive.save()
+        self._syncer = threading.Thread(
+            target=self._sync_loop, args=(sync_interval,), daemon=True
+        )
+        self._syncer.start()
+
+    def path(self, cid: str) -> str:
+        return os.path.join(self._root, f"{cid}{CHAT_EXT}")
+
+    def exists(self, cid: str) -> bool:
+        return os.path.exists(self.path(cid)) or cid in self.archive
+
+    def load_error(self, cid: str) -> str | None:
+        """Erro do último `load` de um chat arquivado ilegível (que voltou vazio)."""
+        return self._unreadable.get(cid)
+
+    def entries(self) -> list[tuple[str, dict]]:
+        """(id, resumo) de cada chat, do mais recente para o mais antigo."""
+        with self._lock:
+            return self.index.entries(self.load, self.archive)
+
+    def find(self, query: str) -> list[dict]:
+        """Busca global; ver `SearchIndex.search`."""
+        with self._lock:
+            return self.search.search(query)
+
+    def load(self, cid: str) -> list:
+        history, broken = [], False
+        try:
+            with open(self.path(cid), "r", encoding="utf-8") as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    try:
+                        history.append(json.loads(line))
+                    except ValueError:
+                        broken = True
+        except FileNotFoundError:
+            with self._lock:
+                if cid in self.archive:
+                    try:
+                        history = self.archive.load(cid)
+                    except ArchiveError as e:
+                        logger.error("Arquivo: não foi possível abrir %r: %s", cid, e)
+                        self._unreadable[cid] = str(e)
+                        return []
+                    self._unreadable.pop(cid, None)
+                    return history
+            return []
+        except OSError:
+            return []
+        if broken:
+            self.compact_async(cid)
+        return history
+
+    def create(self, cid: str):
+        with self._lock:
+            fh = self._handle(cid)
+            if self.index.get(cid) is None:
+                self.index.set(cid, [], os.fstat(fh.fileno()))
+
+    def append(self, cid: str, msg: dict):
+        line = json.dumps(msg, ensure_ascii=False) + "\n"
+        with self._lock:
+            fh = self._handle(cid)
+            fh.write(line)
+            fh.flush()
+            self._dirty.add(cid)
+            st = os.fstat(fh.fileno())
+            self.index.appended(cid, msg, st)
+            self.search.add(cid, self.index.get(cid)["count"] - 1, msg, st)
+
+    def rename(self, old: str, new: str):
+        with self._lock:
+            self._release(old)
+            if old in self.archive and not os.path.exists(self.path(old)):
+                self.archive.rename(old, new)
+                self.archive.save()
+                if old in self._unreadable:
+                    self._unreadable[new] = self._unreadable.pop(old)
+            else:
+                os.replace(self.path(old), self.path(new))
+            self.index.renamed(old, new)
+            self.search.renamed(old, new)
+
+    def delete(self, cid: str):
+        with self._lock:
+            self._release(cid)
+            try:
+                os.remove(self.path(cid))
+            except FileNotFoundError:
+                pass
+            if cid in self.archive:
+                self.archive.remove(cid)
+                self.archive.save()
+            self._unreadable.pop(cid, None)
+            self.index.removed(cid)
+            self.search.removed(cid)
+
+    def write(self, cid: str, history: list, mtime: float | None = None):
+        """Reescreve o chat inteiro de forma atômica (tmp + os.replace)."""
+        path = self.path(cid)
+        tmp  = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for msg in history:
+                fh.write(json.dumps(msg, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        with self._lock:
+            self._release(cid)
+            os.replace(tmp, path)
+            if mtime is not None:
+                os.utime(path, (mtime, mtime))
+            st = os.stat(path)
+            self.index.set(cid, history, st)
+            self.search.replace(cid, history, st)
+            if cid in self.archive:
+                self.archive.remove(cid)
+                self.archive.save()
+
+    def compact_async(self, cid: str):
+        threading.Thread(target=self._compact, args=(cid,), daemon=True).start()
+
+    def _compact(self, cid: str):
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path(cid))
+                history = []
+                with open(self.path(cid), "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        try:
+                            history.append(json.loads(line))
+                        except ValueError:
+                            continue
+                self.write(cid, history, mtime)
+            except OSError:
+                pass
+
+    def archive_async(self, days: float):
+        """Arquiva, em segundo plano, os chats sem alteração há mais de `days` dias."""
+        threading.Thread(target=self.archive_old, args=(days,), name="archive", daemon=True).start()
+
+    def archive_old(self, days: float) -> int:
+        cutoff = time.time() - days * 86400
+        with self._lock:
+            old = self.index.older_than(cutoff)
+        packed = 0
+        # Em lotes: o índice do arquivo é gravado antes de apagar os JSONL do lote
+        for start in range(0, len(old), ARCHIVE_BATCH):
+            with self._lock:
+                if self._stop.is_set():
+                    break
+                done = []
+                for cid in old[start:start + ARCHIVE_BATCH]:
+                    if cid in self._handles:
+                        continue            # escrito nesta sessão
+                    try:
+                        st = os.stat(self.path(cid))
+                    except OSError:
+                        continue
+                    if st.st_mtime >= cutoff:
+                        continue
+                    self.archive.pack(cid, self.load(cid), st)
+                    done.append(cid)
+                if not done:
+                    continue
+                self.archive.save()
+                for cid in done:
+                    os.remove(self.path(cid))
+                    self.index.archived(cid)
+                packed += len(done)
+        with self._lock:
+            if packed and not self._stop.is_set():
+                self.archive.vacuum()
+        return packed
+
+    def archive_stats(self) -> dict:
+        with self._lock:
+            return self.archive.stats()
+
+    def _stat(self, cid: str):
+        """os.stat do JSONL ou, para um chat arquivado, o que foi guardado no arquivo."""
+        try:
+            return os.stat(self.path(cid))
+        except FileNotFoundError:
+            meta = self.archive.get(cid)
+            if meta is None:
+                raise
+            return _Stat(meta["mtime"], meta["raw"])
+
+    def sync(self):
+        with self._lock:
+            for cid in self._dirty:
+                fh = self._handles.get(cid)
+                if fh is not None:
+                    os.fsync(fh.fileno())
+            self._dirty.clear()
+            self.index.save()
+            self.search.commit()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self.sync()
+            for cid in list(self._handles):
+                self._release(cid)
+            self.search.close()
+
+    def index_async(self, entries: list[tuple[str, dict]]):
+        """Reindexa para a busca, em segundo plano, os chats novos ou alterados fora do app."""
+        threading.Thread(target=self._index, args=(entries,), name="search-index", daemon=True).start()
+
+    def _index(self, entries: list[tuple[str, dict]]):
+        with self._lock:
+            if self._stop.is_set():
+                return
+            stale, orphans = self.search.stale(entries)
+            for cid in orphans:
+                self.search.removed(cid)
+        for n, cid in enumerate(stale, 1):
+            try:
+                st = self._stat(cid)
+            except OSError:
+                continue
+            # Lê fora do lock; se o chat mudou nesse meio tempo, relê dentro
+            history = self.load(cid)
+            with self._lock:
+                if self._stop.is_set():
+                    return
+                with contextlib.suppress(OSError):
+                    now = self._stat(cid)
+                    if (now.st_mtime, now.st_size) != (st.st_mtime, st.st_size):
+                        history, st = self.load(cid), now
+                self.search.replace(cid, history, st)
+                if n % 500 == 0:
+                    self.search.commit()
+        with self._lock:
+            if not self._stop.is_set():
+                self.search.commit()
+
+    def _sync_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sync()
+            except OSError:
+                pass
+
+    def _handle(self, cid: str):
+        fh = self._handles.get(cid)
+        if fh is None:
+            path, torn = self.path(cid), False
+            # Escrita num chat arquivado: volta para JSONL antes. Se ele não
+            # puder ser lido, o ArchiveError sobe e a cópia arquivada fica intacta
+            if cid in self.archive and not os.path.exists(path):
+                meta = self.archive.get(cid)
+                self.write(cid, self.archive.load(cid), meta["mtime"])
+            try:
+                with open(path, "rb") as raw:
+                    if raw.seek(0, os.SEEK_END):
+                        raw.seek(-1, os.SEEK_END)
+                        torn = raw.read(1) != b"\n"
+            except FileNotFoundError:
+                pass
+            fh = open(path, "a", encoding="utf-8")
+            # Última linha cortada por um crash: isola antes de acrescentar
+            if torn:
+                fh.write("\n")
+            self._handles[cid] = fh
+        return fh
+
+    def _release(self, cid: str):
+        fh = self._handles.pop(cid, None)
+        if fh is not None:
+            if cid in self._dirty:
+                os.fsync(fh.fileno())
+                self._dirty.discard(cid)
+            fh.close()
+
+    def _migrate(self):
+        """Converte os chats `.json` (lista inteira) para JSONL."""
+        for name in os.listdir(self._root):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            cid  = name[:-len(".json")]
+            path = os.path.join(self._root, name)
+            try:
+                if not self.exists(cid):
+                    with open(path, "r", encoding="utf-8") as fh:
+                        history = json.load(fh)
+                    self.write(
+                        cid, history if isinstance(history, list) else [],
+                        os.path.getmtime(path),
+                    )
+                os.remove(path)
+            except (OSError, ValueError):
+                continue
+
+class Message:
+    """Uma mensagem do histórico em memória.
+
+    O formato de disco e do provedor, `{'role', 'parts': [{'text'}]}`,
+    custa um dict, uma lista e outro dict por mensagem; aqui é um objeto
+    com `__slots__` e o papel internado. `ts` é o horário de criação
+    (0 nas mensagens gravadas antes de existir o campo) e `tokens` é a
+    estimativa usada pelo orçamento de contexto, calculada uma vez só.
+    A volta ao formato do provedor (`wire`) só acontece no envio.
+    """
+    __slots__ = ("role", "text", "ts", "_tokens")
+
+    def __init__(self, role: str, text: str, ts: int | None = None, tokens: int = 0):
+        self.role    = sys.intern(role)
+        self.text    = text
+        self.ts      = int(time.time()) if ts is None else ts
+        self._tokens = tokens
+
+    @classmethod
+    def from_record(cls, rec: dict) -> "Message":
+        parts = rec.get("parts")
+        text  = parts[0].get("text", "") if parts else ""
+        return cls(rec.get("role") or "user", text, rec.get("ts", 0))
+
+    @property
+    def tokens(self) -> int:
+        if not self._tokens:
+            self._tokens = MSG_TOKENS + estimate_tokens(self.text)
+        return self._tokens
+
+    def wire(self) -> dict:
+        """Formato do provedor (o do Gemini; o OpenRouter converte no request)."""
+        return {"role": self.role, "parts": [{"text": self.text}]}
+
+    def record(self) -> dict:
+        """Linha do JSONL: o formato do provedor mais o horário."""
+        rec = self.wire()
+        if self.ts:
+            rec["ts"] = self.ts
+        return rec
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.text[:30]!r})"
+
+class Conversation:
+    """Histórico de um chat aberto: as `Message` e o tamanho estimado em RAM."""
+    __slots__ = ("cid", "messages", "size")
+
+    MSG_OVERHEAD = 160   # objeto Message, cabeçalho do str, o int de `ts` e a referência na lista
+
+    def __init__(self, cid: str, messages: list[Message] | None = None):
+        self.cid      = cid
+        self.messages = messages or []
+        self.size     = sum(map(self.msg_size, self.messages))
+
+    @classmethod
+    def load(cls, store: ChatStore, cid: str) -> "Conversation":
+        return cls(cid, [Message.from_record(rec) for rec in store.load(cid)])
+
+    @classmethod
+    def msg_size(cls, msg: Message) -> int:
+        return cls.MSG_OVERHEAD + len(msg.text)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, i):
+        return self.messages[i]
+
+    def append(self, msg: Message):
+        self.messages.append(msg)
+        self.size += self.msg_size(msg)
+
+    def wire(self) -> list[dict]:
+        return [m.wire() for m in self.messages]
+
+class ChatCache:
+    """LRU dos históricos abertos, limitado por uma estimativa de memória.
+
+    Só os chats efetivamente abertos ficam em RAM; o resto é lido do
+    `ChatStore` sob demanda. O chat mais recente nunca é despejado.
+    """
+
+    def __init__(self, store: ChatStore, max_bytes: int = 32 << 20):
+        self._store = store
+        self._max   = max_bytes
+        self._items: OrderedDict[str, Conversation] = OrderedDict()
+        self._total = 0
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self._items
+
+    def get(self, cid: str) -> Conversation:
+        conv = self._items.get(cid)
+        if conv is None:
+            conv = self._items[cid] = Conversation.load(self._store, cid)
+            self._grow(cid, conv.size)
+        else:
+            self._items.move_to_end(cid)
+        return conv
+
+    def append(self, cid: str, msg: Message) -> Conversation:
+        conv = self.get(cid)
+        conv.append(msg)
+        self._grow(cid, Conversation.msg_size(msg))
+        return conv
+
+    def rename(self, old: str, new: str):
+        if old in self._items:
+            conv = self._items[new] = self._items.pop(old)
+            conv.cid = new
+
+    def discard(self, cid: str):
+        conv = self._items.pop(cid, None)
+        if conv is not None:
+            self._total -= conv.size
+
+    def _grow(self, cid: str, size: int):
+        self._total += size
+        while self._total > self._max and len(self._items) > 1:
+            oldest = next(iter(self._items))
+            if oldest == cid:
+                break
+            self.discard(oldest)
+
+# â”€â”€ Markdown-lite â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+MD_CACHE_SIZE = 512
+
+_PRE_STYLE = (
+    f"background:#181825;color:{C_TEAL};padding:10px;"
+    f"border-radius:8px;font-family:monospace;white-space:pre-wrap;"
+)
+_CODE_STYLE = (
+    f"background:#181825;color:{C_TEAL};padding:2px 5px;"
+    f"border-radius:4px;font-family:monospace;"
+)
+_HEADING_PX = {1: 20, 2: 18, 3: 16}
+_SAFE_URLS  = ("http://", "https://", "mailto:")
+
+_FENCE   = re.compile(r'^\s*```')
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+_ITEM    = re.compile(r'^\s*(?:(?P<ul>[-*+])|(?P<ol>\d+)[.)])\s+(?P<body>.*)$')
+_INLINE  = re.compile(
+    r'(?P<tick>`+)(?P<code>.+?)(?P=tick)'
+    r'|\*\*(?P<b1>.+?)\*\*|__(?P<b2>.+?)__'
+    r'|\*(?P<i1>[^*\s](?:[^*]*[^*\s])?)\*'
+    r'|(?<!\w)_(?P<i2>[^_\s](?:[^_]*[^_\s])?)_(?!\w)'
+    r'|\[(?P<label>[^\]]+)\]\((?P<url>[^)\s]+)\)'
+)
+
+_md_cache: OrderedDict[bytes, str] = OrderedDict()
+
+def _esc(text: str) -> str:
+    return html.escape(text, quote=False)
+
+def _inline(text: str) -> str:
+    """Formatação de linha (código, negrito, itálico, links) num só scan."""
+    out, pos = [], 0
+    for m in _INLINE.finditer(text):
+        out.append(_esc(text[pos:m.start()]))
+        pos = m.end()
+        if m.group("tick"):
+            out.append(f'<code style="{_CODE_STYLE}">{_esc(m.group("code").strip())}</code>')
+        elif m.group("b1") or m.group("b2"):
+            out.append(f"<b>{_inline(m.group('b1') or m.group('b2'))}</b>")
+        elif m.group("i1") or m.group("i2"):
+            out.append(f"<i>{_inline(m.group('i1') or m.group('i2'))}</i>")
+        elif m.group("url").lower().startswith(_SAFE_URLS):
+            out.append(
+                f'<a href="{html.escape(m.group("url"))}" style="color:{C_ACCENT};">'
+                f'{_inline(m.group("label"))}</a>'
+            )
+        else:
+            out.append(_esc(m.group(0)))
+    out.append(_esc(text[pos:]))
+    return "".join(out)
+
+def _render_markdown(text: str) -> str:
+    """Percorre o texto uma vez, linha a linha, montando o HTML por blocos."""
+    out:  list[str] = []
+    para: list[str] = []          # linhas de texto corrido pendentes
+    code: list[str] | None = None # dentro de um bloco ```
+    lst:  str | None = None       # "ul"/"ol" enquanto numa lista
+
+    def flush_para():
+        while para and not para[-1]:
+            para.pop()
+        if para:
+            out.append("<br>".join(para))
+            para.clear()
+
+    def close_list():
+        nonlocal lst
+        if lst:
+            out.append(f"</{lst}>")
+            lst = None
+
+    for line in text.split("\n"):
+        if code is not None:
+            if _FENCE.match(line):
+                out.append(f'<pre style="{_PRE_STYLE}">{_esc(chr(10).join(code).strip())}</pre>')
+                code = None
+            else:
+                code.append(line)
+            continue
+
+        if _FENCE.match(line):
+            flush_para()
+            close_list()
+            body = line.strip()[3:]
+            if body.endswith("```") and len(body) > 3:
+                out.append(f'<pre style="{_PRE_STYLE}">{_esc(body[:-3].strip())}</pre>')
+            else:
+                code = []
+            continue
+
+        item = _ITEM.match(line)
+        if item:
+            kind = "ul" if item.group("ul") else "ol"
+            flush_para()
+            if lst != kind:
+                close_list()
+                out.append(f'<{kind} style="margin-top:4px; margin-bottom:4px;">')
+                lst = kind
+            out.append(f"<li>{_inline(item.group('body'))}</li>")
+            continue
+        if lst and line.strip():
+            close_list()
+        elif lst:
+            continue
+
+        heading = _HEADING.match(line)
+        if heading:
+            flush_para()
+            level = len(heading.group(1))
+            out.append(
+                f'<p style="font-size:{_HEADING_PX.get(level, 14)}px; font-weight:700;'
+                f' color:{C_ACCENT}; margin-top:6px; margin-bottom:2px;">'
+                f'{_inline(heading.group(2))}</p>'
+            )
+            continue
+
+        if para or line.strip():
+            para.append(_inline(line))
+
+    if code is not None:
+        # Bloco ainda aberto (resposta cortada): mostra como código mesmo assim
+        out.append(f'<pre style="{_PRE_STYLE}">{_esc(chr(10).join(code).strip())}</pre>')
+    flush_para()
+    close_list()
+    return "".join(out)
+
+def render_markdown(text: str) -> str:
+    """Markdown-lite para HTML do Qt, com cache pelo hash do conteúdo."""
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    cached = _md_cache.get(key)
+    if cached is not None:
+        _md_cache.move_to_end(key)
+        return cached
+    rendered = _md_cache[key] = _render_markdown(text)
+    if len(_md_cache) > MD_CACHE_SIZE:
+        _md_cache.popitem(last=False)
+    return rendered
+
+# â”€â”€ Context budget â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+DEFAULT_CONTEXT  = 32_768
+CONTEXT_BUDGET   = 24_000   # teto padrão de tokens de prompt por requisição
+RESPONSE_RESERVE = 4_096    # espaço deixado para a resposta
+MSG_TOKENS       = 4        # papel/separadores de cada mensagem
+
+MODEL_CONTEXT = {
+    "gemini-2.0-flash":                       1_048_576,
+    "gemini-2.0-flash-lite":                  1_048_576,
+    "gemini-1.5-pro":                         2_097_152,
+    "gemini-1.5-flash":                       1_048_576,
+    "google/gemini-2.0-flash-exp:free":       1_048_576,
+    "google/gemini-flash-1.5":                1_000_000,
+    "meta-llama/llama-3.3-70b-instruct:free":   131_072,
+    "meta-llama/llama-3.1-8b-instruct:free":    131_072,
+    "mistralai/mistral-7b-instruct:free":        32_768,
+    "deepseek/deepseek-chat":                    64_000,
+    "anthropic/claude-3.5-haiku":               200_000,
+    "openai/gpt-4o-mini":                       128_000,
+    "openai/gpt-4o":                            128_000,
+}
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local rápida: ~4 bytes UTF-8 por token, sem tokenizer."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+def context_budget(model: str, cap: int | None = None) -> int:
+    """Tokens de prompt permitidos para `model`, limitados por `cap`."""
+    limit = MODEL_CONTEXT.get(model, DEFAULT_CONTEXT) - RESPONSE_RESERVE
+    return max(1024, min(limit, cap or CONTEXT_BUDGET))
+
+class ContextWindow:
+    """Escolhe quais turnos vão em cada requisição.
+
+    Mantém uma janela deslizante dos turnos mais recentes que cabe no
+    orçamento do modelo (sempre começando numa pergunta do usuário) e,
+    opcionalmente, antepõe um resumo extrativo dos turnos que ficaram de
+    fora. O resumo é montado localmente e guardado por chat, então cada
+    requisição só processa os turnos que saíram da janela desde a última.
+    """
+    SUMMARY_SHARE = 0.15   # fração do orçamento reservada ao resumo
+    SUMMARY_LINE  = 160
+
+    def __init__(self):
+        self._summaries: dict[str, tuple[int, list[str]]] = {}
+
+    def build(self, cid: str, history: Conversation | list[Message], budget: int,
+              summarize: bool = True) -> tuple[list[Message], dict]:
+        reserve = int(budget * self.SUMMARY_SHARE) if summarize else 0
+        start, used = len(history), 0
+        # Do mais novo para o mais antigo: custo proporcional à janela, não ao chat
+        while start > 0:
+            cost = history[start - 1].tokens
+            if start < len(history) and used + cost > budget - reserve:
+                break
+            start -= 1
+            used  += cost
+        while start < len(history) - 1 and history[start].role != "user":
+            used  -= history[start].tokens
+            start += 1
+
+        messages = history[start:]
+        info = {
+            "tokens": used, "budget": budget, "kept": len(messages),
+            "total": len(history), "summary": False,
+        }
+        if start and summarize:
+            summary = self._summary(cid, history, start, reserve)
+            if summary:
+                messages = [Message("user", summary)] + messages
+                info["tokens"] += MSG_TOKENS + estimate_tokens(summary)
+                info["summary"] = True
+        return messages, info
+
+    def forget(self, cid: str):
+        self._summaries.pop(cid, None)
+
+    def _summary(self, cid: str, history: Conversation | list[Message], upto: int, reserve: int) -> str:
+        done, lines = self._summaries.get(cid, (0, []))
+        if done > upto:
+            done, lines = 0, []
+        for msg in history[done:upto]:
+            text = msg.text.strip()
+            if not text:
+                continue
+            first = text.splitlines()[0]
+            first = first.split(". ")[0][:self.SUMMARY_LINE]
+            lines.append(f"- {first}" if msg.role == "user" else f"  ↳ {first}")
+        self._summaries[cid] = (upto, lines)
+
+        head = "[Resumo dos turnos anteriores desta conversa]"
+        picked, cost = [], estimate_tokens(head) + MSG_TOKENS
+        for line in reversed(lines):
+            cost += estimate_tokens(line) + 1
+            if cost > reserve:
+                break
+            picked.append(line)
+        while picked and not picked[-1].startswith("- "):
+            picked.pop()          # não começa com uma resposta órfã
+        if not picked:
+            return ""
+        return head + "\n" + "\n".join(reversed(picked))
+
+# â”€â”€ Response cache â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+CACHE_DIR     = os.path.expanduser("~/.gemini_cache")
+CACHE_MAX_MB  = 64
+CACHE_MAX_AGE = 7 * 86400   # segundos sem uso até a entrada expirar
+
+def request_key(provider: str, model: str, temperature, messages: list[Message]) -> str:
+    """Endereço de uma requisição: hash do que de fato vai para o provedor."""
+    blob = json.dumps(
+        [provider, model, temperature, [m.wire() for m in messages]],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=20).hexdigest()
+
+class ResponseCache:
+    """Cache local de respostas, endereçado por conteúdo.
+
+    Cada resposta é um arquivo `<chave>.json` em `root`, com a chave vinda
+    de `request_key`. O índice em memória (tamanho e último uso por chave)
+    é montado no primeiro acesso. Acertos renovam o mtime do arquivo;
+    entradas sem uso há mais de `max_age` expiram, e `put` descarta as
+    usadas há mais tempo quando o total passa de `max_bytes`. É usado pela
+    janela e pelo loop de I/O, daí o lock.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_MB << 20,
+                 max_age: float = CACHE_MAX_AGE):
+        self._root      = root
+        self._max_bytes = max_bytes
+        self._max_age   = max_age
+        self._lock      = threading.Lock()
+        self._index: dict[str, list] | None = None   # chave -> [bytes, último uso]
+        self._total     = 0
+        self.hits       = 0
+        self.misses     = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._root, key + ".json")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(key)
+            now   = time.time()
+            if entry is not None and now - entry[1] > self._max_age:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                try:
+                    with open(self._path(key), "r", encoding="utf-8") as fh:
+                        text = json.load(fh)["text"]
+                    os.utime(self._path(key), (now, now))
+                except (OSError, ValueError, KeyError):
+                    self._drop(key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry[1]   = now
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        data = json.dumps({"text": text, "created": time.time()}, ensure_ascii=False)
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            try:
+                os.makedirs(self._root, exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as fh:
+                    fh.write(data)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                return
+            old = self._index.get(key)
+            if old is not None:
+                self._total -= old[0]
+            size = len(data.encode("utf-8"))
+            self._index[key] = [size, time.time()]
+            self._total += size
+            self._evict()
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index, self._total = {}, 0
+        try:
+            scan = list(os.scandir(self._root))
+        except OSError:
+            scan = []
+        for e in scan:
+            if e.name.endswith(".json") and e.is_file():
+                st = e.stat()
+                self._index[e.name[:-5]] = [st.st_size, st.st_mtime]
+                self._total += st.st_size
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (_, used) in self._index.items() if now - used > self._max_age]:
+            self._drop(key)
+        if self._total <= self._max_bytes:
+            return
+        for key in sorted(self._index, key=lambda k: self._index[k][1]):
+            if self._total <= self._max_bytes:
+                break
+            self._drop(key)
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total -= entry[0]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+# â”€â”€ Dispatch policy â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+RETRY_STATUS   = frozenset({429, 500, 502, 503, 504})
+RETRY_ATTEMPTS = 2       # novas tentativas no mesmo modelo antes do fallback
+RETRY_BASE     = 0.5     # segundos; dobra a cada tentativa
+RETRY_MAX_WAIT = 20.0    # Retry-After maior que isso vai direto para o fallback
+
+# Usados quando a config não define "fallback_models"
+FALLBACK_MODELS = {
+    "Google Gemini": ["gemini-2.0-flash-lite", "gemini-1.5-flash"],
+    "OpenRouter": [
+        "meta-llama/llama-3.3-70b-instruct:free",
+        "google/gemini-2.0-flash-exp:free",
+        "mistralai/mistral-7b-instruct:free",
+    ],
+}
+
+def provider_key(config: dict, provider: str) -> str | None:
+    """API key de `provider`: a principal ou a guardada em "api_keys"."""
+    if provider == config.get("provider", "Google Gemini"):
+        return config.get("api_key")
+    return (config.get("api_keys") or {}).get(provider)
+
+class RetryableError(Exception):
+    """Falha transitória (429, 5xx, timeout, conexão): vale repetir ou trocar de modelo."""
+
+    def __init__(self, message: str, status: int | None = None,
+                 retry_after: float | None = None):
+        super().__init__(message)
+        self.status      = status
+        self.retry_after = retry_after
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After em segundos, aceitando tanto número quanto data HTTP."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Backoff exponencial com jitter; nunca antes do que o servidor pediu."""
+    delay = RETRY_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+    return max(delay, retry_after or 0.0)
+
+class CircuitBreaker:
+    """Disjuntor por (provedor, modelo).
+
+    Conta requisições, não tentativas: depois de `threshold` requisições
+    seguidas que falharam mesmo com as novas tentativas, o modelo fica
+    aberto (pulado) por `cooldown` segundos. Passado o prazo ele fica
+    meio-aberto e `allow` deixa passar uma única requisição de teste;
+    sucesso fecha o disjuntor, falha o reabre com o dobro do prazo (até
+    `max_cooldown`). Só é usado dentro do loop de I/O.
+    """
+
+    PROBE_WAIT = 1.0   # espera sugerida enquanto o teste não volta
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0):
+        self._threshold    = threshold
+        self._cooldown     = cooldown
+        self._max_cooldown = max_cooldown
+        # chave -> [falhas, aberto até, cooldown, teste em voo]
+        self._state: dict[tuple, list] = {}
+
+    def allow(self, key: tuple) -> bool:
+        """Se a requisição pode ir; no meio-aberto, a que recebe True é o teste."""
+        st = self._state.get(key)
+        if st is None or st[0] < self._threshold:
+            return True
+        if st[3] or time.monotonic() < st[1]:
+            return False
+        st[3] = True
+        return True
+
+    def remaining(self, key: tuple) -> float:
+        """Segundos até o modelo voltar a ser tentado (0 se liberado)."""
+        st = self._state.get(key)
+        if st is None or st[0] < self._threshold:
+            return 0.0
+        if st[3]:
+            return self.PROBE_WAIT
+        return max(0.0, st[1] - time.monotonic())
+
+    def record(self, key: tuple, ok: bool | None):
+        """Resultado de uma requisição: True fecha, False conta uma falha e
+        None (cancelada, erro que não é do modelo) só libera o teste."""
+        if ok:
+            self._state.pop(key, None)
+            return
+        st = self._state.get(key)
+        if ok is None:
+            if st is not None:
+                st[3] = False
+            return
+        if st is None:
+            st = self._state[key] = [0, 0.0, self._cooldown, False]
+        st[0] += 1
+        if st[3]:
+            # O teste falhou: reabre com o dobro do prazo
+            st[2] = min(st[2] * 2, self._max_cooldown)
+            st[1] = time.monotonic() + st[2]
+            st[3] = False
+        elif st[0] == self._threshold:
+            st[1] = time.monotonic() + st[2]
+
+# â”€â”€ Metrics â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+# Tempos em ms contados a partir do envio (retries inclusos), exceto
+# connect/tls, que são a duração de cada fase. connect inclui o DNS: o
+# httpcore resolve o nome dentro do connect_tcp e não expõe as fases
+# separadas. Vazios quando não se aplicam (conexão reaproveitada, Gemini).
+METRIC_FIELDS = (
+    "time", "provider", "model", "stream", "status", "retries",
+    "connect_ms", "tls_ms", "ttfb_ms", "ttft_ms", "total_ms",
+    "tokens_out", "tokens_per_s", "request_bytes", "response_bytes",
+)
+
+class MetricsLog:
+    """Últimas requisições medidas, para o painel e para exportação."""
+
+    def __init__(self, maxlen: int = 1000):
+        self._records: deque[dict] = deque(maxlen=maxlen)
+
+    def add(self, record: dict):
+        self._records.append({f: record.get(f) for f in METRIC_FIELDS})
+
+    def records(self) -> list[dict]:
+        return list(self._records)
+
+    def by_model(self) -> list[tuple[str, dict]]:
+        """Médias por modelo das requisições concluídas, do mais usado ao menos."""
+        groups: dict[str, list[dict]] = {}
+        for rec in self._records:
+            if rec["status"] == "ok":
+                groups.setdefault(rec["model"], []).append(rec)
+
+        def mean(recs, field):
+            vals = [r[field] for r in recs if r[field] is not None]
+            return sum(vals) / len(vals) if vals else None
+
+        out = [
+            (model, {
+                "n":            len(recs),
+                "ttft_ms":      mean(recs, "ttft_ms"),
+                "total_ms":     mean(recs, "total_ms"),
+                "tokens_per_s": mean(recs, "tokens_per_s"),
+            })
+            for model, recs in groups.items()
+        ]
+        out.sort(key=lambda item: -item[1]["n"])
+        return out
+
+    def export(self, path: str):
+        """Grava em CSV se `path` termina em .csv, senão em JSON."""
+        records = self.records()
+        with open(path, "w", encoding="utf-8", newline="") as fh:
+            if path.lower().endswith(".csv"):
+                writer = csv.DictWriter(fh, fieldnames=METRIC_FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+            else:
+                json.dump(records, fh, ensure_ascii=False, indent=2)
+
+# â”€â”€ Provider clients â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class ProviderClients:
+    """Motor de I/O dos provedores.
+
+    Um único event loop asyncio, numa thread de fundo, é dono de todas as
+    conexões: um `httpx.AsyncClient` keep-alive (pool e retry de conexão)
+    e um `genai.Client` por API key, além do `CircuitBreaker` compartilhado
+    pelas gerações. Cada requisição é uma task desse
+    loop, então vários chats podem ter gerações em andamento ao mesmo
+    tempo e o cancelamento é cooperativo. Pertence à `GeminiWindow`;
+    `reset()` descarta as conexões quando a configuração muda e `close()`
+    encerra o loop.
+    """
+
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self._loop:   asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._http:   httpx.AsyncClient | None = None
+        self._genai:  dict[str, genai.Client] = {}
+        self.breaker  = CircuitBreaker()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop   = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="provider-io", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Agenda `coro` no loop de I/O; pode ser chamado de qualquer thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    @property
+    def http(self) -> "httpx.AsyncClient":
+        # Só é tocado dentro do loop, que serializa o acesso
+        if self._http is None:
+            # retries= repete só falhas de conexão, nunca uma geração que
+            # já chegou ao servidor
+            transport = httpx.AsyncHTTPTransport(
+                retries=3,
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+            )
+            self._http = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                headers={
+                    "HTTP-Referer": "https://nebulaai.app",
+                    "X-Title":      "NebulaAI",
+                },
+            )
+        return self._http
+
+    def genai_client(self, api_key: str) -> "genai.Client":
+        with self._lock:
+            client = self._genai.get(api_key)
+            if client is None:
+                client = self._genai[api_key] = genai.Client(api_key=api_key)
+            return client
+
+    def reset(self) -> concurrent.futures.Future | None:
+        """Fecha as conexões; a próxima requisição recria tudo."""
+        with self._lock:
+            clients, self._genai = self._genai, {}
+            loop = self._loop
+        if loop is None:
+            return None
+        return self.submit(self._close_clients(list(clients.values())))
+
+    async def _close_clients(self, clients: list):
+        http, self._http = self._http, None
+        if http is not None:
+            await http.aclose()
+        for client in clients:
+            try:
+                await client.aio.aclose()
+                client.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self, timeout: float = 2.0):
+        """Cancela as tasks pendentes, fecha as conexões e para o loop de I/O."""
+        pending = self.reset()
+        if pending is None:
+            return
+        try:
+            pending.result(timeout)
+            self.submit(self._cancel_tasks()).result(timeout)
+        except Exception:
+            pass
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+# â”€â”€ Worker â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class GeminiWorker(QObject):
+    """Uma geração, executada como task no loop de `ProviderClients`.
+
+    `start()` só agenda a task, sem criar thread. Os eventos saem da
+    thread de I/O por um sinal interno e são repassados na thread da
+    janela, onde `abort()` já os descarta; cancelar a task fecha o stream
+    HTTP no meio da leitura.
+
+    Falhas transitórias são repetidas com backoff e, esgotadas as
+    tentativas, a geração passa para o próximo modelo de `_targets()`,
+    pulando os que estão com o disjuntor aberto. `rerouted` avisa qual
+    modelo assumiu. Depois do primeiro chunk não há mais troca: o erro
+    vai para `errored`, sempre como texto puro (quem exibe escapa).
+
+    Ao terminar, mesmo cancelada ou com erro, `measured` entrega as
+    medições da requisição com os campos de `METRIC_FIELDS`.
+    """
+    chunk    = pyqtSignal(str)
+    finished = pyqtSignal(str)
+    errored  = pyqtSignal(str)
+    rerouted = pyqtSignal(str)
+    measured = pyqtSignal(dict)
+    _event   = pyqtSignal(str, str)
+
+    def __init__(self, config: dict, history: list[Message], stream: bool | None = None,
+                 clients: ProviderClients | None = None):
+        super().__init__()
+        self._config  = config
+        self._history = history
+        self._clients = clients or ProviderClients()
+        self._stream  = config.get("stream", True) if stream is None else stream
+        self._abort   = False
+        self._emitted = False
+        self._future: concurrent.futures.Future | None = None
+        self.retries  = 0
+        self.metrics: dict = {}
+        self._t0      = 0.0
+        self._usage   = None   # tokens de saída informados pelo provedor
+        self._phase_start = 0.0
+        self._event.connect(self._deliver)
+
+    def start(self):
+        self._future = self._clients.submit(self._run())
+
+    def isRunning(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def abort(self):
+        """Cancela a task: o `async with` do stream fecha a conexão, o que
+        também interrompe a geração no provedor. Não espera o término."""
+        self._abort = True
+        if self._future is not None:
+            self._future.cancel()
+
+    def _ms_since_start(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 1)
+
+    def _emit(self, kind: str, text: str):
+        if kind == "chunk":
+            self._emitted = True
+        if kind in ("chunk", "finished") and self.metrics.get("ttft_ms") is None:
+            self.metrics["ttft_ms"] = self._ms_since_start()
+        if kind == "finished":
+            self._measure_output(text)
+        if not self._abort:
+            self._event.emit(kind, text)
+
+    def _deliver(self, kind: str, text: str):
+        if self._abort:
+            return
+        getattr(self, kind).emit(text)
+
+    def _targets(self) -> list[dict]:
+        """Modelo escolhido seguido dos fallbacks, sem repetições.
+
+        `fallback_models` na config aceita nomes de modelo do mesmo
+        provedor ou dicts `{"provider", "model", "api_key"}`; um provedor
+        diferente sem `api_key` própria (nem em "api_keys") é ignorado.
+        """
+        provider = self._config.get("provider", "Google Gemini")
+        api_key  = self._config["api_key"]
+        targets  = [{"provider": provider, "model": self._config["model"], "api_key": api_key}]
+        seen     = {(provider, self._config["model"])}
+
+        fallbacks = self._config.get("fallback_models")
+        if fallbacks is None:
+            fallbacks = FALLBACK_MODELS.get(provider, [])
+        for fb in fallbacks:
+            if isinstance(fb, str):
+                fb = {"model": fb}
+            fb_provider = fb.get("provider", provider)
+            fb_key      = fb.get("api_key") or provider_key(self._config, fb_provider)
+            if not fb_key or not fb.get("model") or (fb_provider, fb["model"]) in seen:
+                continue
+            seen.add((fb_provider, fb["model"]))
+            targets.append({"provider": fb_provider, "model": fb["model"], "api_key": fb_key})
+        return targets
+
+    def _measure_output(self, text: str):
+        m = self.metrics
+        m["total_ms"]   = self._ms_since_start()
+        m["tokens_out"] = self._usage or estimate_tokens(text or "")
+        # Ritmo da geração em si: do primeiro token ao último
+        gen_s = (m["total_ms"] - m["ttft_ms"]) / 1000 if self._stream else m["total_ms"] / 1000
+        if gen_s > 0:
+            m["tokens_per_s"] = round(m["tokens_out"] / gen_s, 1)
+
+    async def _trace(self, event: str, info: dict):
+        """Gancho de trace do httpx: duração de connect/TLS e o TTFB."""
+        now  = time.perf_counter()
+        name, _, phase = event.rpartition(".")
+        if phase == "started":
+            self._phase_start = now
+        elif phase == "complete":
+            if name == "connection.connect_tcp":
+                self.metrics["connect_ms"] = round((now - self._phase_start) * 1000, 1)
+            elif name == "connection.start_tls":
+                self.metrics["tls_ms"] = round((now - self._phase_start) * 1000, 1)
+            elif name.endswith("receive_response_headers"):
+                self.metrics["ttfb_ms"] = self._ms_since_start()
+
+    async def _run(self):
+        self._t0     = time.perf_counter()
+        self.metrics = dict.fromkeys(METRIC_FIELDS)
+        self.metrics.update(
+            time=datetime.now().isoformat(timespec="seconds"),
+            stream=self._stream, request_bytes=0, response_bytes=0,
+        )
+        status = "error"
+        try:
+            await self._dispatch()
+            status = "ok"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            self._emit("errored", str(e))
+        finally:
+            self.metrics["status"]  = status
+            self.metrics["retries"] = self.retries
+            if self.metrics["total_ms"] is None:
+                self.metrics["total_ms"] = self._ms_since_start()
+            self.measured.emit(dict(self.metrics))
+
+    async def _dispatch(self):
+        breaker = self._clients.breaker
+        last    = None
+        for n, target in enumerate(self._targets()):
+            key = (target["provider"], target["model"])
+            if not breaker.allow(key):
+                last = last or Exception(
+                    f"{target['model']} falhou várias vezes seguidas; nova tentativa em "
+                    f"{breaker.remaining(key):.0f}s."
+                )
+                continue
+            if n:
+                self._emit("rerouted", target["model"])
+            self.metrics.update(provider=target["provider"], model=target["model"])
+
+            ok = None
+            try:
+                for attempt in range(RETRY_ATTEMPTS + 1):
+                    self._usage = None
+                    try:
+                        if target["provider"] == "Google Gemini":
+                            await self._run_gemini(target)
+                        else:
+                            await self._run_openrouter(target)
+                        ok = True
+                        return
+                    except RetryableError as e:
+                        last = e
+                        if self._emitted:
+                            ok = False
+                            raise
+                        if (attempt == RETRY_ATTEMPTS or breaker.remaining(key)
+                                or (e.retry_after or 0.0) > RETRY_MAX_WAIT):
+                            break
+                        self.retries += 1
+                        await asyncio.sleep(backoff_delay(attempt, e.retry_after))
+                ok = False
+            finally:
+                # Uma falha por requisição: as novas tentativas não contam à parte
+                breaker.record(key, ok)
+        raise last or Exception("Nenhum modelo disponível.")
+
+    async def _run_gemini(self, target: dict):
+        client = self._clients.genai_client(target["api_key"]).aio
+        gen    = ({"temperature": self._config["temperature"]}
+                  if "temperature" in self._config else None)
+        contents = [m.wire() for m in self._history]
+        # O SDK não expõe o transporte: tamanhos aproximados pelo JSON/texto
+        self.metrics["request_bytes"] += len(json.dumps(contents, ensure_ascii=False).encode("utf-8"))
+        try:
+            if not self._stream:
+                res = await client.models.generate_content(
+                    model=target["model"],
+                    contents=contents,
+                    config=gen
+                )
+                self._gemini_usage(res)
+                self.metrics["response_bytes"] += len((res.text or "").encode("utf-8"))
+                self._emit("finished", res.text)
+                return
+
+            parts = []
+            # aclosing: ao cancelar, o stream é fechado na hora e não só no GC
+            async with contextlib.aclosing(await client.models.generate_content_stream(
+                model=target["model"],
+                contents=contents,
+                config=gen
+            )) as stream:
+                async for piece in stream:
+                    self._gemini_usage(piece)
+                    if piece.text:
+                        parts.append(piece.text)
+                        self.metrics["response_bytes"] += len(piece.text.encode("utf-8"))
+                        self._emit("chunk", piece.text)
+            self._emit("finished", "".join(parts))
+
+        except genai_errors.APIError as e:
+            if e.code in RETRY_STATUS:
+                headers = getattr(e.response, "headers", None) or {}
+                raise RetryableError(
+                    str(e), e.code, parse_retry_after(headers.get("retry-after"))
+                ) from e
+            raise
+        except httpx.TransportError as e:
+            raise RetryableError(f"Erro de conexão: {e}") from e
+
+    def _gemini_usage(self, res):
+        usage = getattr(res, "usage_metadata", None)
+        if usage is not None and usage.candidates_token_count:
+            self._usage = usage.candidates_token_count
+
+    def _openrouter_request(self, target: dict) -> tuple[dict, dict]:
+        messages = [
+            {"role": "user" if m.role == "user" else "assistant", "content": m.text}
+            for m in self._history
+        ]
+
+        headers = {
+            "Authorization": f"Bearer {target['api_key']}",
+            "Content-Type":  "application/json",
+        }
+
+        payload = {
+            "model": target["model"],
+            "messages": messages,
+            "temperature": self._config.get("temperature", 0.7),
+        }
+        if self._stream:
+            payload["stream"] = True
+        return headers, payload
+
+    @staticmethod
+    def _check_status(resp):
+        if resp.status_code == 401:
+            raise Exception("API Key invÃ¡lida ou expirada. Verifique em openrouter.ai/keys")
+        elif resp.status_code == 402:
+            raise Exception("CrÃ©ditos insuficientes. Adicione crÃ©ditos em openrouter.ai/credits")
+        elif resp.status_code == 429:
+            raise RetryableError(
+                "Rate limit atingido. Aguarde alguns segundos e tente novamente.",
+                429, parse_retry_after(resp.headers.get("retry-after")),
+            )
+        elif resp.status_code != 200:
+            error = (RetryableError if resp.status_code in RETRY_STATUS else Exception)
+            try:
+                error_msg = resp.json().get("error", {}).get("message", resp.text)
+            except ValueError:
+                raise error(f"Erro HTTP {resp.status_code}: {resp.text[:200]}")
+            raise error(f"Erro {resp.status_code}: {error_msg}")
+
+    async def _run_openrouter(self, target: dict):
+        headers, payload = self._openrouter_request(target)
+        http = self._clients.http
+        url  = openrouter_url(self._config)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        ext  = {"trace": self._trace}
+        self.metrics["request_bytes"] += len(body)
+
+        try:
+            if self._stream:
+                async with http.stream(
+                    "POST", url, headers=headers, content=body, extensions=ext
+                ) as resp:
+                    try:
+                        if resp.status_code != 200:
+                            await resp.aread()
+                        self._check_status(resp)
+                        await self._read_sse(resp)
+                    finally:
+                        self.metrics["response_bytes"] += resp.num_bytes_downloaded
+                return
+
+            resp = await http.post(url, headers=headers, content=body, extensions=ext)
+            self.metrics["response_bytes"] += resp.num_bytes_downloaded
+            self._check_status(resp)
+
+            data = resp.json()
+            self._usage = (data.get("usage") or {}).get("completion_tokens")
+
+            if "error" in data:
+                raise Exception(f"OpenRouter error: {data['error'].get('message', 'Unknown error')}")
+
+            if "choices" not in data or not data["choices"]:
+                raise Exception("Resposta vazia da API. Tente outro modelo.")
+
+            text = data["choices"][0]["message"]["content"]
+            self._emit("finished", text)
+
+        except RetryableError:
+            raise
+        except httpx.TimeoutException:
+            raise RetryableError("Timeout: OpenRouter demorou demais para responder. Tente novamente.")
+        except httpx.TransportError:
+            raise RetryableError("Erro de conexÃ£o: Verifique sua internet.")
+        except Exception as e:
+            if "API Key" in str(e) or "Erro" in str(e):
+                raise
+            raise Exception(f"Erro na requisiÃ§Ã£o: {str(e)}")
+
+    async def _read_sse(self, resp):
+        """Consome o stream SSE do OpenRouter emitindo `chunk` a cada delta."""
+        # text/event-stream sem charset: não depender do palpite do cliente
+        resp.encoding = "utf-8"
+        parts = []
+        async for line in resp.aiter_lines():
+            # Linhas vazias separam eventos; ":" são keep-alives do OpenRouter
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                raise Exception(f"OpenRouter error: {event['error'].get('message', 'Unknown error')}")
+            if event.get("usage"):
+                self._usage = event["usage"].get("completion_tokens")
+            choices = event.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                parts.append(delta)
+                self._emit("chunk", delta)
+
+        if not parts:
+            raise Exception("Resposta vazia da API. Tente outro modelo.")
+        self._emit("finished", "".join(parts))
+
+# â”€â”€ Session titles â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+TITLE_MODELS = {
+    "Google Gemini": "gemini-2.0-flash-lite",
+    "OpenRouter":    "meta-llama/llama-3.1-8b-instruct:free",
+}
+TITLE_TIMEOUT = 10
+TITLE_LEN     = 22
+
+_STOPWORDS = frozenset("""
+    a o as os um uma uns umas de do da dos das em no na nos nas num numa por
+    pelo pela para pra com sem sobre entre até e ou mas que se como qual quais
+    quando onde porque porquê é são ser estar está estou sou tem ter há eu tu
+    você voce vocês me mim meu minha meus minhas seu sua isso isto esse essa
+    este esta aquilo ao aos à às lhe já não sim muito mais menos bem favor
+    pode poderia quero queria gostaria preciso faça faço fazer oi olá ola obrigado
+    explique explica mostre diga escreva ajude
+    the an of to in on for with and or is are be was how what why which can
+    could would you your i my me it this that do does please hi hello
+""".split())
+_WORD    = re.compile(r"[^\W\d_][\w'-]*")
+_BAD_FS  = re.compile(r'[\\/:*?"<>|`\x00-\x1f]')
+
+def heuristic_title(text: str, max_words: int = 3) -> str:
+    """Título offline: as palavras-chave mais frequentes da mensagem.
+
+    Descarta stopwords (pt/en), ordena por frequência com a primeira
+    ocorrência como desempate e devolve as escolhidas na ordem do texto.
+    """
+    words = _WORD.findall(text[:2000])
+    keys  = [w for w in words if len(w) > 2 and w.lower() not in _STOPWORDS] or words
+    first: dict[str, tuple[int, str]] = {}
+    freq  = Counter()
+    for i, w in enumerate(keys):
+        low = w.lower()
+        freq[low] += 1
+        first.setdefault(low, (i, w))
+    top = sorted(first, key=lambda w: (-freq[w], first[w][0]))[:max_words]
+    top.sort(key=lambda w: first[w][0])
+    title = " ".join(first[w][1] for w in top)
+    return title[:1].upper() + title[1:]
+
+def clean_title(name: str) -> str:
+    """Deixa um título sugerido seguro para virar nome de arquivo."""
+    name = _BAD_FS.sub("", name.replace("*", "")).replace(".", "")
+    name = " ".join(name.split())
+    if len(name) > TITLE_LEN:
+        cut  = name[:TITLE_LEN + 1]
+        name = cut.rsplit(" ", 1)[0] if " " in cut else name[:TITLE_LEN]
+    return name.strip()
+
+class TitleJobs(QObject):
+    """Fila de fundo que dá nome às sessões novas.
+
+    Os pedidos são atendidos um por vez por uma task no loop de
+    `ProviderClients`, usando um modelo barato (`title_model` na config
+    ou `TITLE_MODELS`). Sem API key, com `auto_title: "local"` ou se a
+    chamada falhar, o nome sai de `heuristic_title`, então toda sessão
+    recebe um título. O resultado chega à thread da janela por `named`.
+    """
+    named = pyqtSignal(str, str)
+
+    def __init__(self, clients: ProviderClients, cache: ResponseCache | None = None):
+        super().__init__()
+        self._clients = clients
+        self._cache   = cache
+        self._queue: asyncio.Queue | None = None
+        self._task:  asyncio.Task | None  = None
+
+    def submit(self, cid: str, first_msg: str, config: dict):
+        job = (cid, first_msg, dict(config))
+        self._clients.loop.call_soon_threadsafe(self._enqueue, job)
+
+    def _enqueue(self, job: tuple):
+        # Roda no loop; recria a fila se o loop foi reiniciado
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task  = asyncio.get_running_loop().create_task(self._drain())
+        self._queue.put_nowait(job)
+
+    async def _drain(self):
+        while True:
+            cid, text, config = await self._queue.get()
+            title = ""
+            if config.get("api_key") and config.get("auto_title") != "local":
+                try:
+                    title = clean_title(
+                        await asyncio.wait_for(self._ask(text, config), TITLE_TIMEOUT)
+                    )
+                except Exception as e:
+                    logger.warning("Auto-nome falhou (%r); usando título local", e)
+            self.named.emit(cid, title or clean_title(heuristic_title(text)))
+
+    async def _ask(self, text: str, config: dict) -> str:
+        provider = config.get("provider", "Google Gemini")
+        model    = config.get("title_model") or TITLE_MODELS.get(provider) or config.get("model")
+        prompt   = f"Resuma em 2-3 palavras (sem pontuação): {text[:1000]}"
+        key      = None
+        if self._cache is not None and config.get("response_cache", True):
+            key = request_key(provider, model, None, [Message("user", prompt)])
+            # O cache lê e grava em disco: fora do loop, que serve os streams
+            hit = await asyncio.to_thread(self._cache.get, key)
+            if hit is not None:
+                return hit
+
+        title = await self._request(provider, model, prompt, config)
+        if key is not None:
+            await asyncio.to_thread(self._cache.put, key, title)
+        return title
+
+    async def _request(self, provider: str, model: str, prompt: str, config: dict) -> str:
+        if provider == "OpenRouter":
+            resp = await self._clients.http.post(
+                openrouter_url(config),
+                headers={"Authorization": f"Bearer {config['api_key']}"},
+                json={
+                    "model":      model,
+                    "messages":   [{"role": "user", "content": prompt}],
+                    "max_tokens": 16,
+                },
+                timeout=TITLE_TIMEOUT,
+            )
+            resp.raise_for_status()
+            return resp.json()["choices"][0]["message"]["content"]
+
+        client = self._clients.genai_client(config["api_key"]).aio
+        res    = await client.models.generate_content(
+            model=model, contents=prompt, config={"max_output_tokens": 16}
+        )
+        return res.text or ""
+
+# â”€â”€ Pulsing dots â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class ThinkingDots(QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._dots = 0
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._tick)
+        self.setStyleSheet(
+            f"color:{C_ACCENT}; font-weight:bold; font-size:13px; margin-left:22px;"
+        )
+        self.hide()
+
+    def start(self):
+        self._dots = 0
+        self._timer.start(400)
+        self.show()
+
+    def stop(self):
+        self._timer.stop()
+        self.hide()
+
+    def _tick(self):
+        self._dots = (self._dots + 1) % 4
+        self.setText("â— Pensando" + "." * self._dots)
+
+# â”€â”€ Metrics panel â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class MetricsPanel(QFrame):
+    """Painel recolhível com as últimas requisições e médias por modelo."""
+    ROWS = 8
+
+    def __init__(self, log: MetricsLog, store: ChatStore | None = None, parent=None):
+        super().__init__(parent)
+        self._log   = log
+        self._store = store
+        self.setStyleSheet(
+            f"QFrame {{ background:{C_BG_SURF}; border-radius:12px; }}"
+            f"QLabel {{ color:{C_TEXT}; font-size:11px; border:none; }}"
+        )
+        lay = QVBoxLayout(self)
+        lay.setContentsMargins(14, 10, 14, 10)
+        lay.setSpacing(6)
+
+        self.table = QLabel()
+        self.table.setTextFormat(Qt.TextFormat.RichText)
+        self.table.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        lay.addWidget(self.table)
+
+        row = QHBoxLayout()
+        row.addStretch()
+        for label, ext in (("Exportar CSV", "csv"), ("Exportar JSON", "json")):
+            btn = QPushButton(label)
+            btn.setCursor(Qt.CursorShape.PointingHandCursor)
+            btn.clicked.connect(lambda _=False, ext=ext: self._export(ext))
+            btn.setStyleSheet(
+                f"QPushButton {{ background:{C_BG_INPUT}; color:white; border-radius:8px;"
+                f" border:none; padding:4px 12px; font-size:11px; }}"
+                f"QPushButton:hover {{ background:{C_ACCENT}; color:{C_BG_SIDE}; }}"
+            )
+            row.addWidget(btn)
+        lay.addLayout(row)
+        self.hide()
+
+    @staticmethod
+    def _fmt(value, digits: int = 0) -> str:
+        if value is None:
+            return "—"
+        return f"{value:.{digits}f}"
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        th = f"style='color:{C_SUBTEXT}; padding:0 8px 2px 0; text-align:left;'"
+        td = "style='padding:0 8px 0 0;'"
+
+        def table(head, rows):
+            out = "<tr>" + "".join(f"<th {th}>{h}</th>" for h in head) + "</tr>"
+            for r in rows:
+                out += "<tr>" + "".join(f"<td {td}>{html.escape(str(c))}</td>" for c in r) + "</tr>"
+            return f"<table cellspacing='0'>{out}</table>"
+
+        recent = [
+            (
+                (r["model"] or "")[-30:], r["status"],
+                self._fmt(r["connect_ms"]), self._fmt(r["tls_ms"]),
+                self._fmt(r["ttfb_ms"]), self._fmt(r["ttft_ms"]), self._fmt(r["total_ms"]),
+                self._fmt(r["tokens_per_s"], 1),
+                f"{self._fmt(r['request_bytes'] / 1024, 1)}/{self._fmt(r['response_bytes'] / 1024, 1)}",
+                r["retries"],
+            )
+            for r in reversed(self._log.records()[-self.ROWS:])
+        ]
+        models = [
+            (model[-30:], avg["n"], self._fmt(avg["ttft_ms"]),
+             self._fmt(avg["total_ms"]), self._fmt(avg["tokens_per_s"], 1))
+            for model, avg in self._log.by_model()
+        ]
+        paint   = STARTUP.marks.get("first_paint")
+        color   = C_RED if paint is not None and paint > STARTUP_BUDGET_MS else C_SUBTEXT
+        startup = f"<span style='color:{color};'>Startup: {html.escape(STARTUP.summary())}</span>"
+        if self._store is not None and len(self._store.archive):
+            startup += f"<br><span style='color:{C_SUBTEXT};'>{html.escape(self._archive_line())}</span>"
+        if not recent:
+            self.table.setText(
+                f"<span style='color:{C_SUBTEXT};'>Nenhuma requisição medida ainda.</span><br>{startup}"
+            )
+            return
+        self.table.setText(
+            table(("Modelo", "Status", "Conexão ms", "TLS ms", "TTFB ms", "TTFT ms",
+                   "Total ms", "tok/s", "KB ↑/↓", "Retries"), recent)
+            + "<br>"
+            + table(("Médias por modelo", "n", "TTFT ms", "Total ms", "tok/s"), models)
+            + f"<br>{startup}"
+        )
+
+    def _archive_line(self) -> str:
+        def mb(n):
+            return f"{n / (1 << 20):.1f} MB"
+
+        st  = self._store.archive_stats()
+        cut = 1 - st["disk_bytes"] / st["raw_bytes"] if st["raw_bytes"] else 0.0
+        return (
+            f"Arquivo: {st['chats']} chats · {mb(st['raw_bytes'])} → {mb(st['disk_bytes'])}"
+            f" (−{cut:.0%}) · abrir ≈ {self._fmt(st['open_ms'], 1)} ms"
+        )
+
+    def _export(self, ext: str):
+        default = os.path.join(os.path.expanduser("~"), f"nebula_metrics.{ext}")
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Exportar métricas", default, f"{ext.upper()} (*.{ext})"
+        )
+        if path:
+            self._log.export(path)
+
+# â”€â”€ Compare panel â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+COMPARE_FPS = 30
+
+class ComparePanel(QFrame):
+    """Colunas lado a lado de uma `FanOutSession` em modo "compare".
+
+    Cada coluna mostra o modelo, a resposta em markdown e as medições
+    (TTFT, tempo total, tokens e tok/s); "Usar esta" emite `picked` com o
+    índice da coluna. Um chunk só marca a coluna como suja: o timer
+    redesenha no máximo COMPARE_FPS vezes por segundo, em vez de
+    renderizar de novo o markdown inteiro a cada delta de cada modelo.
+    """
+    picked = pyqtSignal(int)
+
+    STATUS = {
+        "waiting":   "aguardando",
+        "streaming": "gerando",
+        "done":      "pronta",
+        "error":     "erro",
+        "cancelled": "cancelada",
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.session: FanOutSession | None = None
+        self._cols:  list[tuple[QLabel, QTextBrowser, QLabel, QPushButton]] = []
+        self._shown: list[str | None] = []
+        self._dirty: set[int]  = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(1000 // COMPARE_FPS)
+        self._timer.timeout.connect(self._flush)
+        self.setStyleSheet(
+            f"QFrame#Column {{ background:{C_BG_SURF}; border-radius:12px; }}"
+            f"QLabel {{ color:{C_SUBTEXT}; font-size:11px; border:none; }}"
+            f"QTextBrowser {{ background:transparent; border:none; color:{C_TEXT}; font-size:13px; }}"
+            f"QScrollBar:vertical {{ background:{C_BG_SURF}; width:5px; border-radius:3px; }}"
+            f"QScrollBar::handle:vertical {{ background:{C_BG_INPUT}; border-radius:3px; }}"
+            f"QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{ height:0; }}"
+        )
+        self._lay = QHBoxLayout(self)
+        self._lay.setContentsMargins(20, 4, 20, 4)
+        self._lay.setSpacing(10)
+        self.hide()
+
+    def bind(self, session: "FanOutSession"):
+        self.unbind()
+        self.session = session
+        for i, col in enumerate(session.columns):
+            frame = QFrame()
+            frame.setObjectName("Column")
+            lay = QVBoxLayout(frame)
+            lay.setContentsMargins(12, 10, 12, 10)
+            lay.setSpacing(6)
+
+            head = QLabel()
+            head.setTextFormat(Qt.TextFormat.RichText)
+            body = QTextBrowser()
+            body.setOpenExternalLinks(True)
+            foot = QLabel()
+            btn  = QPushButton("Usar esta")
+            btn.setCursor(Qt.CursorShape.PointingHandCursor)
+            btn.clicked.connect(lambda _=False, i=i: self.picked.emit(i))
+            btn.setStyleSheet(
+                f"QPushButton {{ background:{C_BG_INPUT}; color:white; border-radius:8px;"
+                f" border:none; padding:4px 12px; font-size:11px; }}"
+                f"QPushButton:hover {{ background:{C_ACCENT}; color:{C_BG_SIDE}; }}"
+                f"QPushButton:disabled {{ color:{C_SUBTEXT}; }}"
+            )
+            lay.addWidget(head)
+            lay.addWidget(body)
+            lay.addWidget(foot)
+            lay.addWidget(btn)
+            self._lay.addWidget(frame)
+            self._cols.append((head, body, foot, btn))
+            self._shown.append(None)
+        self._dirty = set(range(len(self._cols)))
+        self._flush()
+        self.show()
+
+    def unbind(self):
+        self._timer.stop()
+        self.session = None
+        while self._lay.count():
+            self._lay.takeAt(0).widget().deleteLater()
+        self._cols, self._shown = [], []
+        self._dirty.clear()
+        self.hide()
+
+    def refresh(self, i: int):
+        self._dirty.add(i)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        if self.session is None:
+            return
+        columns = self.session.columns
+        ttfts   = [c["ttft_ms"] for c in columns if c["ttft_ms"] is not None]
+        fastest = min(ttfts) if ttfts else None
+        for i, col in enumerate(columns):
+            # O ⚡ pode mudar de coluna, então os cabeçalhos são sempre refeitos
+            mark = " ⚡" if fastest is not None and col["ttft_ms"] == fastest else ""
+            self._cols[i][0].setText(
+                f"<b style='color:{C_TEXT};'>{html.escape(col['model'])}</b>"
+                f" <span style='color:{C_SUBTEXT};'>{html.escape(col['provider'])}</span>{mark}"
+            )
+        for i in sorted(self._dirty):
+            _, body, foot, btn = self._cols[i]
+            col = columns[i]
+            shown = col["text"] if col["status"] != "error" else "\0" + col["error"]
+            if shown != self._shown[i]:
+                self._shown[i] = shown
+                bar    = body.verticalScrollBar()
+                at_end = bar.value() >= bar.maximum() - 4
+                if col["status"] == "error":
+                    body.setHtml(f"<span style='color:{C_RED};'>{html.escape(col['error'])}</span>")
+                else:
+                    body.setHtml(render_markdown(col["text"]))
+                if at_end:
+                    bar.setValue(bar.maximum())
+            foot.setText(self._metrics_text(col))
+            btn.setEnabled(col["status"] == "done")
+        self._dirty.clear()
+
+    @classmethod
+    def _metrics_text(cls, col: dict) -> str:
+        m     = col["metrics"] or {}
+        parts = [cls.STATUS[col["status"]]]
+        ttft  = m.get("ttft_ms") or col["ttft_ms"]
+        if ttft is not None:
+            parts.append(f"TTFT {ttft:.0f} ms")
+        if m.get("total_ms") is not None:
+            parts.append(f"{m['total_ms'] / 1000:.1f} s")
+        tokens = m.get("tokens_out") or (estimate_tokens(col["text"]) if col["text"] else None)
+        if tokens:
+            parts.append(f"{tokens} tok")
+        if m.get("tokens_per_s"):
+            parts.append(f"{m['tokens_per_s']:.0f} tok/s")
+        return " · ".join(parts)
+
+# â”€â”€ Typing renderer â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+TYPING_CPS = 1500
+
+class TypingRenderer(QObject):
+    """Escreve a resposta no chat em lotes, uma vez por frame.
+
+    O texto chega por `feed()` (chunks do stream ou a resposta inteira) e
+    é despejado a cada frame respeitando um orçamento de caracteres por
+    segundo. Depois de `close()`, quando o buffer esvazia, o texto cru é
+    trocado no lugar pelo markdown renderizado e `done` é emitido.
+    """
+    done = pyqtSignal(str)
+
+    def __init__(self, view: "TranscriptView", parent=None):
+        super().__init__(parent)
+        self._view    = view
+        self._timer   = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(16)
+        self._timer.timeout.connect(self._frame)
+        self._enabled = True
+        self._cps     = TYPING_CPS
+        self._reset()
+
+    def _reset(self):
+        self._text    = ""
+        self._pending = ""
+        self._active  = False
+        self._closed  = False
+        self._carry   = 0.0
+        self._last    = 0.0
+
+    def configure(self, enabled: bool = True, cps: int = TYPING_CPS, fps: float = 60.0):
+        self._enabled = enabled
+        self._cps     = max(0, int(cps))
+        self._timer.setInterval(max(4, round(1000 / (fps or 60.0))))
+
+    def is_active(self) -> bool:
+        return self._active
+
+    def begin(self, shown: str = ""):
+        """Começa uma resposta; a view já deve ter aberto a linha ao vivo.
+
+        `shown` é o que chegou enquanto o chat estava fora da tela: entra
+        de uma vez, sem animação.
+        """
+        self._reset()
+        self._active = True
+        self._last   = time.perf_counter()
+        if shown:
+            self._text = shown
+            self._view.live_append(shown)
+
+    def feed(self, text: str):
+        self._text    += text
+        self._pending += text
+        if not self._timer.isActive():
+            self._last = time.perf_counter()
+            self._timer.start()
+
+    def close(self, text: str | None = None):
+        """Sem mais chunks; `text` substitui o acumulado se vier completo."""
+        if text is not None and text != self._text:
+            shown = len(self._text) - len(self._pending)
+            self._text    = text
+            self._pending = text[shown:]
+        self._closed = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def stop(self) -> str:
+        """Interrompe a renderização, fixa na view tudo o que já chegou e
+        devolve esse texto parcial."""
+        self._timer.stop()
+        text = self._text
+        if self._active:
+            self._view.live_finish(text)
+        self._reset()
+        return text
+
+    def detach(self):
+        """Larga a resposta sem tocar na view (o chat saiu da tela)."""
+        self._timer.stop()
+        self._reset()
+
+    def _frame(self):
+        now = time.perf_counter()
+        dt, self._last = now - self._last, now
+
+        if self._enabled and self._cps:
+            budget = self._carry + self._cps * dt
+            n = min(int(budget), len(self._pending))
+            self._carry = budget - n if len(self._pending) > n else 0.0
+        else:
+            n = len(self._pending)
 
-# â”€â”€ Catppuccin Mocha â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-C_ACCENT   = "#cba6f7"
-C_ACCENT2  = "#89b4fa"
-C_BG_SIDE  = "#11111b"
-C_BG_MAIN  = "#1e1e2e"
-C_BG_SURF  = "#181825"
-C_BG_INPUT = "#313244"
-C_BUBBLE_U = "#45475a"
-C_TEXT     = "#cdd6f4"
-C_SUBTEXT  = "#6c7086"
-C_RED      = "#f38ba8"
-C_GREEN    = "#a6e3a1"
-C_YELLOW   = "#f9e2af"
-C_TEAL     = "#94e2d5"
+        # Já fechado e nada exibido ainda: pula o texto cru, vai direto pro markdown
+        if self._closed and n == len(self._pending) == len(self._text):
+            n, self._pending = 0, ""
 
-CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".gemini_nebula_config.json")
-CHATS_DIR   = os.path.expanduser("~/.gemini_chats")
-os.makedirs(CHATS_DIR, exist_ok=True)
+        if n:
+            self._view.live_append(self._pending[:n])
+            self._pending = self._pending[n:]
 
-PROVIDERS = ["OpenRouter", "Google Gemini"]
+        if self._closed and not self._pending:
+            self._timer.stop()
+            text = self._text
+            self._view.live_finish(text)
+            self._reset()
+            self.done.emit(text)
 
-GEMINI_MODELS = [
-    "gemini-2.0-flash",
-    "gemini-2.0-flash-lite",
-    "gemini-1.5-pro",
-    "gemini-1.5-flash",
-]
+# â”€â”€ Transcript â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class TranscriptModel(QAbstractListModel):
+    """Linhas exibidas do chat aberto, paginadas a partir do fim.
 
-OPENROUTER_MODELS = [
-    "openrouter/qwen/qwen3.6-plus:free",
-    "google/gemini-2.0-flash-exp:free",
-    "google/gemini-flash-1.5",
-    "meta-llama/llama-3.3-70b-instruct:free",
-    "meta-llama/llama-3.1-8b-instruct:free",
-    "mistralai/mistral-7b-instruct:free",
-    "deepseek/deepseek-chat",
-    "anthropic/claude-3.5-haiku",
-    "openai/gpt-4o-mini",
-    "openai/gpt-4o",
-]
+    Só as últimas `PAGE` mensagens do histórico entram no modelo; as mais
+    antigas são trazidas em páginas por `fetch_older()` quando a rolagem
+    chega ao topo. Avisos do app (/key, erros...) e a resposta em
+    andamento são linhas extras que não fazem parte do histórico.
+    """
+    PAGE    = 40
+    RowRole = Qt.ItemDataRole.UserRole + 1
 
-OPENROUTER_BASE = "https://openrouter.ai/api/v1/chat/completions"
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows:    list[dict] = []
+        self._history: Conversation | list = []
+        self._first = 0
+        self._color = C_GREEN
+        self._seq   = 0
 
-# â”€â”€ Config â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-def save_config(data: dict):
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(data, f)
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
 
-def load_config() -> dict | None:
-    if os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "r") as f:
-                return json.load(f)
-        except Exception:
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
             return None
-    return None
+        row = self._rows[index.row()]
+        if role == self.RowRole:
+            return row
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row["text"]
+        return None
 
-# â”€â”€ Markdown-lite â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-def render_markdown(text: str) -> str:
-    text = re.sub(
-        r'```(?:\w+)?\n?(.*?)```',
-        lambda m: (
-            f'<pre style="background:#181825;color:{C_TEAL};padding:10px;'
-            f'border-radius:8px;font-family:monospace;white-space:pre-wrap;">'
-            f'{m.group(1).strip()}</pre>'
-        ),
-        text, flags=re.DOTALL
-    )
-    text = re.sub(
-        r'`([^`]+)`',
-        rf'<code style="background:#181825;color:{C_TEAL};padding:2px 5px;'
-        rf'border-radius:4px;font-family:monospace;">\1</code>',
-        text
-    )
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'\*(.+?)\*', r'<i>\1</i>', text)
-    text = text.replace('\n', '<br>')
-    return text
+    def _row(self, kind: str, text: str = "", html: str | None = None, **extra) -> dict:
+        self._seq += 1
+        return {"key": self._seq, "ver": 0, "kind": kind, "text": text, "html": html, **extra}
 
-# â”€â”€ Worker â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-class GeminiWorker(QThread):
-    finished = pyqtSignal(str)
-    errored  = pyqtSignal(str)
+    def _from_msg(self, msg: Message) -> dict:
+        if msg.role == "user":
+            return self._row("user", msg.text)
+        return self._row("model", msg.text, color=self._color, model="")
 
-    def __init__(self, config: dict, history: list):
-        super().__init__()
-        self._config  = config
+    def load(self, history: Conversation, color: str = C_GREEN):
+        self.beginResetModel()
         self._history = history
-        self._abort   = False
+        self._color   = color
+        self._first   = max(0, len(history) - self.PAGE)
+        self._rows    = [self._from_msg(m) for m in history[self._first:]]
+        self.endResetModel()
 
-    def abort(self):
-        self._abort = True
-        self.terminate()
+    def can_fetch_older(self) -> bool:
+        return self._first > 0
 
-    def run(self):
-        provider = self._config.get("provider", "Google Gemini")
-        try:
-            if provider == "Google Gemini":
-                self._run_gemini()
+    def row_of(self, seq: int) -> int:
+        """Linha da mensagem `seq` do histórico, trazendo as páginas até ela."""
+        if not 0 <= seq < len(self._history):
+            return -1
+        while self._first > seq and self.fetch_older():
+            pass
+        return seq - self._first
+
+    def fetch_older(self) -> int:
+        n = min(self.PAGE, self._first)
+        if not n:
+            return 0
+        older = [self._from_msg(m) for m in self._history[self._first - n:self._first]]
+        self.beginInsertRows(QModelIndex(), 0, n - 1)
+        self._rows[0:0] = older
+        self._first -= n
+        self.endInsertRows()
+        return n
+
+    def add(self, kind: str, text: str = "", html: str | None = None, **extra) -> dict:
+        row = self._row(kind, text, html, **extra)
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows))
+        self._rows.append(row)
+        self.endInsertRows()
+        return row
+
+    def changed(self, row: dict):
+        """Invalida o layout em cache de `row` e avisa a view."""
+        row["ver"] += 1
+        # A linha alterada é quase sempre a última (resposta em andamento)
+        for i in range(len(self._rows) - 1, -1, -1):
+            if self._rows[i] is row:
+                idx = self.index(i)
+                self.dataChanged.emit(idx, idx)
+                return
+
+
+class MessageDelegate(QStyledItemDelegate):
+    """Desenha cada mensagem a partir de um QTextDocument próprio.
+
+    O HTML de cada linha é gerado uma vez e guardado na própria linha;
+    os documentos já diagramados ficam num LRU por (linha, versão,
+    largura) e as alturas num dicionário, então rolar não re-renderiza
+    markdown e só as linhas visíveis mantêm documento em memória.
+    """
+    MARGIN_X = 24
+    GAP      = 10
+    MAX_DOCS = 150
+
+    def __init__(self, view: QListView):
+        super().__init__(view)
+        self._view = view
+        self._docs: OrderedDict[tuple, QTextDocument] = OrderedDict()
+        # key da linha -> (ver, largura, altura): uma entrada por linha, não por versão
+        self._heights: dict[int, tuple[int, int, int]] = {}
+
+    def clear_cache(self):
+        self._docs.clear()
+        self._heights.clear()
+
+    def _width(self) -> int:
+        return max(100, self._view.viewport().width() - 2 * self.MARGIN_X)
+
+    @staticmethod
+    def row_html(row: dict) -> str:
+        if row["html"] is None:
+            text = row["text"]
+            if row["kind"] == "user":
+                body = html.escape(text).replace("\n", "<br>")
+                row["html"] = (
+                    f"<div style='background:{C_BUBBLE_U}; padding:12px 16px;"
+                    f" border-radius:14px; margin-bottom:6px;'>"
+                    f"<b style='color:{C_ACCENT2};'>VOCÃŠ</b><br>{body}</div>"
+                )
             else:
-                self._run_openrouter()
-        except Exception as e:
-            if not self._abort:
-                self.errored.emit(str(e))
+                model = (
+                    f" <span style='color:{C_SUBTEXT}; font-size:11px;'>({row['model']})</span>"
+                    if row.get("model") else ""
+                )
+                row["html"] = (
+                    f"<b style='color:{row.get('color', C_GREEN)};'>IA</b>{model}<br>"
+                    f"{render_markdown(text)}"
+                )
+        return row["html"]
+
+    def _doc(self, row: dict, width: int) -> QTextDocument:
+        live = row.get("doc")
+        if live is not None:
+            live.setTextWidth(width)
+            return live
+        key = (row["key"], row["ver"], width)
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = QTextDocument()
+            doc.setDefaultFont(self._view.font())
+            doc.setHtml(self.row_html(row))
+            doc.setTextWidth(width)
+            self._docs[key] = doc
+            if len(self._docs) > self.MAX_DOCS:
+                self._docs.popitem(last=False)
+        else:
+            self._docs.move_to_end(key)
+        return doc
+
+    def sizeHint(self, option, index) -> QSize:
+        row   = index.data(TranscriptModel.RowRole)
+        width = self._width()
+        stamp = (row["ver"], width)
+        cached = None if row.get("doc") is not None else self._heights.get(row["key"])
+        if cached is not None and cached[:2] == stamp:
+            h = cached[2]
+        else:
+            h = math.ceil(self._doc(row, width).size().height())
+            if row.get("doc") is None:
+                self._heights[row["key"]] = (*stamp, h)
+        return QSize(width, h + self.GAP)
+
+    def paint(self, painter: QPainter, option, index):
+        row = index.data(TranscriptModel.RowRole)
+        doc = self._doc(row, self._width())
+        painter.save()
+        painter.translate(option.rect.left() + self.MARGIN_X, option.rect.top())
+        ctx = QAbstractTextDocumentLayout.PaintContext()
+        ctx.palette.setColor(QPalette.ColorRole.Text, QColor(C_TEXT))
+        ctx.clip = QRectF(0, 0, doc.textWidth(), option.rect.height())
+        painter.setClipRect(ctx.clip)
+        doc.documentLayout().draw(painter, ctx)
+        painter.restore()
 
-    def _run_gemini(self):
-        client = genai.Client(api_key=self._config["api_key"])
-        res = client.models.generate_content(
-            model=self._config["model"],
-            contents=self._history
+    def anchor_at(self, index: QModelIndex, pos) -> str:
+        rect = self._view.visualRect(index)
+        doc  = self._doc(index.data(TranscriptModel.RowRole), self._width())
+        return doc.documentLayout().anchorAt(
+            QPointF(pos.x() - rect.left() - self.MARGIN_X, pos.y() - rect.top())
         )
-        if not self._abort:
-            self.finished.emit(res.text)
 
-    def _run_openrouter(self):
-        messages = []
-        for msg in self._history:
-            role    = "user" if msg["role"] == "user" else "assistant"
-            content = msg["parts"][0]["text"] if msg.get("parts") else ""
-            messages.append({"role": role, "content": content})
 
-        headers = {
-            "Authorization": f"Bearer {self._config['api_key']}",
-            "Content-Type":  "application/json",
-            "HTTP-Referer":  "https://nebulaai.app",
-            "X-Title":       "NebulaAI",
-        }
-        
-        payload = {
-            "model": self._config["model"],
-            "messages": messages,
-            "temperature": 0.7,
-        }
-        
-        try:
-            resp = requests.post(
-                OPENROUTER_BASE,
-                headers=headers,
-                json=payload,
-                timeout=120
-            )
-            
-            # Log para debug
-            print(f"OpenRouter status: {resp.status_code}")
-            print(f"Response: {resp.text[:500]}")
-            
-            if resp.status_code == 401:
-                raise Exception("API Key invÃ¡lida ou expirada. Verifique em openrouter.ai/keys")
-            elif resp.status_code == 402:
-                raise Exception("CrÃ©ditos insuficientes. Adicione crÃ©ditos em openrouter.ai/credits")
-            elif resp.status_code == 429:
-                raise Exception("Rate limit atingido. Aguarde alguns segundos e tente novamente.")
-            elif resp.status_code != 200:
-                try:
-                    error_data = resp.json()
-                    error_msg = error_data.get("error", {}).get("message", resp.text)
-                    raise Exception(f"Erro {resp.status_code}: {error_msg}")
-                except:
-                    raise Exception(f"Erro HTTP {resp.status_code}: {resp.text[:200]}")
-            
-            data = resp.json()
-            
-            if "error" in data:
-                raise Exception(f"OpenRouter error: {data['error'].get('message', 'Unknown error')}")
-            
-            if "choices" not in data or not data["choices"]:
-                raise Exception("Resposta vazia da API. Tente outro modelo.")
-            
-            text = data["choices"][0]["message"]["content"]
-            if not self._abort:
-                self.finished.emit(text)
-                
-        except requests.exceptions.Timeout:
-            raise Exception("Timeout: OpenRouter demorou demais para responder. Tente novamente.")
-        except requests.exceptions.ConnectionError:
-            raise Exception("Erro de conexÃ£o: Verifique sua internet.")
-        except Exception as e:
-            if "API Key" in str(e) or "Erro" in str(e):
-                raise
-            raise Exception(f"Erro na requisiÃ§Ã£o: {str(e)}")
+class TranscriptView(QListView):
+    """Histórico do chat virtualizado: só as linhas visíveis são pintadas.
+
+    Substitui o QTextEdit único. Mensagens antigas entram em páginas ao
+    rolar para o topo, mantendo a posição; a resposta em andamento é uma
+    linha com QTextDocument próprio, que recebe o texto incrementalmente.
+    """
 
-# â”€â”€ Pulsing dots â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-class ThinkingDots(QLabel):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._dots = 0
-        self._timer = QTimer(self)
-        self._timer.timeout.connect(self._tick)
-        self.setStyleSheet(
-            f"color:{C_ACCENT}; font-weight:bold; font-size:13px; margin-left:22px;"
+        self._model    = TranscriptModel(self)
+        self._delegate = MessageDelegate(self)
+        self._live: dict | None = None
+        self.setModel(self._model)
+        self.setItemDelegate(self._delegate)
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.setMouseTracking(True)
+        self.setContextMenuPolicy(Qt.ContextMenuPolicy.DefaultContextMenu)
+        self.verticalScrollBar().setSingleStep(24)
+        self.verticalScrollBar().valueChanged.connect(self._maybe_fetch_older)
+
+    # Conteúdo
+    def clear(self):
+        self._live = None
+        self._delegate.clear_cache()
+        self._model.load([])
+
+    def load(self, history: Conversation, color: str = C_GREEN):
+        self._live = None
+        self._delegate.clear_cache()
+        self._model.load(history, color)
+        self.scroll_to_end()
+
+    def append(self, html_text: str):
+        """Aviso do app em HTML (não vai para o histórico)."""
+        self._model.add("html", html=html_text)
+        self.scroll_to_end()
+
+    def add_message(self, role: str, text: str, color: str = C_GREEN, model: str = ""):
+        self._model.add("user" if role == "user" else "model", text, color=color, model=model)
+        self.scroll_to_end()
+
+    # Resposta em andamento
+    def begin_live(self, color: str, model: str):
+        doc = QTextDocument(self)
+        doc.setDefaultFont(self.font())
+        doc.setHtml(
+            f"<b style='color:{color};'>IA</b> "
+            f"<span style='color:{C_SUBTEXT}; font-size:11px;'>({model})</span><br>"
         )
-        self.hide()
+        self._live = self._model.add("model", "", color=color, model=model, doc=doc)
+        self.scroll_to_end()
 
-    def start(self):
-        self._dots = 0
-        self._timer.start(400)
-        self.show()
+    def live_append(self, text: str):
+        if self._live is None:
+            return
+        pinned = self.is_pinned()
+        cursor = QTextCursor(self._live["doc"])
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self._live["text"] += text
+        self._model.changed(self._live)
+        self.doItemsLayout()
+        if pinned:
+            self.scrollToBottom()
 
-    def stop(self):
-        self._timer.stop()
-        self.hide()
+    def live_finish(self, text: str):
+        """Troca o texto cru pelo markdown renderizado, no lugar."""
+        if self._live is None:
+            return
+        pinned = self.is_pinned()
+        row, self._live = self._live, None
+        row.pop("doc").deleteLater()
+        row["text"], row["html"] = text, None
+        self._model.changed(row)
+        self.doItemsLayout()
+        if pinned:
+            self.scrollToBottom()
 
-    def _tick(self):
-        self._dots = (self._dots + 1) % 4
-        self.setText("â— Pensando" + "." * self._dots)
+    # Rolagem
+    def reveal(self, seq: int):
+        """Rola até a mensagem `seq` do histórico (resultado de busca)."""
+        row = self._model.row_of(seq)
+        if row < 0:
+            return
+        self.doItemsLayout()
+        self.scrollTo(self._model.index(row), QListView.ScrollHint.PositionAtTop)
+
+    def is_pinned(self) -> bool:
+        sb = self.verticalScrollBar()
+        return sb.value() >= sb.maximum() - 4
+
+    def scroll_to_end(self):
+        self.doItemsLayout()
+        self.scrollToBottom()
+
+    def _maybe_fetch_older(self, value: int):
+        if value > 0 or not self._model.can_fetch_older():
+            return
+        sb = self.verticalScrollBar()
+        old_max = sb.maximum()
+        self._model.fetch_older()
+        self.doItemsLayout()
+        sb.setValue(sb.maximum() - old_max)
+
+    # Interação
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        # Larguras antigas não voltam tão cedo: evita acumular documentos
+        self._delegate.clear_cache()
+
+    def mouseReleaseEvent(self, e):
+        index = self.indexAt(e.position().toPoint())
+        if index.isValid() and e.button() == Qt.MouseButton.LeftButton:
+            href = self._delegate.anchor_at(index, e.position().toPoint())
+            if href:
+                QDesktopServices.openUrl(QUrl(href))
+                return
+        super().mouseReleaseEvent(e)
+
+    def mouseMoveEvent(self, e):
+        index = self.indexAt(e.position().toPoint())
+        over_link = index.isValid() and self._delegate.anchor_at(index, e.position().toPoint())
+        self.viewport().setCursor(
+            Qt.CursorShape.PointingHandCursor if over_link else Qt.CursorShape.ArrowCursor
+        )
+        super().mouseMoveEvent(e)
+
+    def contextMenuEvent(self, e):
+        index = self.indexAt(e.pos())
+        if not index.isValid():
+            return
+        menu = QMenu(self)
+        menu.addAction("Copiar mensagem", lambda: QApplication.clipboard().setText(index.data()))
+        menu.exec(e.globalPos())
+
+    def keyPressEvent(self, e):
+        if e.matches(QKeySequence.StandardKey.Copy) and self.currentIndex().isValid():
+            QApplication.clipboard().setText(self.currentIndex().data())
+            return
+        super().keyPressEvent(e)
+
+# â”€â”€ Sidebar chat list â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class ChatListModel(QAbstractListModel):
+    """Lista de chats da sidebar, do mais recente para o mais antigo.
+
+    Alimentada pelo `ChatIndex` e atualizada por operações pontuais
+    (inserir no topo, remover, renomear, mover pro topo), sem recriar a
+    lista inteira. O mapa id -> linha é refeito só quando a ordem muda.
+    """
+    ActiveRole = Qt.ItemDataRole.UserRole + 1
+    StateRole  = Qt.ItemDataRole.UserRole + 2   # "busy", "unread" ou None
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._ids:  list[str] = []
+        self._meta: dict[str, dict] = {}
+        self._rows: dict[str, int] | None = {}
+        self._active: str | None = None
+        self._state: dict[str, str] = {}
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        cid = self._ids[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return cid
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._meta.get(cid, {}).get("preview") or None
+        if role == self.ActiveRole:
+            return cid == self._active
+        if role == self.StateRole:
+            return self._state.get(cid)
+        return None
+
+    def chat_id(self, index: QModelIndex) -> str:
+        return self._ids[index.row()]
+
+    def row_of(self, cid: str) -> int:
+        if self._rows is None:
+            self._rows = {c: r for r, c in enumerate(self._ids)}
+        return self._rows.get(cid, -1)
+
+    def reset(self, entries: list[tuple[str, dict]]):
+        self.beginResetModel()
+        self._ids  = [cid for cid, _ in entries]
+        self._meta = dict(entries)
+        self._rows = None
+        self.endResetModel()
+
+    def insert_top(self, cid: str, meta: dict | None = None):
+        if self.row_of(cid) >= 0:
+            self.move_to_top(cid, meta)
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._ids.insert(0, cid)
+        self._meta[cid] = meta or {}
+        self._rows = None
+        self.endInsertRows()
 
-# â”€â”€ Sidebar chat item â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-class ChatItemWidget(QWidget):
+    def remove(self, cid: str):
+        row = self.row_of(cid)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._ids[row]
+        self._meta.pop(cid, None)
+        self._state.pop(cid, None)
+        self._rows = None
+        self.endRemoveRows()
+
+    def rename(self, old: str, new: str):
+        row = self.row_of(old)
+        if row < 0:
+            return
+        self._ids[row] = new
+        self._meta[new] = self._meta.pop(old, {})
+        if old in self._state:
+            self._state[new] = self._state.pop(old)
+        self._rows.pop(old, None)
+        self._rows[new] = row
+        if self._active == old:
+            self._active = new
+        self._changed(row)
+
+    def move_to_top(self, cid: str, meta: dict | None = None):
+        row = self.row_of(cid)
+        if row < 0:
+            self.insert_top(cid, meta)
+            return
+        if meta is not None:
+            self._meta[cid] = meta
+        if row > 0:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), 0)
+            del self._ids[row]
+            self._ids.insert(0, cid)
+            self._rows = None
+            self.endMoveRows()
+        self._changed(0)
+
+    def set_active(self, cid: str | None):
+        old, self._active = self._active, cid
+        for c in (old, cid):
+            if c is not None and self.row_of(c) >= 0:
+                self._changed(self.row_of(c))
+
+    def set_state(self, cid: str, state: str | None):
+        if self._state.get(cid) == state:
+            return
+        if state is None:
+            self._state.pop(cid, None)
+        else:
+            self._state[cid] = state
+        if self.row_of(cid) >= 0:
+            self._changed(self.row_of(cid))
+
+    def _changed(self, row: int):
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx)
+
+
+class ChatItemDelegate(QStyledItemDelegate):
+    """Desenha cada linha da sidebar (nome + botão ✕) sem widgets por item."""
     delete_requested = pyqtSignal(str)
     selected         = pyqtSignal(str)
 
-    def __init__(self, chat_id: str, active: bool = False):
-        super().__init__()
-        self.chat_id = chat_id
-        self.setCursor(Qt.CursorShape.PointingHandCursor)
-        lay = QHBoxLayout(self)
-        lay.setContentsMargins(12, 6, 6, 6)
-
-        name = chat_id[:17] + "â€¦" if len(chat_id) > 17 else chat_id
-        self.lbl = QLabel(name)
-        self.lbl.setStyleSheet(
-            f"color:{'white' if active else C_TEXT}; border:none; font-size:13px;"
-        )
-        btn_del = QPushButton("âœ•")
-        btn_del.setFixedSize(22, 22)
-        btn_del.setCursor(Qt.CursorShape.PointingHandCursor)
-        btn_del.setStyleSheet(
-            f"QPushButton {{ background:transparent; color:{C_RED}; border-radius:11px; border:none; }}"
-            f"QPushButton:hover {{ background:rgba(243,139,168,0.2); }}"
-        )
-        btn_del.clicked.connect(lambda: self.delete_requested.emit(self.chat_id))
-        lay.addWidget(self.lbl)
-        lay.addStretch()
-        lay.addWidget(btn_del)
-
-        bg = "rgba(203,166,247,0.12)" if active else "transparent"
-        self.setStyleSheet(f"ChatItemWidget {{ background:{bg}; border-radius:10px; }}")
+    ROW_H = 46
+    BTN   = 22
 
-    def mousePressEvent(self, e):
-        if e.button() == Qt.MouseButton.LeftButton:
-            self.selected.emit(self.chat_id)
+    def __init__(self, view: QListView):
+        super().__init__(view)
+        # Repinta no movimento do mouse para o hover do ✕ acompanhar o cursor
+        view.setMouseTracking(True)
+        view.viewport().installEventFilter(self)
+
+    def eventFilter(self, obj, event) -> bool:
+        if event.type() in (QEvent.Type.MouseMove, QEvent.Type.Leave):
+            obj.update()
+        return False
+
+    def sizeHint(self, option, index) -> QSize:
+        return QSize(0, self.ROW_H)
+
+    def _rects(self, option) -> tuple[QRect, QRect]:
+        r = option.rect.adjusted(2, 2, -2, -2)
+        btn = QRect(r.right() - 6 - self.BTN, r.center().y() - self.BTN // 2, self.BTN, self.BTN)
+        return r, btn
+
+    def paint(self, painter: QPainter, option, index):
+        r, btn = self._rects(option)
+        active = index.data(ChatListModel.ActiveRole)
+        hover  = bool(option.state & QStyle.StateFlag.State_MouseOver)
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        if active or hover:
+            painter.setBrush(QColor(203, 166, 247, 31 if active else 15))
+            painter.drawRoundedRect(QRectF(r), 10, 10)
+
+        if hover and option.widget is not None:
+            pos = option.widget.viewport().mapFromGlobal(QCursor.pos())
+            if btn.contains(pos):
+                painter.setBrush(QColor(243, 139, 168, 51))
+                painter.drawEllipse(QRectF(btn))
+
+        font = QFont(option.font)
+        font.setPixelSize(13)
+        painter.setFont(font)
+        painter.setPen(QColor("white" if active else C_TEXT))
+        text_r = QRect(r.left() + 12, r.top(), btn.left() - r.left() - 18, r.height())
+        # Resposta em andamento (lilás) ou pronta e ainda não vista (verde)
+        state = index.data(ChatListModel.StateRole)
+        if state:
+            painter.save()
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor(C_ACCENT if state == "busy" else C_GREEN))
+            painter.drawEllipse(QRectF(btn.left() - 14, r.center().y() - 3, 7, 7))
+            painter.restore()
+            text_r.setRight(text_r.right() - 14)
+        name = QFontMetrics(font).elidedText(
+            index.data(), Qt.TextElideMode.ElideRight, text_r.width()
+        )
+        painter.drawText(text_r, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, name)
+        painter.setPen(QColor(C_RED))
+        painter.drawText(btn, Qt.AlignmentFlag.AlignCenter, "✕")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index) -> bool:
+        if (event.type() == QEvent.Type.MouseButtonRelease
+                and event.button() == Qt.MouseButton.LeftButton):
+            cid = model.chat_id(index)
+            if self._rects(option)[1].contains(event.position().toPoint()):
+                self.delete_requested.emit(cid)
+            else:
+                self.selected.emit(cid)
+            return True
+        return False
+
+
+class SearchResultModel(QAbstractListModel):
+    """Resultados da busca global, já ordenados por relevância."""
+    ResultRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[dict] = []
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row["cid"]
+        if role == self.ResultRole:
+            return row
+        return None
+
+    def set_results(self, rows: list[dict]):
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+
+class SearchResultDelegate(QStyledItemDelegate):
+    """Nome do chat e trecho da mensagem com os termos em destaque."""
+    selected = pyqtSignal(str, int)
+
+    ROW_H = 64
+
+    def __init__(self, view: QListView):
+        super().__init__(view)
+        view.setMouseTracking(True)
+
+    def sizeHint(self, option, index) -> QSize:
+        return QSize(0, self.ROW_H)
+
+    def paint(self, painter: QPainter, option, index):
+        res = index.data(SearchResultModel.ResultRole)
+        r   = option.rect.adjusted(2, 2, -2, -2)
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if option.state & QStyle.StateFlag.State_MouseOver:
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor(203, 166, 247, 15))
+            painter.drawRoundedRect(QRectF(r), 10, 10)
+
+        font = QFont(option.font)
+        font.setPixelSize(12)
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(QColor(C_ACCENT if res["role"] == "user" else C_TEXT))
+        title_r = QRect(r.left() + 12, r.top() + 6, r.width() - 24, 16)
+        prefix  = "Você · " if res["role"] == "user" else "IA · "
+        painter.drawText(
+            title_r, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft,
+            QFontMetrics(font).elidedText(prefix + res["cid"], Qt.TextElideMode.ElideRight, title_r.width()),
+        )
+
+        doc = QTextDocument()
+        doc.setDocumentMargin(0)
+        small = QFont(option.font)
+        small.setPixelSize(11)
+        doc.setDefaultFont(small)
+        doc.setDefaultStyleSheet(f"b {{ color:{C_YELLOW}; }}")
+        doc.setHtml(f"<span style='color:{C_SUBTEXT};'>{res['snippet']}</span>")
+        doc.setTextWidth(r.width() - 24)
+        painter.translate(r.left() + 12, r.top() + 25)
+        clip = QRectF(0, 0, r.width() - 24, r.bottom() - r.top() - 29)
+        painter.setClipRect(clip)
+        ctx = QAbstractTextDocumentLayout.PaintContext()
+        ctx.clip = clip
+        doc.documentLayout().draw(painter, ctx)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index) -> bool:
+        if (event.type() == QEvent.Type.MouseButtonRelease
+                and event.button() == Qt.MouseButton.LeftButton):
+            res = index.data(SearchResultModel.ResultRole)
+            self.selected.emit(res["cid"], res["seq"])
+            return True
+        return False
 
 # â”€â”€ Settings Overlay â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 class SettingsOverlay(QWidget):
     """Overlay de configuraÃ§Ãµes que abre dentro da janela principal"""
     config_saved = pyqtSignal(dict)
+    _tested      = pyqtSignal(bool, str)
 
-    def __init__(self, parent, current: dict | None = None):
+    def __init__(self, parent, current: dict | None = None,
+                 clients: ProviderClients | None = None):
         super().__init__(parent)
         self._current = current or {}
+        self._clients = clients or ProviderClients()
         self._drag_pos = None
+        self._tested.connect(self._on_tested)
         self.setFixedSize(parent.size())
         # Translucent
         self.hide()
@@ -356,6 +3366,12 @@ class SettingsOverlay(QWidget):
         self.model_cb.setStyleSheet(self._combo_style())
         lay.addWidget(self.model_cb)
 
+        self.typing_chk = QCheckBox("Efeito de digitação")
+        self.typing_chk.setChecked(self._current.get("typing_effect", True))
+        self.typing_chk.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.typing_chk.setStyleSheet(f"QCheckBox {{ color:{C_TEXT}; border:none; font-size:13px; }}")
+        lay.addWidget(self.typing_chk)
+
         self.err_lbl = QLabel("")
         self.err_lbl.setStyleSheet(f"color:{C_RED}; border:none; font-size:12px;")
         self.err_lbl.hide()
@@ -410,48 +3426,37 @@ class SettingsOverlay(QWidget):
         self.test_btn.setText("â³ Testando...")
         self.err_lbl.hide()
         
-        provider = self.provider_cb.currentText()
-        import threading
-        
-        def test():
-            try:
-                if provider == "OpenRouter":
-                    resp = requests.get(
-                        "https://openrouter.ai/api/v1/auth/key",
-                        headers={"Authorization": f"Bearer {key}"},
-                        timeout=10
-                    )
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        credits = data.get("data", {}).get("credits", "N/A")
-                        msg = f"âœ… ConexÃ£o OK! CrÃ©ditos: {credits}"
-                        self._test_success(msg)
-                    else:
-                        self._test_fail(f"API Key invÃ¡lida (HTTP {resp.status_code})")
+        self._clients.submit(self._probe(self.provider_cb.currentText(), key))
+
+    async def _probe(self, provider: str, key: str):
+        """Roda no loop de I/O; o resultado volta à UI pelo sinal `_tested`."""
+        try:
+            if provider == "OpenRouter":
+                resp = await self._clients.http.get(
+                    openrouter_url(self._current, "auth/key"),
+                    headers={"Authorization": f"Bearer {key}"},
+                    timeout=10
+                )
+                if resp.status_code == 200:
+                    data = resp.json()
+                    credits = data.get("data", {}).get("credits", "N/A")
+                    self._tested.emit(True, f"âœ… ConexÃ£o OK! CrÃ©ditos: {credits}")
                 else:
-                    client = genai.Client(api_key=key)
-                    res = client.models.list()
-                    models = [str(m.id) for m in res.models if hasattr(m, 'id')]
-                    msg = f"âœ… ConexÃ£o OK! {len(models)} modelos disponÃ­veis."
-                    self._test_success(msg)
-            except Exception as e:
-                self._test_fail(str(e))
-        
-        threading.Thread(target=test, daemon=True).start()
-    
-    def _test_success(self, msg):
-        self.err_lbl.setStyleSheet(f"color:{C_GREEN}; border:none; font-size:12px;")
-        self.err_lbl.setText(msg)
-        self.err_lbl.show()
-        self.test_btn.setEnabled(True)
-        self.test_btn.setText("ðŸ” Testar ConexÃ£o")
-    
-    def _test_fail(self, msg):
-        self.err_lbl.setStyleSheet(f"color:{C_RED}; border:none; font-size:12px;")
-        self.err_lbl.setText(f"âŒ Erro: {msg}")
+                    self._tested.emit(False, f"API Key invÃ¡lida (HTTP {resp.status_code})")
+            else:
+                client = self._clients.genai_client(key).aio
+                models = [m async for m in await client.models.list()]
+                self._tested.emit(True, f"âœ… ConexÃ£o OK! {len(models)} modelos disponÃ­veis.")
+        except Exception as e:
+            self._tested.emit(False, str(e))
+
+    def _on_tested(self, ok: bool, msg: str):
+        color = C_GREEN if ok else C_RED
+        self.err_lbl.setStyleSheet(f"color:{color}; border:none; font-size:12px;")
+        self.err_lbl.setText(msg if ok else f"âŒ Erro: {msg}")
         self.err_lbl.show()
         self.test_btn.setEnabled(True)
-        self.test_btn.setText("ðŸ” Testar ConexÃ£o")
+        self.test_btn.setText("ðŸ” Testar ConexÃ£o")
 
     def _finish(self):
         key = self.api_input.text().strip()
@@ -459,40 +3464,252 @@ class SettingsOverlay(QWidget):
             self.err_lbl.setText("âš  Insira uma API Key vÃ¡lida.")
             self.err_lbl.show()
             return
-        cfg = {
-            "provider": self.provider_cb.currentText(),
-            "api_key":  key,
-            "model":    self.model_cb.currentText(),
-        }
-        save_config(cfg)
-        self.config_saved.emit(cfg)
-        self.close()
+        cfg = {
+            **self._current,
+            "provider":      self.provider_cb.currentText(),
+            "api_key":       key,
+            "model":         self.model_cb.currentText(),
+            "typing_effect": self.typing_chk.isChecked(),
+            # Uma chave por provedor, para fallbacks e fan-out entre provedores
+            "api_keys":      {**self._current.get("api_keys", {}), self.provider_cb.currentText(): key},
+        }
+        save_config(cfg)
+        self.config_saved.emit(cfg)
+        self.close()
+
+    def mousePressEvent(self, e):
+        if e.button() == Qt.MouseButton.LeftButton:
+            self._drag_pos = e.globalPosition().toPoint()
+
+    def mouseMoveEvent(self, e):
+        if e.buttons() == Qt.MouseButton.LeftButton and self._drag_pos:
+            self.move(self.pos() + e.globalPosition().toPoint() - self._drag_pos)
+            self._drag_pos = e.globalPosition().toPoint()
+
+# â”€â”€ Chat sessions â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+class ChatSession(QObject):
+    """Uma resposta em andamento num chat.
+
+    Cada chat esperando resposta tem a sua: worker, chave do cache,
+    modelo que está respondendo, o texto recebido até agora e os avisos
+    que ainda não foram mostrados. A janela só desenha a sessão do chat
+    visível; as outras acumulam o texto, que vai para a tela de uma vez
+    quando o chat é aberto. Os sinais levam a própria sessão, porque o
+    chat pode ter mudado de nome (ou saído da tela) desde o envio.
+    """
+    chunk    = pyqtSignal(object, str)
+    finished = pyqtSignal(object, str)
+    errored  = pyqtSignal(object, str)
+    rerouted = pyqtSignal(object, str)
+
+    def __init__(self, cid: str, model: str, parent=None):
+        super().__init__(parent)
+        self.cid       = cid
+        self.model     = model
+        self.requested = model              # o do envio; `model` muda num fallback
+        self.cache_key: str | None = None
+        self.text      = ""
+        self.final:    str | None = None   # resposta completa, ainda sendo digitada na tela
+        self.live      = False              # tem linha ao vivo na view
+        self.notices:  list[str] = []
+        self._worker:  GeminiWorker | None = None
+
+    def start(self, config: dict, prompt: list, clients: ProviderClients, measured):
+        worker = self._worker = GeminiWorker(config, prompt, clients=clients)
+        worker.chunk.connect(self._on_chunk)
+        worker.finished.connect(lambda text: self.finished.emit(self, text))
+        worker.errored.connect(lambda err: self.errored.emit(self, err))
+        worker.rerouted.connect(self._on_rerouted)
+        worker.measured.connect(measured)
+        worker.start()
+
+    def abort(self):
+        if self._worker is not None:
+            self._worker.abort()
+
+    @property
+    def metrics(self) -> dict:
+        """Medições do worker até aqui (as de saída já valem em `finished`)."""
+        if self._worker is None:
+            return {}
+        return {**self._worker.metrics, "retries": self._worker.retries}
+
+    def _on_chunk(self, text: str):
+        self.text += text
+        self.chunk.emit(self, text)
+
+    def _on_rerouted(self, model: str):
+        # Resposta de um fallback não vale como cache do modelo pedido
+        self.cache_key = None
+        self.model     = model
+        self.rerouted.emit(self, model)
+
+FANOUT_MAX      = 4   # modelos por envio, contando o do combo
+FANOUT_POLICIES = ("first-wins", "compare")
+
+def fanout_targets(config: dict) -> list[dict]:
+    """Modelo do combo seguido dos marcados em "fanout_models".
+
+    Cada item é um nome de modelo do provedor atual ou um dict
+    `{"provider", "model"}`; provedores sem API key conhecida ficam de
+    fora. Com "fanout" desligado a lista tem só o modelo do combo.
+    """
+    provider = config.get("provider", "Google Gemini")
+    targets  = [{"provider": provider, "model": config.get("model", ""), "api_key": config.get("api_key")}]
+    if config.get("fanout") not in FANOUT_POLICIES:
+        return targets
+    seen = {(provider, targets[0]["model"])}
+    for entry in config.get("fanout_models") or []:
+        if isinstance(entry, str):
+            entry = {"model": entry}
+        entry_provider = entry.get("provider", provider)
+        key = provider_key(config, entry_provider)
+        if not key or not entry.get("model") or (entry_provider, entry["model"]) in seen:
+            continue
+        seen.add((entry_provider, entry["model"]))
+        targets.append({"provider": entry_provider, "model": entry["model"], "api_key": key})
+        if len(targets) == FANOUT_MAX:
+            break
+    return targets
+
+class FanOutSession(ChatSession):
+    """O mesmo prompt enviado a vários modelos de uma vez.
+
+    Cada alvo de `fanout_targets()` ganha um `GeminiWorker` próprio, sem
+    fallback, para que dois ramos não acabem no mesmo modelo. Em
+    "first-wins" vence o primeiro ramo que produzir texto: os outros são
+    cancelados e dali em diante a sessão se comporta como uma
+    `ChatSession` comum, com `model` apontando para o vencedor. Em
+    "compare" todos vão até o fim, cada um na sua entrada de `columns`,
+    `updated` avisa qual coluna mudou e `settled` quando nenhuma está mais
+    em andamento; a resposta que vai para o histórico sai de `pick()`.
+    """
+    updated = pyqtSignal(object, int)
+    settled = pyqtSignal(object)
+
+    def __init__(self, cid: str, targets: list[dict], policy: str, parent=None):
+        super().__init__(cid, targets[0]["model"], parent)
+        self.policy  = policy
+        self.winner: int | None = None
+        self.columns = [
+            {"provider": t["provider"], "model": t["model"], "status": "waiting",
+             "text": "", "error": "", "ttft_ms": None, "metrics": None}
+            for t in targets
+        ]
+        self._targets = targets
+        self._workers: list[GeminiWorker] = []
+        self._t0      = 0.0
+
+    def start(self, config: dict, prompt: list, clients: ProviderClients, measured):
+        for i, target in enumerate(self._targets):
+            worker = GeminiWorker({**config, **target, "fallback_models": []}, prompt, clients=clients)
+            worker.chunk.connect(lambda text, i=i: self._on_branch_chunk(i, text))
+            worker.finished.connect(lambda text, i=i: self._on_branch_finished(i, text))
+            worker.errored.connect(lambda err, i=i: self._on_branch_error(i, err))
+            worker.measured.connect(measured)
+            self._workers.append(worker)
+        self._t0 = time.perf_counter()
+        for worker in self._workers:
+            worker.start()
+
+    def abort(self):
+        for worker in self._workers:
+            worker.abort()
+
+    def pick(self, i: int) -> str:
+        """Escolhe a coluna `i` como resposta e cancela as que ainda rodam."""
+        self.winner = i
+        self.model  = self.columns[i]["model"]
+        self._cancel_others(i)
+        return self.columns[i]["text"]
+
+    def _cancel_others(self, keep: int):
+        for j, (col, worker) in enumerate(zip(self.columns, self._workers)):
+            if j != keep and col["status"] in ("waiting", "streaming"):
+                worker.abort()
+                col["status"] = "cancelled"
+
+    def _decide(self, i: int):
+        self.winner = i
+        self.model  = self.columns[i]["model"]
+        self._cancel_others(i)
+
+    def _on_branch_chunk(self, i: int, text: str):
+        col = self.columns[i]
+        if col["ttft_ms"] is None:
+            col["ttft_ms"] = round((time.perf_counter() - self._t0) * 1000, 1)
+        if self.policy == "first-wins":
+            if self.winner is None:
+                self._decide(i)
+            if i == self.winner:
+                self._on_chunk(text)
+            return
+        col["text"]  += text
+        col["status"] = "streaming"
+        self.updated.emit(self, i)
 
-    def mousePressEvent(self, e):
-        if e.button() == Qt.MouseButton.LeftButton:
-            self._drag_pos = e.globalPosition().toPoint()
+    def _on_branch_finished(self, i: int, text: str):
+        col = self.columns[i]
+        # As medições de saída já foram feitas na thread de I/O antes do evento
+        col["metrics"] = dict(self._workers[i].metrics)
+        if col["ttft_ms"] is None:
+            col["ttft_ms"] = col["metrics"].get("ttft_ms")
+        if self.policy == "first-wins":
+            if self.winner is None:
+                self._decide(i)
+            if i == self.winner:
+                self.finished.emit(self, text)
+            return
+        col.update(text=text, status="done")
+        self.updated.emit(self, i)
+        self._check_settled()
 
-    def mouseMoveEvent(self, e):
-        if e.buttons() == Qt.MouseButton.LeftButton and self._drag_pos:
-            self.move(self.pos() + e.globalPosition().toPoint() - self._drag_pos)
-            self._drag_pos = e.globalPosition().toPoint()
+    def _on_branch_error(self, i: int, err: str):
+        col = self.columns[i]
+        col.update(status="error", error=err)
+        if self.policy == "first-wins" and self.winner == i:
+            self.errored.emit(self, err)
+            return
+        if all(c["status"] == "error" for c in self.columns):
+            self.errored.emit(self, "\n".join(f"{c['model']}: {c['error']}" for c in self.columns))
+            return
+        if self.policy == "compare":
+            self.updated.emit(self, i)
+            self._check_settled()
+
+    def _check_settled(self):
+        if not any(c["status"] in ("waiting", "streaming") for c in self.columns):
+            self.settled.emit(self)
 
 # â”€â”€ Main window â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 class GeminiWindow(QWidget):
     def __init__(self, config: dict):
         super().__init__()
         self._config = config
-        self.all_chats: dict[str, list] = {}
         self.current_chat_id: str | None = None
         self._drag_pos  = None
-        self._worker: GeminiWorker | None = None
-        self._full_response = ""
-        self._typing_idx    = 0
-        self._type_timer    = QTimer(self)
-        self._type_timer.timeout.connect(self._tick_typing)
+        self._sessions: dict[str, ChatSession] = {}
+        self._notices:  dict[str, list[str]] = {}
+        self._clients   = ProviderClients()
+        self._store     = ChatStore()
+        self.open_chats = ChatCache(self._store, self._config.get("cache_mb", 32) << 20)
+        self._context   = ContextWindow()
+        self._cache     = ResponseCache(
+            max_bytes=self._config.get("response_cache_mb", CACHE_MAX_MB) << 20
+        )
+        self._titles    = TitleJobs(self._clients, self._cache)
+        self._metrics   = MetricsLog()
+        self._titles.named.connect(self._apply_name)
+        self._proxy: ProxyServer | None = None
 
         self._build_ui()
+        self._renderer = TypingRenderer(self.chat_area, self)
+        self._renderer.done.connect(self._finish_response)
+        self._configure_renderer()
         self.load_chats_from_disk()
+        days = self._config.get("archive_days", ARCHIVE_DAYS)
+        if days:
+            self._store.archive_async(days)
         self._fade_in()
 
     @property
@@ -574,30 +3791,69 @@ class GeminiWindow(QWidget):
         )
         lay.addWidget(btn_new)
 
-        sep = QLabel("HISTÃ“RICO")
-        sep.setStyleSheet(
+        self.search_f = QLineEdit()
+        self.search_f.setPlaceholderText("🔍 Buscar em todos os chats")
+        self.search_f.setClearButtonEnabled(True)
+        self.search_f.setStyleSheet(
+            f"QLineEdit {{ background:{C_BG_INPUT}; color:white; padding:7px 12px;"
+            f" border-radius:10px; border:1px solid transparent; font-size:12px; }}"
+            f"QLineEdit:focus {{ border:1px solid {C_ACCENT}; }}"
+        )
+        # Busca a cada pausa na digitação, não a cada tecla
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(120)
+        self._search_timer.timeout.connect(self._run_search)
+        self.search_f.textChanged.connect(self._search_timer.start)
+        lay.addWidget(self.search_f)
+
+        self.list_lbl = QLabel("HISTÃ“RICO")
+        self._list_title = self.list_lbl.text()
+        self.list_lbl.setStyleSheet(
             f"color:{C_SUBTEXT}; font-size:10px; font-weight:800;"
             f" padding-left:6px; border:none; margin-top:4px;"
         )
-        lay.addWidget(sep)
+        lay.addWidget(self.list_lbl)
 
-        self.list_w = QListWidget()
+        self.list_w = QListView()
         self.list_w.setStyleSheet(
-            "QListWidget { background:transparent; border:none; outline:none; }"
-            "QListWidget::item { background:transparent; padding:2px; }"
+            "QListView { background:transparent; border:none; outline:none; }"
+            "QListView::item { background:transparent; padding:2px; }"
         )
         self.list_w.setSpacing(2)
+        self.list_w.setUniformItemSizes(True)
+        self.list_w.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.list_w.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self._chat_model = ChatListModel(self)
+        self.list_w.setModel(self._chat_model)
+        delegate = ChatItemDelegate(self.list_w)
+        delegate.selected.connect(self.switch_chat)
+        # Enfileirado: a linha é removida depois que o evento de clique termina
+        delegate.delete_requested.connect(self.del_chat, Qt.ConnectionType.QueuedConnection)
+        self.list_w.setItemDelegate(delegate)
         lay.addWidget(self.list_w)
 
+        self.results_w = QListView()
+        self.results_w.setStyleSheet(self.list_w.styleSheet())
+        self.results_w.setSpacing(2)
+        self.results_w.setUniformItemSizes(True)
+        self.results_w.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.results_w.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self._results = SearchResultModel(self)
+        self.results_w.setModel(self._results)
+        result_delegate = SearchResultDelegate(self.results_w)
+        result_delegate.selected.connect(self._open_result)
+        self.results_w.setItemDelegate(result_delegate)
+        self.results_w.hide()
+        lay.addWidget(self.results_w)
+
         lay.addWidget(QLabel(
             "Modelo",
             styleSheet=f"color:{C_SUBTEXT}; font-size:10px; font-weight:800; border:none;"
         ))
         self.model_cb = QComboBox()
         self._populate_model_cb()
-        self.model_cb.currentTextChanged.connect(
-            lambda t: self._config.update({"model": t})
-        )
+        self.model_cb.currentTextChanged.connect(self._on_model_changed)
         self.model_cb.setStyleSheet(
             f"QComboBox {{ background:{C_BG_INPUT}; color:white; padding:8px 12px;"
             f" border-radius:10px; border:none; font-size:12px; }}"
@@ -605,9 +3861,108 @@ class GeminiWindow(QWidget):
             f"QComboBox QAbstractItemView {{ background:{C_BG_SURF}; color:white;"
             f" selection-background-color:{C_ACCENT}; selection-color:{C_BG_SIDE}; }}"
         )
-        lay.addWidget(self.model_cb)
+
+        # Fan-out: o mesmo prompt para vários modelos (menu montado ao abrir)
+        self.fanout_btn = QToolButton()
+        self.fanout_btn.setFixedHeight(34)
+        self.fanout_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.fanout_btn.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        fanout_menu = QMenu(self.fanout_btn)
+        fanout_menu.setStyleSheet(
+            f"QMenu {{ background:{C_BG_SURF}; color:white; border:none; padding:4px; }}"
+            f"QMenu::item {{ padding:5px 18px 5px 24px; font-size:12px; }}"
+            f"QMenu::item:selected {{ background:{C_ACCENT}; color:{C_BG_SIDE}; }}"
+            f"QMenu::item:disabled {{ color:{C_SUBTEXT}; }}"
+        )
+        fanout_menu.aboutToShow.connect(self._build_fanout_menu)
+        self.fanout_btn.setMenu(fanout_menu)
+        self._update_fanout_btn()
+
+        model_row = QHBoxLayout()
+        model_row.setSpacing(6)
+        model_row.addWidget(self.model_cb, 1)
+        model_row.addWidget(self.fanout_btn)
+        lay.addLayout(model_row)
         return sidebar
 
+    def _on_model_changed(self, model: str):
+        self._config["model"] = model
+        self._update_fanout_btn()
+        if self.current_chat_id:
+            self._prompt_for(self.current_chat_id)
+
+    def _fanout_chosen(self) -> list[tuple[str, str]]:
+        return [
+            (e.get("provider", self._provider), e["model"]) if isinstance(e, dict) else (self._provider, e)
+            for e in self._config.get("fanout_models") or []
+        ]
+
+    def _build_fanout_menu(self):
+        """Refeito a cada abertura: depende do provedor, do modelo e das chaves salvas."""
+        menu = self.fanout_btn.menu()
+        menu.clear()
+        policy = self._config.get("fanout", "off")
+        group  = QActionGroup(menu)
+        for label, value in (("Um modelo só", "off"),
+                             ("Fan-out: o mais rápido vence", "first-wins"),
+                             ("Fan-out: comparar em colunas", "compare")):
+            act = menu.addAction(label)
+            act.setCheckable(True)
+            act.setChecked(policy == value)
+            act.triggered.connect(lambda _=False, value=value: self._set_fanout(value))
+            group.addAction(act)
+
+        chosen = set(self._fanout_chosen())
+        full   = len(fanout_targets({**self._config, "fanout": "compare"})) >= FANOUT_MAX
+        for provider, models in (("OpenRouter", OPENROUTER_MODELS), ("Google Gemini", GEMINI_MODELS)):
+            menu.addSection(provider)
+            if not provider_key(self._config, provider):
+                menu.addAction("Sem API key — configure em ⚙").setEnabled(False)
+                continue
+            for model in models:
+                primary = (provider, model) == (self._provider, self._model)
+                checked = primary or (provider, model) in chosen
+                act = menu.addAction(model)
+                act.setCheckable(True)
+                act.setChecked(checked)
+                act.setEnabled(not primary and (checked or not full))
+                act.triggered.connect(lambda on, p=provider, m=model: self._toggle_fanout_model(p, m, on))
+
+    def _set_fanout(self, policy: str):
+        self._config["fanout"] = policy
+        save_config(self._config)
+        self._update_fanout_btn()
+        if self.current_chat_id:
+            self._prompt_for(self.current_chat_id)
+
+    def _toggle_fanout_model(self, provider: str, model: str, on: bool):
+        chosen = [c for c in self._fanout_chosen() if c != (provider, model)]
+        if on:
+            chosen.append((provider, model))
+        self._config["fanout_models"] = [{"provider": p, "model": m} for p, m in chosen]
+        save_config(self._config)
+        self._update_fanout_btn()
+        if self.current_chat_id:
+            self._prompt_for(self.current_chat_id)
+
+    def _update_fanout_btn(self):
+        n = len(fanout_targets(self._config))
+        active = n > 1
+        self.fanout_btn.setText(f"⇶ {n}" if active else "⇶")
+        if not active:
+            tip = "Fan-out: enviar o prompt para vários modelos"
+        elif self._config["fanout"] == "first-wins":
+            tip = f"Fan-out em {n} modelos: vale a primeira resposta, as outras são canceladas"
+        else:
+            tip = f"Fan-out em {n} modelos: respostas lado a lado para comparar"
+        self.fanout_btn.setToolTip(tip)
+        self.fanout_btn.setStyleSheet(
+            f"QToolButton {{ background:{C_ACCENT if active else C_BG_INPUT};"
+            f" color:{C_BG_SIDE if active else 'white'}; border-radius:10px; border:none;"
+            f" padding:0 10px; font-size:12px; font-weight:700; }}"
+            f"QToolButton::menu-indicator {{ image:none; }}"
+        )
+
     def _populate_model_cb(self):
         self.model_cb.blockSignals(True)
         self.model_cb.clear()
@@ -633,6 +3988,21 @@ class GeminiWindow(QWidget):
             f"color:{C_SUBTEXT}; font-size:13px; font-weight:600; border:none;"
         )
         header.addWidget(self.title_lbl)
+
+        # Tamanho efetivo do próximo prompt (janela + resumo)
+        self.ctx_lbl = QLabel("")
+        self.ctx_lbl.setStyleSheet(f"color:{C_SUBTEXT}; font-size:11px; border:none; padding-left:10px;")
+        header.addWidget(self.ctx_lbl)
+
+        self.cache_lbl = QLabel("")
+        self.cache_lbl.setStyleSheet(f"color:{C_SUBTEXT}; font-size:11px; border:none; padding-left:10px;")
+        header.addWidget(self.cache_lbl)
+
+        # Proxy local (--serve / "proxy_port"): endereço ou o erro ao abrir a porta
+        self.proxy_lbl = QLabel("")
+        self.proxy_lbl.setStyleSheet(f"color:{C_SUBTEXT}; font-size:11px; border:none; padding-left:10px;")
+        self.proxy_lbl.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        header.addWidget(self.proxy_lbl)
         header.addStretch()
 
         # Show API status
@@ -643,6 +4013,27 @@ class GeminiWindow(QWidget):
             self.api_status.setStyleSheet(f"color:{C_GREEN}; font-size:11px; border:none; padding-right:8px;")
         header.addWidget(self.api_status)
 
+        btn_metrics = QPushButton("📊")
+        btn_metrics.setFixedSize(30, 30)
+        btn_metrics.setToolTip("Métricas das requisições")
+        btn_metrics.setCursor(Qt.CursorShape.PointingHandCursor)
+        btn_metrics.clicked.connect(self._toggle_metrics)
+        btn_metrics.setStyleSheet(
+            f"QPushButton {{ background:{C_BG_INPUT}; color:white; border-radius:15px; border:none; }}"
+            f"QPushButton:hover {{ background:{C_ACCENT}; color:{C_BG_SIDE}; }}"
+        )
+        header.addWidget(btn_metrics)
+
+        btn_setup = QPushButton("⚙")
+        btn_setup.setFixedSize(30, 30)
+        btn_setup.setCursor(Qt.CursorShape.PointingHandCursor)
+        btn_setup.clicked.connect(self._open_setup)
+        btn_setup.setStyleSheet(
+            f"QPushButton {{ background:{C_BG_INPUT}; color:white; border-radius:15px; border:none; }}"
+            f"QPushButton:hover {{ background:{C_ACCENT}; color:{C_BG_SIDE}; }}"
+        )
+        header.addWidget(btn_setup)
+
         btn_close = QPushButton("âœ•")
         btn_close.setFixedSize(30, 30)
         btn_close.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -654,16 +4045,25 @@ class GeminiWindow(QWidget):
         header.addWidget(btn_close)
         lay.addLayout(header)
 
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
+        metrics_row = QHBoxLayout()
+        metrics_row.setContentsMargins(20, 0, 18, 6)
+        self.metrics_panel = MetricsPanel(self._metrics, self._store)
+        metrics_row.addWidget(self.metrics_panel)
+        lay.addLayout(metrics_row)
+
+        self.chat_area = TranscriptView()
         self.chat_area.setStyleSheet(
-            f"QTextEdit {{ background:transparent; border:none; color:{C_TEXT};"
-            f" padding:10px 24px; font-size:14px; }}"
+            f"QListView {{ background:transparent; border:none; color:{C_TEXT};"
+            f" padding:10px 0; font-size:14px; }}"
             f"QScrollBar:vertical {{ background:{C_BG_SURF}; width:5px; border-radius:3px; }}"
             f"QScrollBar::handle:vertical {{ background:{C_BG_INPUT}; border-radius:3px; }}"
             f"QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{ height:0; }}"
         )
-        lay.addWidget(self.chat_area)
+        lay.addWidget(self.chat_area, 2)
+
+        self.compare = ComparePanel()
+        self.compare.picked.connect(self._pick_answer)
+        lay.addWidget(self.compare, 3)
 
         self.thinking = ThinkingDots()
         lay.addWidget(self.thinking)
@@ -728,6 +4128,11 @@ class GeminiWindow(QWidget):
         if not txt:
             return
 
+        # /nocache <msg>: ignora o cache de respostas só nesta mensagem
+        nocache = txt.startswith('/nocache ')
+        if nocache:
+            txt = txt[len('/nocache '):].strip()
+
         # Handle /key command
         if txt.startswith('/key '):
             api_key = txt[5:].strip()
@@ -775,191 +4180,411 @@ class GeminiWindow(QWidget):
 
         if not self.current_chat_id:
             self.new_chat()
+        cid = self.current_chat_id
+        # Responder gravaria por cima de um histórico que não foi lido
+        if self._archive_notice(cid):
+            return
 
         self._append_user_bubble(txt)
-        self.all_chats[self.current_chat_id].append(
-            {'role': 'user', 'parts': [{'text': txt}]}
-        )
+        self._append_turn(cid, 'user', txt)
         self.input_f.clear()
         self._set_busy(True)
 
-        self._worker = AIWorker(self._config, self.all_chats[self.current_chat_id])
-        self._worker.finished.connect(self._on_finished)
-        self._worker.errored.connect(self._on_error)
-        self._worker.start()
+        targets = fanout_targets(self._config)
+        if len(targets) > 1:
+            session = FanOutSession(cid, targets, self._config["fanout"], self)
+            session.updated.connect(self._on_compare_update)
+            session.settled.connect(self._on_compare_settled)
+        else:
+            session = ChatSession(cid, self._model, self)
+        session.chunk.connect(self._on_chunk)
+        session.finished.connect(self._on_finished)
+        session.errored.connect(self._on_error)
+        session.rerouted.connect(self._on_rerouted)
+        self._sessions[cid] = session
+        self._chat_model.set_state(cid, "busy")
+        prompt = self._prompt_for(cid)
+
+        # Fan-out não usa o cache: a resposta depende de qual modelo vence
+        if len(targets) == 1 and self._config.get("response_cache", True):
+            key = request_key(self._provider, self._model, self._config.get("temperature"), prompt)
+            cached = None if nocache else self._cache.get(key)
+            self._update_cache_lbl()
+            if cached is not None:
+                self._on_finished(session, cached)
+                return
+            session.cache_key = key
+
+        session.start(self._config, prompt, self._clients, self._on_measured)
+        if self._is_compare(session):
+            self._show_compare(session)
+
+    def _visible_session(self) -> ChatSession | None:
+        return self._sessions.get(self.current_chat_id) if self.current_chat_id else None
 
     def _stop_generation(self):
-        if self._worker and self._worker.isRunning():
-            self._worker.abort()
-        self._type_timer.stop()
+        session = self._visible_session()
+        if session is None:
+            return
+        session.abort()
+        if session.live:
+            self._renderer.stop()
         self.thinking.stop()
-        self._set_busy(False)
+        # A resposta parcial fica no histórico, como se tivesse terminado ali
+        self._end_session(session, session.final or session.text)
         self.chat_area.append(
             f"<i style='color:{C_SUBTEXT};'>â€” geraÃ§Ã£o interrompida â€”</i><br>"
         )
 
-    def _on_finished(self, text: str):
+    def _begin_response(self, session: ChatSession, shown: str = ""):
+        session.live = True
         self.thinking.stop()
-        self._full_response = text
-        self._typing_idx    = 0
-        self.chat_area.append(
-            f"<b style='color:{self._ia_color()};'>IA</b> "
-            f"<span style='color:{C_SUBTEXT}; font-size:11px;'>({self._model})</span><br>"
-        )
-        self._type_timer.start(8)
+        self.chat_area.begin_live(self._ia_color(), session.model)
+        self._renderer.begin(shown)
+
+    @staticmethod
+    def _is_compare(session: ChatSession | None) -> bool:
+        return isinstance(session, FanOutSession) and session.policy == "compare"
 
-    def _on_error(self, err: str):
+    def _show_compare(self, session: FanOutSession):
         self.thinking.stop()
-        self._set_busy(False)
-        self.chat_area.append(
+        self.compare.bind(session)
+
+    def _on_compare_update(self, session: FanOutSession, i: int):
+        if self.compare.session is session:
+            self.compare.refresh(i)
+
+    def _on_compare_settled(self, session: FanOutSession):
+        # Todas as colunas terminaram fora da tela: falta só escolher uma
+        if session.cid != self.current_chat_id:
+            self._chat_model.set_state(session.cid, "unread")
+
+    def _pick_answer(self, i: int):
+        session = self.compare.session
+        if session is None:
+            return
+        text = session.pick(i)
+        self.compare.unbind()
+        self.chat_area.add_message('model', text, self._ia_color(), session.model)
+        self._finish_response(text, session)
+
+    def _on_measured(self, record: dict):
+        self._metrics.add(record)
+        self.metrics_panel.refresh()
+
+    def _toggle_metrics(self):
+        self.metrics_panel.setVisible(not self.metrics_panel.isVisible())
+        self.metrics_panel.refresh()
+
+    def _notify(self, session: ChatSession, html_text: str):
+        """Aviso na tela se o chat está aberto; senão, guardado para quando abrir."""
+        if session.cid == self.current_chat_id:
+            self.chat_area.append(html_text)
+        else:
+            session.notices.append(html_text)
+
+    def _on_rerouted(self, session: ChatSession, model: str):
+        self._notify(session,
+            f"<i style='color:{C_SUBTEXT};'>↪ {html.escape(session.requested)} indisponível,"
+            f" usando {html.escape(model)}</i><br>"
+        )
+
+    def _on_chunk(self, session: ChatSession, text: str):
+        # Fora da tela o texto só se acumula na sessão
+        if session.cid != self.current_chat_id:
+            return
+        if not session.live:
+            self._begin_response(session, session.text[:len(session.text) - len(text)])
+        self._renderer.feed(text)
+
+    def _on_finished(self, session: ChatSession, text: str):
+        session.final = text
+        if session.cid != self.current_chat_id:
+            self._finish_response(text, session)
+            return
+        if not session.live:
+            self._begin_response(session)
+        self._renderer.close(text)
+
+    def _on_error(self, session: ChatSession, err: str):
+        # `errored` traz texto puro (pode vir do corpo da resposta do provedor)
+        err = html.escape(err).replace("\n", "<br>")
+        if session.cid == self.current_chat_id:
+            if session.live:
+                self._renderer.stop()
+            self.thinking.stop()
+        # Como no Parar: o que chegou antes do erro fica no histórico
+        self._end_session(session, session.text)
+        self._notify(session,
             f"<div style='background:rgba(243,139,168,0.15); padding:10px;"
             f" border-radius:10px; color:{C_RED};'><b>Erro:</b> {err}</div><br>"
         )
+        self._park_notices(session)
 
-    def _tick_typing(self):
-        if self._typing_idx < len(self._full_response):
-            cursor = self.chat_area.textCursor()
-            cursor.movePosition(QTextCursor.MoveOperation.End)
-            self.chat_area.setTextCursor(cursor)
-            self.chat_area.insertPlainText(self._full_response[self._typing_idx])
-            self._typing_idx += 1
-            self.chat_area.verticalScrollBar().setValue(
-                self.chat_area.verticalScrollBar().maximum()
-            )
-        else:
-            self._type_timer.stop()
-            self.chat_area.append("<br>")
-            history = self.all_chats.get(self.current_chat_id, [])
-            history.append({'role': 'model', 'parts': [{'text': self._full_response}]})
-            self.save_chat()
+    def _finish_response(self, text: str, session: ChatSession | None = None):
+        session = session or self._visible_session()
+        if session is None:
+            return
+        if session.cache_key and text:
+            self._cache.put(session.cache_key, text)
+        history = self._end_session(session, text)
+        self._park_notices(session)
+        if session.cid == self.current_chat_id:
+            self._prompt_for(session.cid)
+        if len(history) == 2:
+            self._titles.submit(session.cid, history[0].text, self._config)
+
+    def _end_session(self, session: ChatSession, text: str = "") -> Conversation:
+        """Tira a sessão de cena e grava a resposta (se houver) no histórico."""
+        cid = session.cid
+        if self._sessions.get(cid) is session:
+            del self._sessions[cid]
+        if self.compare.session is session:
+            self.compare.unbind()
+        session.deleteLater()
+        history = self._append_turn(cid, 'model', text) if text else self.open_chats.get(cid)
+        visible = cid == self.current_chat_id
+        self._chat_model.set_state(cid, None if visible or not text else "unread")
+        if visible:
             self._set_busy(False)
-            if len(history) == 2:
-                self._auto_name(history[0]['parts'][0]['text'])
+        return history
+
+    def _park_notices(self, session: ChatSession):
+        # Avisos de um chat fora da tela ficam para quando ele for aberto
+        if session.notices:
+            self._notices.setdefault(session.cid, []).extend(session.notices)
+            if session.cid != self.current_chat_id:
+                self._chat_model.set_state(session.cid, "unread")
 
     # â”€â”€ Auto-rename â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-    def _auto_name(self, first_msg: str):
+    def _apply_name(self, old_id: str, new_name: str):
+        """Aplica o título de uma vez: arquivo e índice, cache, sidebar e cabeçalho."""
+        if (not new_name or new_name == old_id or self._store.exists(new_name)
+                or not self._store.exists(old_id)):
+            return
         try:
-            prompt = f"Resuma em 2-3 palavras (sem pontuaÃ§Ã£o): {first_msg}"
-            if self._provider == "OpenRouter":
-                headers = {
-                    "Authorization": f"Bearer {self._config['api_key']}",
-                    "Content-Type":  "application/json",
-                }
-                resp = requests.post(
-                    OPENROUTER_BASE,
-                    headers=headers,
-                    json={
-                        "model":    self._model,
-                        "messages": [{"role": "user", "content": prompt}],
-                    },
-                    timeout=10
-                )
-                new_name = resp.json()["choices"][0]["message"]["content"].strip()
-            else:
-                client   = genai.Client(api_key=self._config["api_key"])
-                res      = client.models.generate_content(
-                    model=self._model, contents=prompt
-                )
-                new_name = res.text.strip()
-
-            new_name = new_name.replace('"', '').replace('.', '').strip()[:22]
-            if not new_name or new_name == self.current_chat_id:
-                return
+            self._store.rename(old_id, new_name)
+        except OSError as e:
+            logger.warning("Auto-nome: não foi possível renomear %r: %s", old_id, e)
+            return
 
-            old_id   = self.current_chat_id
-            old_path = os.path.join(CHATS_DIR, f"{old_id}.json")
-            self.all_chats[new_name] = self.all_chats.pop(old_id)
-            if os.path.exists(old_path):
-                os.remove(old_path)
+        self.open_chats.rename(old_id, new_name)
+        self._context.forget(old_id)
+        self._chat_model.rename(old_id, new_name)
+        if old_id in self._sessions:
+            session = self._sessions[new_name] = self._sessions.pop(old_id)
+            session.cid = new_name
+        if old_id in self._notices:
+            self._notices[new_name] = self._notices.pop(old_id)
+        if self.current_chat_id == old_id:
             self.current_chat_id = new_name
-            self.save_chat()
-            self.load_chats_from_disk()
             self.title_lbl.setText(new_name)
-        except Exception:
-            pass
+        if self.results_w.isVisible():
+            self._run_search()
 
     # â”€â”€ Chat management â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
     def new_chat(self):
         cid = f"SessÃ£o {datetime.now().strftime('%H%M%S')}"
-        self.all_chats[cid] = []
+        # Dois chats no mesmo segundo (um ainda respondendo) não podem colidir
+        base, n = cid, 2
+        while self._store.exists(cid):
+            cid, n = f"{base} ({n})", n + 1
+        self._leave_chat()
         self.current_chat_id = cid
         self.chat_area.clear()
+        self._set_busy(False)
         self.title_lbl.setText(cid)
-        self.save_chat()
-        self.load_chats_from_disk()
+        self.ctx_lbl.clear()
+        self._store.create(cid)
+        self._chat_model.insert_top(cid, self._store.index.get(cid))
+        self._chat_model.set_active(cid)
 
-    def save_chat(self):
-        if not self.current_chat_id:
-            return
-        with open(
-            os.path.join(CHATS_DIR, f"{self.current_chat_id}.json"), "w", encoding="utf-8"
-        ) as f:
-            json.dump(self.all_chats[self.current_chat_id], f, ensure_ascii=False)
+    def _append_turn(self, cid: str, role: str, text: str) -> Conversation:
+        """Acrescenta um turno ao histórico em memória e ao arquivo do chat."""
+        msg = Message(role, text)
+        history = self.open_chats.append(cid, msg)
+        self._store.append(cid, msg.record())
+        self._chat_model.move_to_top(cid, self._store.index.get(cid))
+        return history
 
     def load_chats_from_disk(self):
-        self.list_w.clear()
-        try:
-            files = sorted(
-                [f for f in os.listdir(CHATS_DIR) if f.endswith(".json")],
-                key=lambda x: os.path.getmtime(os.path.join(CHATS_DIR, x)),
-                reverse=True
-            )
-        except OSError:
-            files = []
-
-        for fname in files:
-            cid   = fname.replace(".json", "")
-            fpath = os.path.join(CHATS_DIR, fname)
-            try:
-                with open(fpath, "r", encoding="utf-8") as fh:
-                    self.all_chats[cid] = json.load(fh)
-            except Exception:
-                self.all_chats[cid] = []
+        entries = self._store.entries()
+        self._chat_model.reset(entries)
+        if entries and not self.current_chat_id:
+            self.current_chat_id = entries[0][0]
+        self._chat_model.set_active(self.current_chat_id)
+        self._store.index_async(entries)
 
-            item = QListWidgetItem(self.list_w)
-            item.setSizeHint(QSize(0, 46))
-            widget = ChatItemWidget(cid, active=(cid == self.current_chat_id))
-            widget.delete_requested.connect(self.del_chat)
-            widget.selected.connect(self.switch_chat)
-            self.list_w.addItem(item)
-            self.list_w.setItemWidget(item, widget)
+    def _run_search(self):
+        query = self.search_f.text().strip()
+        if not query:
+            self.results_w.hide()
+            self.list_w.show()
+            self.list_lbl.setText(self._list_title)
+            return
+        t0 = time.perf_counter()
+        results = self._store.find(query)
+        ms = (time.perf_counter() - t0) * 1000
+        self._results.set_results(results)
+        self.list_w.hide()
+        self.results_w.show()
+        self.results_w.scrollToTop()
+        self.list_lbl.setText(
+            f"RESULTADOS · {len(results)} em {ms:.0f} ms" if results else "NENHUM RESULTADO"
+        )
 
-        if files and not self.current_chat_id:
-            self.current_chat_id = files[0].replace(".json", "")
+    def _open_result(self, cid: str, seq: int):
+        if cid != self.current_chat_id:
+            self.switch_chat(cid)
+        self.chat_area.reveal(seq)
 
     def del_chat(self, cid: str):
-        path = os.path.join(CHATS_DIR, f"{cid}.json")
-        if os.path.exists(path):
-            os.remove(path)
-        self.all_chats.pop(cid, None)
+        session = self._sessions.pop(cid, None)
+        if session is not None:
+            session.abort()
+            session.deleteLater()
+            if self.compare.session is session:
+                self.compare.unbind()
+            if cid == self.current_chat_id:
+                self._renderer.detach()
+                self._set_busy(False)
+        self._notices.pop(cid, None)
+        self._store.delete(cid)
+        self.open_chats.discard(cid)
+        self._context.forget(cid)
         if self.current_chat_id == cid:
             self.current_chat_id = None
             self.chat_area.clear()
             self.title_lbl.setText("Novo Chat")
-        self.load_chats_from_disk()
+            self.ctx_lbl.clear()
+        self._chat_model.remove(cid)
+        if self.results_w.isVisible():
+            self._run_search()
+
+    def _archive_notice(self, cid: str) -> bool:
+        """Avisa na tela se `cid` é um chat arquivado que não pôde ser lido."""
+        err = self._store.load_error(cid)
+        if err is None:
+            return False
+        self.open_chats.discard(cid)     # a próxima abertura tenta ler de novo
+        self.chat_area.append(
+            f"<div style='background:rgba(243,139,168,0.15); padding:10px;"
+            f" border-radius:10px; color:{C_RED};'><b>Chat arquivado ilegível:</b>"
+            f" {html.escape(err)}<br>A cópia arquivada foi mantida; novas mensagens"
+            f" neste chat ficam bloqueadas.</div><br>"
+        )
+        return True
 
     def switch_chat(self, cid: str):
+        if cid == self.current_chat_id and self.chat_area.model().rowCount():
+            return
+        self._leave_chat()
         self.current_chat_id = cid
         self.title_lbl.setText(cid)
-        self.chat_area.clear()
-        for msg in self.all_chats.get(cid, []):
-            role = msg.get('role', '')
-            text = msg['parts'][0]['text'] if msg.get('parts') else ''
-            if role == 'user':
-                self._append_user_bubble(text)
-            else:
-                self.chat_area.append(
-                    f"<b style='color:{self._ia_color()};'>IA</b><br>"
-                    f"{render_markdown(text)}<br>"
-                )
-        self.load_chats_from_disk()
+        self.chat_area.load(self.open_chats.get(cid), self._ia_color())
+        self._archive_notice(cid)
+        for notice in self._notices.pop(cid, []):
+            self.chat_area.append(notice)
+        self._chat_model.set_active(cid)
+        self._chat_model.set_state(cid, "busy" if cid in self._sessions else None)
+        self._prompt_for(cid)
+
+        # Resposta em andamento: o que chegou fora da tela entra de uma vez
+        session = self._sessions.get(cid)
+        self._set_busy(session is not None)
+        if session is not None:
+            for notice in session.notices:
+                self.chat_area.append(notice)
+            session.notices.clear()
+            if self._is_compare(session):
+                self._show_compare(session)
+            elif session.text:
+                self._begin_response(session, session.text)
+
+    def _leave_chat(self):
+        """Solta a resposta do chat visível da tela; ela segue em segundo plano."""
+        session = self._visible_session()
+        if session is None:
+            return
+        if self.compare.session is session:
+            self.compare.unbind()
+        if session.live:
+            self._renderer.detach()
+            session.live = False
+        # Já tinha terminado e só faltava digitar: grava direto
+        if session.final is not None:
+            self._finish_response(session.final, session)
+
+    def start_proxy(self, port: int | None = None):
+        """Liga o `ProxyServer` com os clientes, chats e cache desta janela."""
+        port = PROXY_PORT if port is None else port
+        self._proxy = ProxyServer(self._config, self._clients, self._store, self._cache, self)
+        try:
+            self._proxy.start(port)
+        except OSError as e:
+            logger.warning("Proxy: não foi possível abrir a porta %s: %s", port, e)
+            self._proxy = None
+            self.proxy_lbl.setText(f"<span style='color:{C_RED};'>proxy: porta {port} indisponível</span>")
+            self.proxy_lbl.setToolTip(str(e))
+            return
+        self._proxy.logged.connect(self._on_proxy_logged)
+        self._proxy.measured.connect(self._on_measured)
+        logger.info("Proxy em %s", self._proxy.address)
+        self.proxy_lbl.setText(f"proxy {self._proxy.address}")
+        self.proxy_lbl.setToolTip(
+            "Proxy local compatível com a OpenAI (chat/completions)\n"
+            f"Authorization: Bearer {self._proxy.token}"
+        )
+
+    def _on_proxy_logged(self, cid: str):
+        # O arquivo mudou por fora da janela: o cache em memória fica velho
+        self.open_chats.discard(cid)
+        self._context.forget(cid)
+        self._chat_model.move_to_top(cid, self._store.index.get(cid))
+        if cid == self.current_chat_id and cid not in self._sessions:
+            self.chat_area.load(self.open_chats.get(cid), self._ia_color())
+            self._prompt_for(cid)
+        if self.results_w.isVisible():
+            self._run_search()
 
     # â”€â”€ Helpers â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
     def _append_user_bubble(self, text: str):
-        self.chat_area.append(
-            f"<div style='background:{C_BUBBLE_U}; padding:12px 16px;"
-            f" border-radius:14px; margin-bottom:6px;'>"
-            f"<b style='color:{C_ACCENT2};'>VOCÃŠ</b><br>{text}</div><br>"
+        self.chat_area.add_message('user', text)
+
+    def _update_cache_lbl(self):
+        hits, misses = self._cache.hits, self._cache.misses
+        self.cache_lbl.setText(f"cache {hits}/{hits + misses}" if hits + misses else "")
+        self.cache_lbl.setToolTip(
+            f"Cache de respostas: {hits} acertos, {misses} falhas\n"
+            f"Use /nocache <mensagem> para ignorá-lo"
+        )
+
+    def _prompt_for(self, cid: str) -> list[Message]:
+        """Recorta o histórico de `cid` ao orçamento do modelo e atualiza o cabeçalho."""
+        # Com fan-out o prompt é um só, então vale o menor orçamento entre os modelos
+        budget = min(
+            context_budget(t["model"], self._config.get("context_budget"))
+            for t in fanout_targets(self._config)
+        )
+        prompt, info = self._context.build(
+            cid, self.open_chats.get(cid), budget,
+            summarize=self._config.get("context_summary", True),
+        )
+        tokens = info["tokens"]
+        size   = f"{tokens / 1000:.1f}k" if tokens >= 1000 else str(tokens)
+        text   = f"≈ {size} tokens · {info['kept']}/{info['total']} msgs"
+        if info["summary"]:
+            text += " + resumo"
+        self.ctx_lbl.setText(text if info["total"] else "")
+        self.ctx_lbl.setToolTip(f"Orçamento de contexto: {budget:,} tokens")
+        return prompt
+
+    def _configure_renderer(self):
+        screen = self.screen()
+        self._renderer.configure(
+            enabled=self._config.get("typing_effect", True),
+            cps=self._config.get("typing_cps", TYPING_CPS),
+            fps=screen.refreshRate() if screen else 60.0,
         )
 
     def _set_busy(self, busy: bool):
@@ -971,16 +4596,44 @@ class GeminiWindow(QWidget):
         else:
             self.thinking.stop()
 
+    # â”€â”€ Setup â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+    def _open_setup(self):
         # Criar overlay dentro da janela principal
-        self._overlay = SettingsOverlay(self, current=self._config)
+        self._overlay = SettingsOverlay(self, current=self._config, clients=self._clients)
+        self._overlay.config_saved.connect(self._on_setup_done)
         self._overlay.show()
-    
+
+    def _on_setup_done(self, cfg: dict):
+        if (cfg.get("provider"), cfg.get("api_key")) != (self._provider, self._config.get("api_key")):
+            self._clients.reset()
+            warm_up(cfg.get("provider", ""))
         self._config = cfg
+        if self._proxy is not None:
+            self._proxy.config = cfg
         save_config(cfg)
         self._populate_model_cb()
+        self._update_fanout_btn()
+        self._configure_renderer()
+        if self.current_chat_id:
+            self._prompt_for(self.current_chat_id)
         self.provider_lbl.setText(self._provider_badge_html())
         self._overlay.hide()
 
+    def paintEvent(self, e):
+        super().paintEvent(e)
+        if "first_paint" not in STARTUP.marks:
+            STARTUP.mark("first_paint")
+            warm_up(self._provider)
+
+    def closeEvent(self, e):
+        for session in self._sessions.values():
+            session.abort()
+        if self._proxy is not None:
+            self._proxy.close()
+        self._store.close()
+        self._clients.close()
+        super().closeEvent(e)
+
     def mousePressEvent(self, e):
         if e.button() == Qt.MouseButton.LeftButton:
             self._drag_pos = e.globalPosition().toPoint()
@@ -990,18 +4643,850 @@ class GeminiWindow(QWidget):
             self.move(self.pos() + e.globalPosition().toPoint() - self._drag_pos)
             self._drag_pos = e.globalPosition().toPoint()
 
+# â”€â”€ Batch â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+BATCH_CONCURRENCY = 4
+BATCH_REQUEUES    = 3   # vezes que um item volta para a fila por disjuntor aberto
+
+def read_batch(stream) -> list[dict]:
+    """Itens do lote: um objeto JSON por linha ou, se a linha não começa
+    com "{", o próprio texto como prompt. Sem "id", vale "line:N", que não
+    se confunde com ids numéricos do arquivo. Uma linha com "{" que não é
+    JSON válido vira um item com "_error", que sai como erro sem ir ao
+    provedor."""
+    items = []
+    for n, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            item = {"prompt": line}
+        else:
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                item = {"_error": f"linha {n}: JSON inválido ({e})"}
+        item.setdefault("id", f"line:{n}")
+        items.append(item)
+    return items
+
+class BatchRunner(QObject):
+    """Roda um lote de prompts sem janela, com as mesmas peças da GUI.
+
+    Cada item é uma `ChatSession` no loop de `ProviderClients`, no máximo
+    `concurrency` em voo. `rpm` espaça os inícios; uma requisição que
+    precisou de novas tentativas (429, 5xx) corta a concorrência pela
+    metade, e cada sucesso limpo devolve uma vaga. Com o disjuntor do
+    modelo aberto nada é despachado até ele fechar, e o item que falhou
+    por isso volta para a fila. Cada resultado sai como uma linha JSON em
+    `out` assim que termina, na ordem de término.
+
+    Itens com "chat" continuam aquele chat do `ChatStore` (um de cada vez,
+    na ordem do arquivo) e gravam o turno nele; com `save`, os outros
+    viram chats novos.
+    """
+    done = pyqtSignal()
+
+    def __init__(self, config: dict, items: list[dict], out, clients: ProviderClients,
+                 store: ChatStore, cache: ResponseCache | None = None,
+                 concurrency: int = BATCH_CONCURRENCY, rpm: float | None = None,
+                 save: bool = False):
+        super().__init__()
+        self._config   = config
+        self._pending  = deque(items)
+        self._out      = out
+        self._clients  = clients
+        self._store    = store
+        self._cache    = cache
+        self._save     = save
+        self._max      = self._limit = max(1, concurrency)
+        self._interval = 60.0 / rpm if rpm else 0.0
+        self._next     = 0.0
+        self._running: dict[ChatSession, dict] = {}
+        self._chats:   set[str] = set()
+        self._context  = ContextWindow()
+        self._timer    = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._pump)
+        self.metrics   = MetricsLog(maxlen=len(items) * (BATCH_REQUEUES + 1) + 1)
+        self.counts    = Counter()
+
+    def start(self):
+        self._pump()
+
+    def abort(self):
+        self._pending.clear()
+        for session in self._running:
+            session.abort()
+        self._running.clear()
+        self.done.emit()
+
+    def _breaker_wait(self, model: str) -> float:
+        # Leitura solta do estado do disjuntor; no pior caso o item volta para a fila
+        return self._clients.breaker.remaining((self._config.get("provider", "Google Gemini"), model))
+
+    def _pump(self):
+        while self._pending and len(self._running) < self._limit:
+            item = self._next_item()
+            if item is None:
+                break                      # os que sobraram esperam o seu chat
+            model = item.get("model") or self._config["model"]
+            wait  = max(self._next - time.monotonic(), self._breaker_wait(model))
+            if wait > 0:
+                self._pending.appendleft(item)
+                self._timer.start(int(wait * 1000) + 1)
+                return
+            if self._launch(item, model):
+                self._next = time.monotonic() + self._interval
+        if not self._pending and not self._running:
+            self.done.emit()
+
+    def _next_item(self) -> dict | None:
+        for i, item in enumerate(self._pending):
+            if item.get("chat") not in self._chats:
+                del self._pending[i]
+                return item
+        return None
+
+    def _launch(self, item: dict, model: str) -> bool:
+        """Dispara `item`; False se nem chegou à rede (erro ou cache)."""
+        if "_error" in item:
+            self._record(item, model, error=item["_error"])
+            return False
+        prompt = str(item.get("prompt") or "").strip()
+        if not prompt:
+            self._record(item, model, error="item sem \"prompt\"")
+            return False
+        cid = item.get("chat")
+        if cid is not None:
+            cid = item["chat"] = clean_title(str(cid)) or str(item["id"])
+        config = {**self._config, "model": model}
+        if "temperature" in item:
+            config["temperature"] = item["temperature"]
+
+        history = Conversation.load(self._store, cid).messages if cid and self._store.exists(cid) else []
+        messages, _ = self._context.build(
+            cid or "", history + [Message("user", prompt)],
+            context_budget(model, config.get("context_budget")),
+            summarize=config.get("context_summary", True),
+        )
+        key = None
+        if self._cache is not None:
+            key = request_key(config.get("provider", "Google Gemini"), model,
+                              config.get("temperature"), messages)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._record(item, model, text=cached, cached=True)
+                return False
+
+        session = ChatSession(cid or "", model, self)
+        session.cache_key = key
+        session.finished.connect(self._on_finished)
+        session.errored.connect(self._on_error)
+        self._running[session] = item
+        if cid:
+            self._chats.add(cid)
+        session.start(config, messages, self._clients, self._on_measured)
+        return True
+
+    def _on_measured(self, record: dict):
+        self.metrics.add(record)
+
+    def _release(self, session: ChatSession) -> dict:
+        item = self._running.pop(session)
+        self._chats.discard(item.get("chat"))
+        session.deleteLater()
+        # AIMD: recua rápido quando o provedor reclama, volta devagar
+        if session.metrics.get("retries"):
+            self._limit = max(1, self._limit // 2)
+        elif self._limit < self._max:
+            self._limit += 1
+        return item
+
+    def _on_finished(self, session: ChatSession, text: str):
+        if session not in self._running:
+            return
+        item = self._release(session)
+        if session.cache_key and text:
+            self._cache.put(session.cache_key, text)
+        self._record(item, session.model, text=text, metrics=session.metrics)
+        self._pump()
+
+    def _on_error(self, session: ChatSession, err: str):
+        if session not in self._running:
+            return
+        item = self._release(session)
+        if self._breaker_wait(session.model) and item.get("_requeues", 0) < BATCH_REQUEUES:
+            item["_requeues"] = item.get("_requeues", 0) + 1
+            self._pending.appendleft(item)
+        else:
+            self._record(item, session.model, error=err, metrics=session.metrics)
+        self._pump()
+
+    def _record(self, item: dict, model: str, text: str | None = None, error: str | None = None,
+                cached: bool = False, metrics: dict | None = None):
+        m   = metrics or {}
+        row = {
+            "id": item["id"], "status": "error" if error else "ok", "model": model,
+            "text": text, "error": error, "cached": cached,
+            "ttft_ms": m.get("ttft_ms"), "total_ms": m.get("total_ms"),
+            "tokens_out": m.get("tokens_out"), "retries": m.get("retries", 0),
+        }
+        if not error and (item.get("chat") or self._save):
+            row["chat"] = self._persist(item, text)
+        self._out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._out.flush()
+        self.counts[row["status"]] += 1
+        self.counts["cached"] += cached
+
+    def _persist(self, item: dict, text: str) -> str:
+        cid = item.get("chat")
+        if not cid:
+            cid = base = clean_title(heuristic_title(item["prompt"])) or f"Lote {item['id']}"
+            n = 2
+            while self._store.exists(cid):
+                cid, n = f"{base} ({n})", n + 1
+        if not self._store.exists(cid):
+            self._store.create(cid)
+        self._store.append(cid, Message("user", item["prompt"].strip()).record())
+        self._store.append(cid, Message("model", text).record())
+        return cid
+
+def batch_main(argv: list[str]) -> int:
+    """`python -m nebula_gemini batch`: mesma config (CONFIG_PATH) e mesmos chats."""
+    import argparse
+    config = load_config() or {}
+    ap = argparse.ArgumentParser(
+        prog="python -m nebula_gemini batch",
+        description="Roda um lote de prompts sem abrir a janela, gravando os resultados em JSONL.",
+    )
+    ap.add_argument("input", nargs="?", default="-",
+                    help='JSONL com {"prompt", "id", "chat", "model", "temperature"} por linha,'
+                         ' ou um prompt por linha; "-" lê do stdin (padrão)')
+    ap.add_argument("-o", "--output", default="-", help='resultados em JSONL; "-" é o stdout (padrão)')
+    ap.add_argument("-c", "--concurrency", type=int,
+                    default=config.get("batch_concurrency", BATCH_CONCURRENCY),
+                    help=f"requisições simultâneas (padrão {BATCH_CONCURRENCY})")
+    ap.add_argument("--rpm", type=float, default=config.get("batch_rpm"),
+                    help="máximo de requisições iniciadas por minuto")
+    ap.add_argument("--model", help="modelo para os itens sem \"model\" (padrão: o da config)")
+    ap.add_argument("--save", action="store_true",
+                    help=f"grava cada item sem \"chat\" como um chat novo em {CHATS_DIR}")
+    ap.add_argument("--nocache", action="store_true", help="ignora o cache de respostas")
+    ap.add_argument("--metrics", help="exporta as métricas das requisições (.csv ou .json)")
+    args = ap.parse_args(argv)
+
+    if not config.get("api_key"):
+        print(f"Sem API key em {CONFIG_PATH}: configure pelo app antes de usar o modo lote.",
+              file=sys.stderr)
+        return 2
+    if args.model:
+        config["model"] = args.model
+
+    if args.input == "-":
+        items = read_batch(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as fh:
+            items = read_batch(fh)
+
+    app     = QCoreApplication(sys.argv[:1])
+    clients = ProviderClients()
+    store   = ChatStore()
+    cache   = None
+    if config.get("response_cache", True) and not args.nocache:
+        cache = ResponseCache(max_bytes=config.get("response_cache_mb", CACHE_MAX_MB) << 20)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    runner = BatchRunner(config, items, out, clients, store, cache,
+                         concurrency=args.concurrency, rpm=args.rpm, save=args.save)
+    runner.done.connect(app.quit)
+
+    tick = install_sigint(runner.abort)
+
+    t0 = time.perf_counter()
+    try:
+        QTimer.singleShot(0, runner.start)
+        app.exec()
+    finally:
+        tick.stop()
+        store.close()
+        clients.close()
+        if out is not sys.stdout:
+            out.close()
+    if args.metrics:
+        runner.metrics.export(args.metrics)
+
+    counts = runner.counts
+    print(f"{counts['ok']} ok ({counts['cached']} do cache), {counts['error']} com erro,"
+          f" {len(items)} itens em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+# â”€â”€ Local proxy â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+PROXY_HOST     = "127.0.0.1"
+PROXY_PORT     = 8787
+PROXY_MAX_BODY = 8 << 20
+
+def wire_to_history(messages) -> list[Message]:
+    """Mensagens no formato OpenAI para o histórico do app.
+
+    "system" vira um turno do usuário, que é o que os dois provedores
+    aceitam pelo mesmo caminho; conteúdo em partes tem só o texto somado.
+    """
+    history = []
+    for msg in messages or []:
+        if not isinstance(msg, dict):
+            continue
+        content = msg.get("content")
+        if isinstance(content, list):
+            content = "".join(p.get("text", "") for p in content if isinstance(p, dict))
+        if not content:
+            continue
+        role = "model" if msg.get("role") == "assistant" else "user"
+        history.append(Message(role, str(content)))
+    return history
+
+def ensure_proxy_token(config: dict) -> str:
+    """O "proxy_token" da config; sem um, gera e grava na hora."""
+    token = config.get("proxy_token")
+    if not token:
+        token = config["proxy_token"] = secrets.token_urlsafe(24)
+        save_config(config)
+    return token
+
+class ProxyServer(QObject):
+    """Servidor local compatível com a API da OpenAI, em cima do provedor do app.
+
+    Atende `POST /v1/chat/completions` (com e sem stream) e `GET /v1/models`
+    como um servidor asyncio no próprio loop de `ProviderClients`, então
+    outras ferramentas da máquina dividem o pool de conexões, o disjuntor,
+    os retries e fallbacks do `GeminiWorker` e o `ResponseCache` da janela.
+    Cada requisição vira um worker criado na thread de I/O, onde os sinais
+    dele são entregues direto numa `asyncio.Queue`.
+
+    As conversas são gravadas no `ChatStore` na thread do Qt: uma
+    requisição cujo histórico é uma conversa já gravada (pergunta e
+    resposta anteriores) continua aquele chat, e o cabeçalho
+    `X-Nebula-Chat` escolhe o chat pelo nome. `logged` avisa qual chat
+    mudou; `measured` repassa as medições de cada requisição.
+
+    Escuta só em localhost e sempre exige `Authorization: Bearer <token>`
+    com o "proxy_token" da config (gerado em `start` se faltar). Uma página
+    aberta no navegador também alcança o localhost, então requisições com
+    `Origin` ou com um `Host` que não seja o do proxy (DNS rebinding) são
+    recusadas, e um POST só é aceito como `application/json`, que um
+    formulário não consegue mandar sem preflight.
+    """
+    logged   = pyqtSignal(str)
+    measured = pyqtSignal(dict)
+    _log     = pyqtSignal(object, str, str)
+
+    def __init__(self, config: dict, clients: ProviderClients, store: ChatStore,
+                 cache: ResponseCache | None = None, parent=None):
+        super().__init__(parent)
+        self.config   = config
+        self._clients = clients
+        self._store   = store
+        self._cache   = cache
+        self._server: asyncio.AbstractServer | None = None
+        self._threads: dict[str, str] = {}   # hash da conversa -> chat
+        self._log.connect(self._write_log)
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def token(self) -> str:
+        return self.config.get("proxy_token") or ""
+
+    def start(self, port: int = PROXY_PORT, host: str = PROXY_HOST, timeout: float = 5.0):
+        """Abre a porta; erros (porta em uso) sobem para quem chamou."""
+        ensure_proxy_token(self.config)
+        self._server = self._clients.submit(
+            asyncio.start_server(self._serve, host, port)
+        ).result(timeout)
+
+    def close(self, timeout: float = 2.0):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        self._clients.loop.call_soon_threadsafe(server.close)
+
+    # â”€â”€ HTTP â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        port = writer.get_extra_info("sockname")[1]
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    raw = await reader.readline()
+                    if raw in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = raw.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                denied = self._check(method, headers, port)
+                if denied:
+                    await self._error(writer, *denied, close=True)
+                    break                  # o corpo nem foi lido
+                size = int(headers.get("content-length") or 0)
+                if size > PROXY_MAX_BODY:
+                    await self._error(writer, 413, "Corpo da requisição grande demais.", close=True)
+                    break
+                body = await reader.readexactly(size) if size else b""
+                keep = await self._route(method, target.split("?", 1)[0], headers, body, writer)
+                if not keep or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _check(self, method: str, headers: dict, port: int) -> tuple | None:
+        """(status, mensagem, tipo) se a requisição deve ser recusada antes do corpo."""
+        if "origin" in headers:
+            return 403, "Requisições de navegador não são aceitas.", "forbidden"
+        if headers.get("host", "").lower() not in (f"127.0.0.1:{port}", f"localhost:{port}"):
+            return 403, "Host inválido.", "forbidden"
+        token = self.token
+        sent  = headers.get("authorization", "").encode("utf-8", "replace")
+        if not token or not hmac.compare_digest(sent, f"Bearer {token}".encode("utf-8")):
+            return 401, "Token inválido.", "invalid_api_key"
+        if method == "POST":
+            ctype = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+            if ctype != "application/json":
+                return 415, "Content-Type deve ser application/json.", "invalid_request_error"
+        return None
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes, writer) -> bool:
+        path = path.rstrip("/")
+        if method == "GET" and path == "/v1/models":
+            return await self._send(writer, 200, self._models())
+        if method == "POST" and path == "/v1/chat/completions":
+            return await self._completions(headers, body, writer)
+        return await self._error(writer, 404, f"{method} {path} não existe aqui.", "not_found")
+
+    @staticmethod
+    async def _send(writer, status: int, obj: dict, close: bool = False) -> bool:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n")
+        if close:
+            head += "Connection: close\r\n"     # a conexão vai ser fechada em seguida
+        writer.write((head + "\r\n").encode() + body)
+        await writer.drain()
+        return True
+
+    async def _error(self, writer, status: int, message: str, kind: str = "invalid_request_error",
+                     close: bool = False) -> bool:
+        return await self._send(writer, status, {"error": {"message": message, "type": kind}}, close)
+
+    @staticmethod
+    async def _event(writer, obj) -> None:
+        data = b"data: " + (obj if isinstance(obj, bytes) else
+                            json.dumps(obj, ensure_ascii=False).encode("utf-8")) + b"\n\n"
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    # â”€â”€ API â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+    def _models(self) -> dict:
+        data = [
+            {"id": model, "object": "model", "owned_by": provider}
+            for provider, models in (("OpenRouter", OPENROUTER_MODELS), ("Google Gemini", GEMINI_MODELS))
+            if provider_key(self.config, provider)
+            for model in models
+        ]
+        return {"object": "list", "data": data}
+
+    def _target(self, model: str | None) -> dict | None:
+        provider = self.config.get("provider", "Google Gemini")
+        model    = model or self.config.get("model", "")
+        if model in GEMINI_MODELS:
+            provider = "Google Gemini"
+        elif model in OPENROUTER_MODELS or "/" in model:
+            provider = "OpenRouter"
+        key = provider_key(self.config, provider)
+        return {"provider": provider, "model": model, "api_key": key} if key else None
+
+    async def _completions(self, headers: dict, body: bytes, writer) -> bool:
+        try:
+            req = json.loads(body or b"{}")
+        except ValueError:
+            return await self._error(writer, 400, "JSON inválido.")
+        history = wire_to_history(req.get("messages"))
+        if not history:
+            return await self._error(writer, 400, "\"messages\" sem nenhum texto.")
+        target = self._target(req.get("model"))
+        if target is None:
+            return await self._error(writer, 400, f"Sem API key para {req.get('model')}.", "invalid_api_key")
+
+        config = {**self.config, **target}
+        if target["provider"] != self.config.get("provider", "Google Gemini"):
+            config.pop("fallback_models", None)     # os da config são do outro provedor
+        if "temperature" in req:
+            config["temperature"] = req["temperature"]
+        stream = bool(req.get("stream"))
+        chat   = headers.get("x-nebula-chat", "")
+        reply  = {
+            "id": f"chatcmpl-{os.urandom(12).hex()}", "created": int(time.time()),
+            "model": target["model"],
+        }
+
+        key = None
+        if self._cache is not None and self.config.get("response_cache", True):
+            key = request_key(target["provider"], target["model"], config.get("temperature"), history)
+            cached = self._cache.get(key)
+            if cached is not None:
+                await self._reply(writer, reply, history, cached, stream)
+                self._log.emit(history, cached, chat)
+                return True
+
+        queue: asyncio.Queue = asyncio.Queue()
+        worker = GeminiWorker(config, history, stream=stream, clients=self._clients)
+        # Criado nesta thread: os sinais chegam direto, sem passar pelo Qt
+        for kind in ("chunk", "finished", "errored", "rerouted"):
+            getattr(worker, kind).connect(lambda text, kind=kind: queue.put_nowait((kind, text)))
+        worker.measured.connect(self.measured)
+        worker.start()
+
+        started = done = False
+        try:
+            while True:
+                kind, text = await queue.get()
+                if kind == "rerouted":
+                    reply["model"] = text
+                    key = None
+                    continue
+                if kind == "errored":
+                    done = True
+                    if not started:
+                        return await self._error(writer, 502, text, "upstream_error")
+                    await self._event(writer, {"error": {"message": text, "type": "upstream_error"}})
+                    await self._event(writer, b"[DONE]")
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                    return True
+                if kind == "chunk":
+                    if not started:
+                        await self._stream_head(writer, reply)
+                        started = True
+                    await self._event(writer, self._chunk(reply, {"content": text}))
+                    continue
+                done = True
+                if started:
+                    await self._stream_tail(writer, reply, history, text)
+                else:
+                    await self._reply(writer, reply, history, text, stream)
+                if key and text:
+                    self._cache.put(key, text)
+                self._log.emit(history, text, chat)
+                return True
+        finally:
+            if not done:
+                worker.abort()    # cliente desconectou: interrompe também o provedor
+
+    @staticmethod
+    def _chunk(reply: dict, delta: dict, finish: str | None = None) -> dict:
+        return {**reply, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+    @staticmethod
+    def _usage(history: list[Message], text: str) -> dict:
+        prompt = sum(m.tokens for m in history)
+        out    = estimate_tokens(text)
+        return {"prompt_tokens": prompt, "completion_tokens": out, "total_tokens": prompt + out}
+
+    async def _stream_head(self, writer, reply: dict):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        await self._event(writer, self._chunk(reply, {"role": "assistant", "content": ""}))
+
+    async def _stream_tail(self, writer, reply: dict, history: list[Message], text: str):
+        await self._event(writer, {**self._chunk(reply, {}, "stop"), "usage": self._usage(history, text)})
+        await self._event(writer, b"[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _reply(self, writer, reply: dict, history: list[Message], text: str, stream: bool):
+        """Resposta inteira de uma vez: sem stream, do cache ou de um provedor sem deltas."""
+        if stream:
+            await self._stream_head(writer, reply)
+            await self._event(writer, self._chunk(reply, {"content": text}))
+            await self._stream_tail(writer, reply, history, text)
+            return
+        await self._send(writer, 200, {
+            **reply, "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(history, text),
+        })
+
+    # â”€â”€ Registro â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+    @staticmethod
+    def _thread_key(history: list[Message]) -> str:
+        turns = [(m.role, m.text) for m in history]
+        return hashlib.sha1(json.dumps(turns, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _write_log(self, history: list[Message], text: str, chat: str):
+        answer = Message("model", text)
+        cid    = clean_title(chat) if chat else self._threads.pop(self._thread_key(history[:-1]), None)
+        if cid and self._store.exists(cid):
+            turns = history[-1:] + [answer]
+        else:
+            if not cid:
+                # A última pergunta diz mais do que um prompt de sistema
+                cid = base = clean_title(f"API {heuristic_title(history[-1].text)}")
+                n = 2
+                while self._store.exists(cid):
+                    cid, n = f"{base} ({n})", n + 1
+            self._store.create(cid)
+            turns = history + [answer]
+        for msg in turns:
+            self._store.append(cid, msg.record())
+        self._threads[self._thread_key(history + [answer])] = cid
+        self.logged.emit(cid)
+
+def install_sigint(callback) -> QTimer:
+    """Ctrl+C num app Qt sem janela: o loop do Qt segura o Python, então
+    um timer devolve a vez de tempos em tempos para o handler rodar."""
+    import signal
+    signal.signal(signal.SIGINT, lambda *_: callback())
+    tick = QTimer()
+    tick.timeout.connect(lambda: None)
+    tick.start(200)
+    return tick
+
+def serve_main(argv: list[str]) -> int:
+    """`python -m nebula_gemini serve`: só o proxy, sem janela."""
+    import argparse
+    config = load_config() or {}
+    ap = argparse.ArgumentParser(
+        prog="python -m nebula_gemini serve",
+        description="Servidor local compatível com a OpenAI (/v1/chat/completions) usando a config do app.",
+    )
+    ap.add_argument("--port", type=int, default=config.get("proxy_port") or PROXY_PORT)
+    args = ap.parse_args(argv)
+    if not config.get("api_key"):
+        print(f"Sem API key em {CONFIG_PATH}: configure pelo app antes de usar o proxy.", file=sys.stderr)
+        return 2
+
+    app     = QCoreApplication(sys.argv[:1])
+    clients = ProviderClients()
+    store   = ChatStore()
+    proxy   = ProxyServer(config, clients, store, ResponseCache(
+        max_bytes=config.get("response_cache_mb", CACHE_MAX_MB) << 20
+    ))
+    try:
+        proxy.start(args.port)
+    except OSError as e:
+        print(f"Não foi possível abrir a porta {args.port}: {e}", file=sys.stderr)
+        clients.close()
+        store.close()
+        return 1
+    proxy.logged.connect(lambda cid: print(f"↳ {cid}", file=sys.stderr))
+    print(f"Proxy em {proxy.address}  (Ctrl+C para sair)", file=sys.stderr)
+    print(f"Authorization: Bearer {proxy.token}  (\"proxy_token\" em {CONFIG_PATH})", file=sys.stderr)
+    tick = install_sigint(app.quit)
+    try:
+        app.exec()
+    finally:
+        tick.stop()
+        proxy.close()
+        store.close()
+        clients.close()
+    return 0
+
+# â”€â”€ Diagnostics â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
+LOG_DIR              = os.path.expanduser("~/.gemini_logs")
+STALL_MS             = 200     # atraso do event loop que conta como travada
+STALL_TICK_MS        = 50
+STALL_LOG_BYTES      = 1 << 20
+STALL_LOG_BACKUPS    = 3
+PROFILE_INTERACTIONS = 20
+APP_LOG_BYTES        = 1 << 20
+APP_LOG_BACKUPS      = 3
+
+def setup_logging(log_dir: str = LOG_DIR):
+    """Manda o logger "nebula" para nebula.log (rotativo): num build sem
+    console (PyInstaller --windowed) o stdout/stderr se perdem."""
+    import logging.handlers
+    if logger.handlers:
+        return
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, "nebula.log"), maxBytes=APP_LOG_BYTES,
+            backupCount=APP_LOG_BACKUPS, encoding="utf-8", delay=True,
+        )
+    except OSError:
+        return
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+class StallWatchdog(QObject):
+    """
+    Mede a latência do event loop do Qt: um QTimer na thread da GUI marca
+    batimentos e uma thread de vigia confere o último. Se a GUI passa de
+    `threshold_ms` sem bater, a pilha Python dela vai para stalls.log
+    (rotativo) enquanto ainda está presa; a duração total entra quando ela
+    volta. Desligado por padrão: --watchdog [ms] ou "stall_watchdog_ms".
+    """
+
+    def __init__(self, threshold_ms: float = STALL_MS, log_dir: str = LOG_DIR, parent=None):
+        super().__init__(parent)
+        import logging.handlers
+        self._threshold = threshold_ms / 1000
+        self._gui_ident = threading.get_ident()
+        self._beat      = time.perf_counter()
+        self._stalled   = 0.0     # início da travada em curso (0 = nenhuma)
+        self._stop      = threading.Event()
+        self.stalls: deque[float] = deque(maxlen=100)   # durações em ms
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._log = logging.getLogger("nebula.stalls")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        if not self._log.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, "stalls.log"), maxBytes=STALL_LOG_BYTES,
+                backupCount=STALL_LOG_BACKUPS, encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._log.addHandler(handler)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(STALL_TICK_MS)
+        self._timer.timeout.connect(self._tick)
+        self._thread = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+
+    def start(self):
+        self._beat = time.perf_counter()
+        self._timer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stop.set()
+
+    def _tick(self):
+        now = time.perf_counter()
+        lag = now - self._beat - STALL_TICK_MS / 1000
+        self._beat = now
+        if self._stalled:
+            self._stalled = 0.0
+            self.stalls.append(lag * 1000)
+            self._log.info("travada encerrada: %.0f ms", lag * 1000)
+        elif lag > self._threshold:
+            # Travada curta demais para a vigia ver (GIL preso em C, p.ex.)
+            self.stalls.append(lag * 1000)
+            self._log.info("travada de %.0f ms (sem pilha)", lag * 1000)
+
+    def _watch(self):
+        step = min(self._threshold / 4, STALL_TICK_MS / 1000)
+        while not self._stop.wait(step):
+            late = time.perf_counter() - self._beat - STALL_TICK_MS / 1000
+            if late > self._threshold and not self._stalled:
+                self._stalled = time.perf_counter()
+                frame = sys._current_frames().get(self._gui_ident)
+                stack = "".join(traceback.format_stack(frame)) if frame else "(pilha indisponível)\n"
+                self._log.warning("GUI sem responder há %.0f ms; pilha da thread da GUI:\n%s",
+                                  late * 1000, stack)
+
+class HotPathProfiler(QObject):
+    """
+    --profile [N]: cProfile na thread da GUI desde o startup até N
+    interações (cliques e teclas) ou o fechamento, o que vier antes.
+    Salva profile-<data>.prof (para snakeviz/pstats) e um .txt com as
+    funções mais caras em LOG_DIR.
+    """
+
+    def __init__(self, interactions: int = PROFILE_INTERACTIONS, log_dir: str = LOG_DIR):
+        super().__init__()
+        import cProfile
+        self._left    = interactions
+        self._log_dir = log_dir
+        self._prof    = cProfile.Profile()
+        self.path: str | None = None
+
+    def start(self):
+        self._prof.enable()
+
+    def install(self, app: QApplication):
+        app.installEventFilter(self)
+        app.aboutToQuit.connect(self.finish)
+
+    def eventFilter(self, obj, ev):
+        # O evento passa pela QWindow antes de chegar ao widget: conta uma vez
+        if ev.type() in (QEvent.Type.MouseButtonRelease, QEvent.Type.KeyRelease) and obj.isWindowType():
+            self._left -= 1
+            if self._left == 0:
+                QTimer.singleShot(0, self.finish)
+        return False
+
+    def finish(self):
+        if self.path:
+            return
+        import io, pstats
+        self._prof.disable()
+        QApplication.instance().removeEventFilter(self)
+        os.makedirs(self._log_dir, exist_ok=True)
+        stamp     = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(self._log_dir, f"profile-{stamp}.prof")
+        self._prof.dump_stats(self.path)
+        out = io.StringIO()
+        pstats.Stats(self._prof, stream=out).sort_stats("cumulative").print_stats(40)
+        with open(self.path[:-5] + ".txt", "w", encoding="utf-8") as fh:
+            fh.write(out.getvalue())
+        logger.info("Perfil salvo em %s", self.path)
+
 # â”€â”€ Entry point â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(batch_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(serve_main(sys.argv[2:]))
+
+    import argparse
+    ap = argparse.ArgumentParser(description="NebulaAI Desktop")
+    ap.add_argument("--profile", type=int, nargs="?", const=PROFILE_INTERACTIONS, metavar="N",
+                    help=f"cProfile do startup e das N primeiras interações (padrão {PROFILE_INTERACTIONS})")
+    ap.add_argument("--watchdog", type=float, nargs="?", const=STALL_MS, metavar="MS",
+                    help=f"registra travadas da GUI acima de MS em {LOG_DIR} (padrão {STALL_MS})")
+    ap.add_argument("--serve", type=int, nargs="?", const=PROXY_PORT, metavar="PORT",
+                    help=f"liga o proxy local compatível com a OpenAI (padrão {PROXY_PORT})")
+    args, qt_args = ap.parse_known_args()
+    setup_logging()
+
+    profiler = None
+    if args.profile:
+        profiler = HotPathProfiler(args.profile)
+        profiler.start()
+
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setFont(QFont("Segoe UI", 10))
+    if profiler:
+        profiler.install(app)
 
     config = load_config()
+    stall_ms = args.watchdog or (config or {}).get("stall_watchdog_ms")
+    if stall_ms:
+        watchdog = StallWatchdog(stall_ms, parent=app)
+        watchdog.start()
     win: GeminiWindow | None = None
 
     def start_app(cfg: dict):
         global win
         win = GeminiWindow(cfg)
+        STARTUP.mark("window")
         win.show()
+        port = args.serve or cfg.get("proxy_port")
+        if port:
+            win.start_proxy(port)
         # Se nÃ£o tem config, mostrar overlay automaticamente
         if not load_config():
             win._open_setup()
@@ -1,11 +1,10 @@
 # -*- mode: python ; coding: utf-8 -*-
-from PyInstaller.utils.hooks import collect_all
 
 datas = [('C:\\Users\\Administrator\\AppData\\Local\\Programs\\Python\\Python313\\Lib\\site-packages\\PyQt6\\Qt6\\plugins\\platforms', 'platforms')]
 binaries = []
-hiddenimports = []
-tmp_ret = collect_all('PyQt6')
-datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
+# O hook do PyQt6 já inclui só os módulos Qt usados (collect_all trazia o Qt
+# inteiro); os SDKs são importados por nome (LazyModule) e vão declarados.
+hiddenimports = ['httpx', 'google.genai', 'google.genai.errors']
 
 
 a = Analysis(
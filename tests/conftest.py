@@ -0,0 +1,13 @@
+"""Ambiente dos testes: HOME temporário e Qt sem tela.
+
+    python -m pytest tests
+"""
+import os, sys, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Antes de importar o app: CHATS_DIR, CACHE_DIR e CONFIG_PATH saem do HOME
+os.environ["HOME"] = os.environ["USERPROFILE"] = tempfile.mkdtemp(prefix="nebula-test-")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
@@ -0,0 +1,69 @@
+"""Camada fria do `ChatStore`: arquivar, abrir, voltar para JSONL, renomear e apagar."""
+import os, time
+
+import nebula_gemini as ng
+
+def _turns(cid: str, n: int = 6) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "parts": [{"text": f"{cid}: mensagem {i}"}]}
+        for i in range(n)
+    ]
+
+def _segments(root: str) -> list[str]:
+    return sorted(n for n in os.listdir(os.path.join(root, ng.ChatArchive.DIR)) if n.endswith(".bin"))
+
+def test_archive_round_trip(tmp_path):
+    root  = str(tmp_path)
+    store = ng.ChatStore(root)
+    for cid in ("velho", "vizinho"):
+        store.create(cid)
+        for msg in _turns(cid):
+            store.append(cid, msg)
+    store.close()
+    old = time.time() - 40 * 86400
+    for cid in ("velho", "vizinho"):
+        os.utime(store.path(cid), (old, old))
+
+    store = ng.ChatStore(root)
+    try:
+        assert len(store.entries()) == 2          # como na janela: a lista vem antes
+        assert store.archive_old(30) == 2
+        assert not os.path.exists(store.path("velho"))
+        assert store.load("velho") == _turns("velho")
+
+        # Escrever num chat arquivado o traz de volta para JSONL
+        extra = {"role": "user", "parts": [{"text": "de volta"}]}
+        store.append("velho", extra)
+        assert os.path.exists(store.path("velho")) and "velho" not in store.archive
+        assert store.load("velho") == _turns("velho") + [extra]
+
+        store.rename("vizinho", "renomeado")
+        assert not store.exists("vizinho") and "renomeado" in store.archive
+        assert store.load("renomeado") == _turns("vizinho")
+
+        store.delete("renomeado")
+        assert not store.exists("renomeado")
+        assert _segments(root) == []            # nenhum chat arquivado sobrou
+    finally:
+        store.close()
+
+    store = ng.ChatStore(root)
+    try:
+        assert [cid for cid, _ in store.entries()] == ["velho"]
+        assert store.load("velho") == _turns("velho") + [extra]
+    finally:
+        store.close()
+
+def test_remove_unlinks_segment_only_after_save(tmp_path):
+    root    = str(tmp_path)
+    archive = ng.ChatArchive(root)
+    archive.pack("a", _turns("a"), os.stat(__file__))
+    archive.save()
+    [seg] = _segments(root)
+
+    archive.remove("a")
+    assert _segments(root) == [seg]              # o índice em disco ainda aponta para ele
+    assert "a" in ng.ChatArchive(root)
+    archive.save()
+    assert _segments(root) == []
+    assert "a" not in ng.ChatArchive(root)
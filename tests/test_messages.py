@@ -0,0 +1,46 @@
+"""`Message`: ida e volta entre o objeto, a linha do JSONL e o formato do provedor."""
+import sys
+
+import nebula_gemini as ng
+
+def test_record_round_trip():
+    for msg in (ng.Message("user", "oi"), ng.Message("model", "resposta\ncom **markdown**", ts=1700000000),
+                ng.Message("user", "", ts=0)):
+        again = ng.Message.from_record(msg.record())
+        assert (again.role, again.text, again.ts) == (msg.role, msg.text, msg.ts)
+        assert again.record() == msg.record()
+        assert again.wire() == msg.wire()
+
+def test_wire_matches_the_stored_format():
+    rec = {"role": "model", "parts": [{"text": "sem horário"}]}     # gravado antes do "ts"
+    msg = ng.Message.from_record(rec)
+    assert msg.ts == 0
+    assert msg.wire() == rec and msg.record() == rec
+    stamped = ng.Message("user", "com horário", ts=123)
+    assert stamped.wire() == {"role": "user", "parts": [{"text": "com horário"}]}
+    assert stamped.record() == {**stamped.wire(), "ts": 123}
+
+def test_role_is_interned_and_tokens_cached():
+    msg = ng.Message("".join(["us", "er"]), "abc " * 100)
+    assert msg.role is sys.intern("user")
+    assert msg.tokens == ng.MSG_TOKENS + ng.estimate_tokens(msg.text)
+    assert msg.tokens == msg._tokens
+
+def test_request_key_ignores_timestamps():
+    a = [ng.Message("user", "pergunta", ts=1), ng.Message("model", "resposta", ts=2)]
+    b = [ng.Message.from_record(m.wire()) for m in a]
+    assert ng.request_key("OpenRouter", "m", None, a) == ng.request_key("OpenRouter", "m", None, b)
+
+def test_conversation_load(tmp_path):
+    store = ng.ChatStore(str(tmp_path))
+    try:
+        store.create("c")
+        records = [ng.Message("user", "um").record(), {"role": "model", "parts": [{"text": "dois"}]}]
+        for rec in records:
+            store.append("c", rec)
+        conv = ng.Conversation.load(store, "c")
+        assert [m.record() for m in conv] == records
+        assert conv.wire() == [{"role": r["role"], "parts": r["parts"]} for r in records]
+        assert conv.size == sum(ng.Conversation.msg_size(m) for m in conv)
+    finally:
+        store.close()
@@ -0,0 +1,35 @@
+"""Auto-nome com o cache de respostas ligado, contra o mock do OpenRouter."""
+import tempfile
+
+import nebula_gemini as ng
+from PyQt6.QtCore import QCoreApplication, QEventLoop, QTimer
+from mock_openrouter import MockOpenRouter
+
+def _name(jobs: ng.TitleJobs, cid: str, text: str, config: dict) -> str:
+    got  = []
+    loop = QEventLoop()
+    jobs.named.connect(lambda c, title: (got.append(title), loop.quit()) if c == cid else None)
+    QTimer.singleShot(int(ng.TITLE_TIMEOUT * 1000) + 2000, loop.quit)
+    jobs.submit(cid, text, config)
+    loop.exec()
+    return got[0] if got else ""
+
+def test_title_request_with_response_cache():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    with MockOpenRouter(latency=0.01, rate=0, tokens=2) as mock:
+        config = {
+            "provider": "OpenRouter", "api_key": "k", "model": "mock/model",
+            "openrouter_base": mock.url, "response_cache": True, "auto_title": "model",
+        }
+        clients = ng.ProviderClients()
+        jobs    = ng.TitleJobs(clients, ng.ResponseCache(root=tempfile.mkdtemp()))
+        try:
+            first = _name(jobs, "a", "Como configurar o Redis no Docker?", config)
+            assert mock.requests == 1               # o modelo de títulos foi chamado
+            assert first == ng.clean_title("O **teste** ")   # texto do mock, não o título local
+            again = _name(jobs, "b", "Como configurar o Redis no Docker?", config)
+            assert mock.requests == 1               # a segunda veio do cache
+            assert again == first
+        finally:
+            clients.close()
+    del app